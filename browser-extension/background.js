@@ -3,6 +3,13 @@
 
 const ALARM_POLL      = 'pollKioskManager';
 const ALARM_ROTATION  = 'playlistRotation';
+const ALARM_PRERENDER = 'playlistPrerender';
+
+const DEFAULT_PRERENDER_SECONDS = 20;
+
+// Remote scripts are stored once per content hash under `script:<key>`;
+// `scriptKeys` lists the stored keys.
+const SCRIPT_PREFIX = 'script:';
 
 // ─── Browser ID ─────────────────────────────────────────────────────────────
 
@@ -16,7 +23,7 @@ async function getBrowserId() {
 
 // ─── Kiosk Manager Polling ───────────────────────────────────────────────────
 
-async function pollKioskManager() {
+async function pollKioskManager(isRetry = false) {
   const settings = await chrome.storage.sync.get({
     kioskManagerUrl: '',
     kioskEnabled: true,
@@ -24,39 +31,52 @@ async function pollKioskManager() {
   });
 
   if (!settings.kioskManagerUrl || !settings.kioskEnabled) {
+    closePlaylistStream();
     await chrome.storage.local.set({ connectionStatus: 'disabled' });
     return;
   }
 
   const browserId = await getBrowserId();
-  const url = `${settings.kioskManagerUrl}/api/playlist/?browser_id=${browserId}`;
+  const url = `${settings.kioskManagerUrl}/api/playlist/?browser_id=${browserId}&format=2`;
+
+  // While the push stream for this URL is open the server sends changes by
+  // itself – polling is only the fallback.
+  if (streamController && streamUrl === url) return;
+
+  // Send the validator of the last response for this URL – an unchanged
+  // playlist is then answered with an empty 304.
+  const cached = await chrome.storage.local.get({ playlistEtag: null, playlistEtagUrl: null });
+  const headers = { 'Accept': 'application/json', ...(await knownScriptsHeader()) };
+  if (cached.playlistEtag && cached.playlistEtagUrl === url) {
+    headers['If-None-Match'] = cached.playlistEtag;
+  }
 
   try {
     const response = await fetch(url, {
       signal: AbortSignal.timeout(10000),
-      headers: { 'Accept': 'application/json' }
+      cache: 'no-store',
+      headers
     });
-    if (!response.ok) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
 
-    const data = await response.json();
-    const websites = (data.playlist || []).filter(i => i.type === 'website');
-
-    // Scripts now come per playlist item – merge all of them
-    const remoteScripts = websites.flatMap(item =>
-      (item.scripts || []).map(s => ({ ...s, _source: 'remote' }))
-    );
-
-    await chrome.storage.local.set({
-      lastPoll:         new Date().toISOString(),
-      connectionError:  null,
-      connectionStatus: 'ok',
-      groupName:        data.group_name || null,
-      playlist:         websites,
-      remoteScripts,
-    });
+    if (response.status === 304) {
+      await chrome.storage.local.set({
+        lastPoll:         new Date().toISOString(),
+        connectionError:  null,
+        connectionStatus: 'ok'
+      });
+      // Unchanged playlist – still (re)start rotation if it is not running
+      const state = await chrome.storage.local.get({ playlist: [] });
+      await syncPlaylist(state.playlist);
+    } else {
+      if (!response.ok) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+      if (!(await applyPlaylistData(await response.json(), response.headers.get('ETag'), url))) {
+        // Local script store was incomplete – fetch everything again
+        if (!isRetry) return pollKioskManager(true);
+        throw new Error('Playlist references unknown scripts');
+      }
+    }
 
-    // Update playlist if the content has changed
-    await syncPlaylist(websites);
+    openPlaylistStream(settings.kioskManagerUrl, browserId, url);
 
   } catch (err) {
     await chrome.storage.local.set({
@@ -68,6 +88,154 @@ async function pollKioskManager() {
   }
 }
 
+// Applies a playlist response (format 2). Returns false if it references
+// scripts that are neither in the response nor in the local store; the store
+// is then cleared, so the next request asks for all scripts.
+async function applyPlaylistData(data, etag, url) {
+  const websites = (data.playlist || []).filter(i => i.type === 'website');
+  const remoteScripts = await storeRemoteScripts(websites, data.scripts || {});
+  if (!remoteScripts) {
+    const { scriptKeys } = await chrome.storage.local.get({ scriptKeys: [] });
+    await chrome.storage.local.remove(scriptKeys.map(key => SCRIPT_PREFIX + key));
+    await chrome.storage.local.set({ scriptKeys: [], playlistEtag: null });
+    return false;
+  }
+
+  await chrome.storage.local.set({
+    lastPoll:         new Date().toISOString(),
+    connectionError:  null,
+    connectionStatus: 'ok',
+    groupName:        data.group_name || null,
+    playlist:         websites,
+    remoteScripts,
+    scriptMatcher:    data.matcher || null,
+    playlistEtag:     etag,
+    playlistEtagUrl:  url,
+  });
+
+  // Update playlist if the content has changed
+  await syncPlaylist(websites);
+  return true;
+}
+
+async function knownScriptsHeader() {
+  const { scriptKeys } = await chrome.storage.local.get({ scriptKeys: [] });
+  return scriptKeys.length ? { 'X-Kiosk-Known-Scripts': scriptKeys.join(',') } : {};
+}
+
+// Writes only scripts that are not stored yet and removes the ones no item
+// references anymore. Returns the references ({key, name, url_pattern}) in
+// playlist order – the content script loads a script's content by key when
+// its URL pattern matches – or null if a referenced script is missing.
+async function storeRemoteScripts(websites, scripts) {
+  const { scriptKeys } = await chrome.storage.local.get({ scriptKeys: [] });
+  const stored = new Set(scriptKeys);
+
+  const referenced = [...new Set(websites.flatMap(item => item.script_keys || []))];
+  if (referenced.some(key => !stored.has(key) && !scripts[key])) return null;
+
+  const added = {};
+  for (const [key, script] of Object.entries(scripts)) {
+    if (!stored.has(key) && referenced.includes(key)) added[SCRIPT_PREFIX + key] = script;
+  }
+  const unused = scriptKeys.filter(key => !referenced.includes(key));
+  if (Object.keys(added).length) await chrome.storage.local.set(added);
+  if (unused.length) await chrome.storage.local.remove(unused.map(key => SCRIPT_PREFIX + key));
+  if (Object.keys(added).length || unused.length) {
+    await chrome.storage.local.set({ scriptKeys: referenced });
+  }
+
+  const metadata = await chrome.storage.local.get(referenced.map(key => SCRIPT_PREFIX + key));
+  return referenced.map(key => {
+    const { name, url_pattern } = metadata[SCRIPT_PREFIX + key];
+    return { key, name, url_pattern, _source: 'remote' };
+  });
+}
+
+// ─── Kiosk Manager Push Stream ───────────────────────────────────────────────
+// Server-Sent Events from /api/playlist/stream/, read via fetch because
+// EventSource is not available in extension service workers. If the server
+// does not support streaming or the connection drops, the poll alarm takes
+// over and reopens the stream on its next successful poll.
+
+const STREAM_RETRY_MS = 5000;
+
+let streamController = null; // AbortController of the open stream
+let streamUrl        = null; // Poll URL the open stream belongs to
+
+function closePlaylistStream() {
+  if (streamController) streamController.abort();
+  streamController = null;
+  streamUrl = null;
+}
+
+async function openPlaylistStream(baseUrl, browserId, pollUrl) {
+  if (streamController && streamUrl === pollUrl) return;
+  closePlaylistStream();
+
+  const controller = new AbortController();
+  streamController = controller;
+  streamUrl = pollUrl;
+  let endedCleanly = false;
+
+  try {
+    const { playlistEtag } = await chrome.storage.local.get({ playlistEtag: null });
+    const headers = { 'Accept': 'text/event-stream', ...(await knownScriptsHeader()) };
+    if (playlistEtag) headers['Last-Event-ID'] = playlistEtag;
+
+    const response = await fetch(`${baseUrl}/api/playlist/stream/?browser_id=${browserId}&format=2`, {
+      signal: controller.signal,
+      cache: 'no-store',
+      headers
+    });
+    if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      let end;
+      while ((end = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, end);
+        buffer = buffer.slice(end + 2);
+        await handleStreamFrame(frame, pollUrl);
+      }
+    }
+    endedCleanly = true; // Server closed the stream after its maximum age
+  } catch (err) {
+    if (err.name !== 'AbortError') console.warn('[KioskCmd] Playlist stream dropped:', err.message);
+  } finally {
+    if (streamController === controller) {
+      streamController = null;
+      streamUrl = null;
+      if (endedCleanly) setTimeout(pollKioskManager, STREAM_RETRY_MS);
+    }
+  }
+}
+
+async function handleStreamFrame(frame, pollUrl) {
+  let event = 'message', id = null;
+  const data = [];
+  for (const line of frame.split('\n')) {
+    if (line.startsWith(':')) continue; // Keep-alive comment
+    const colon = line.indexOf(':');
+    const field = colon === -1 ? line : line.slice(0, colon);
+    const value = colon === -1 ? '' : line.slice(colon + 1).replace(/^ /, '');
+    if (field === 'event') event = value;
+    else if (field === 'id') id = value;
+    else if (field === 'data') data.push(value);
+  }
+  if (event !== 'playlist' || !data.length) return;
+
+  console.log('[KioskCmd] Playlist pushed by Kiosk Manager');
+  if (!(await applyPlaylistData(JSON.parse(data.join('\n')), id, pollUrl))) {
+    closePlaylistStream();
+    await pollKioskManager(); // Refetch with all scripts, then re-subscribe
+  }
+}
+
 // ─── Playlist Rotation ───────────────────────────────────────────────────────
 
 async function syncPlaylist(websites) {
@@ -97,6 +265,7 @@ async function startRotation(playlist, tabId) {
   if (!playlist || playlist.length === 0) return;
 
   await chrome.alarms.clear(ALARM_ROTATION);
+  await discardPrerender();
   await chrome.storage.local.set({
     playlistActive:  true,
     playlistTabId:   tabId,
@@ -109,6 +278,7 @@ async function startRotation(playlist, tabId) {
 
 async function stopRotation() {
   await chrome.alarms.clear(ALARM_ROTATION);
+  await discardPrerender();
   await chrome.storage.local.set({ playlistActive: false });
 }
 
@@ -116,6 +286,8 @@ async function navigateTo(playlist, index, tabId) {
   const item = playlist[index];
   if (!item) return;
 
+  await chrome.alarms.clear(ALARM_PRERENDER);
+
   await chrome.storage.local.set({
     currentIndex:        index,
     currentItemStart:    Date.now(),
@@ -123,7 +295,10 @@ async function navigateTo(playlist, index, tabId) {
   });
 
   try {
-    await chrome.tabs.update(tabId, { url: item.url });
+    // Swap in the tab that already loaded the item in the background, else load it here
+    if (!(await activatePrerendered(item, index, tabId))) {
+      await chrome.tabs.update(tabId, { url: item.url });
+    }
   } catch (err) {
     console.warn('[KioskCmd] Tab navigation failed:', err.message);
     await stopRotation();
@@ -135,9 +310,90 @@ async function navigateTo(playlist, index, tabId) {
     chrome.alarms.create(ALARM_ROTATION, {
       delayInMinutes: Math.max(0.1, item.duration / 60)
     });
+    const { prerenderSeconds } = await chrome.storage.sync.get({ prerenderSeconds: DEFAULT_PRERENDER_SECONDS });
+    if (prerenderSeconds > 0) {
+      chrome.alarms.create(ALARM_PRERENDER, {
+        delayInMinutes: Math.max(0.1, (item.duration - prerenderSeconds) / 60)
+      });
+    }
   }
 }
 
+// ─── Prerendering ────────────────────────────────────────────────────────────
+// The next website is opened in an inactive tab `prerenderSeconds` before the
+// rotation. It loads there and matching automation scripts (login) run there
+// via the content script; the rotation then only activates the tab and closes
+// the previous one, so heavy dashboards appear instantly.
+
+async function closeTab(tabId) {
+  try {
+    await chrome.tabs.remove(tabId);
+  } catch {
+    // Already closed
+  }
+}
+
+async function discardPrerender() {
+  await chrome.alarms.clear(ALARM_PRERENDER);
+  const { prerender } = await chrome.storage.local.get({ prerender: null });
+  if (!prerender) return;
+  await chrome.storage.local.set({ prerender: null });
+  await closeTab(prerender.tabId);
+}
+
+async function prerenderNextItem() {
+  const state = await chrome.storage.local.get({
+    playlistActive: false,
+    playlist:       [],
+    currentIndex:   0,
+    playlistTabId:  null,
+    prerender:      null
+  });
+  if (!state.playlistActive || state.playlist.length < 2 || !state.playlistTabId) return;
+
+  const index = (state.currentIndex + 1) % state.playlist.length;
+  const item = state.playlist[index];
+  if (state.prerender) {
+    if (state.prerender.index === index && state.prerender.url === item.url) return;
+    await discardPrerender();
+  }
+
+  try {
+    const current = await chrome.tabs.get(state.playlistTabId);
+    const tab = await chrome.tabs.create({
+      windowId: current.windowId,
+      index:    current.index + 1,
+      url:      item.url,
+      active:   false
+    });
+    await chrome.storage.local.set({ prerender: { tabId: tab.id, index, url: item.url } });
+    await chrome.tabs.update(tab.id, { autoDiscardable: false }).catch(() => {});
+    console.log(`[KioskCmd] Prerendering item ${index} in tab ${tab.id}:`, item.url);
+  } catch (err) {
+    console.warn('[KioskCmd] Prerendering failed:', err.message);
+  }
+}
+
+// Activates the prerendered tab if it holds the given item; returns whether it did.
+async function activatePrerendered(item, index, tabId) {
+  const { prerender } = await chrome.storage.local.get({ prerender: null });
+  if (!prerender) return false;
+  await chrome.storage.local.set({ prerender: null });
+  if (prerender.index !== index || prerender.url !== item.url || prerender.tabId === tabId) {
+    await closeTab(prerender.tabId);
+    return false;
+  }
+
+  try {
+    await chrome.tabs.update(prerender.tabId, { active: true });
+  } catch {
+    return false; // The tab was closed in the meantime
+  }
+  await chrome.storage.local.set({ playlistTabId: prerender.tabId });
+  await closeTab(tabId);
+  return true;
+}
+
 // ─── Alarm Handler ───────────────────────────────────────────────────────────
 
 chrome.alarms.onAlarm.addListener(async (alarm) => {
@@ -145,6 +401,10 @@ chrome.alarms.onAlarm.addListener(async (alarm) => {
     await pollKioskManager();
   }
 
+  if (alarm.name === ALARM_PRERENDER) {
+    await prerenderNextItem();
+  }
+
   if (alarm.name === ALARM_ROTATION) {
     const state = await chrome.storage.local.get({
       playlistActive: false,
@@ -3,12 +3,120 @@
 
 'use strict';
 
+// ─── Wait Engine ────────────────────────────────────────────────────────────
+//
+// All waits (cy.get, cy.contains, waitForUrl, waitForHidden) share one
+// MutationObserver and one set of navigation listeners instead of polling.
+// Waiters with the same key (e.g. the same selector) are resolved by a single
+// check. Nothing runs while no script is waiting.
+
+const WAIT_THROTTLE_MS  = 50;   // Coalesces bursts of DOM mutations into one check
+const WAIT_FALLBACK_MS  = 2000; // Safety net for changes no observer sees (e.g. stylesheet-driven visibility)
+
+const WaitEngine = {
+  _groups:    new Map(), // key → { check, waiters: Set }
+  _observer:  null,
+  _scheduled: null,
+  _fallback:  null,
+
+  /**
+   * Resolves with the first truthy result of `check()`, re-evaluated when the
+   * DOM or the URL changes. Rejects after `timeout` ms or when `signal` aborts.
+   */
+  waitFor(key, check, { timeout, signal, timeoutMessage }) {
+    if (signal?.aborted) return Promise.reject(abortError());
+    const result = check();
+    if (result) return Promise.resolve(result);
+
+    return new Promise((resolve, reject) => {
+      let group = this._groups.get(key);
+      if (!group) {
+        group = { check, waiters: new Set() };
+        this._groups.set(key, group);
+      }
+      const waiter = {
+        resolve,
+        reject,
+        done: () => {
+          clearTimeout(waiter.timer);
+          signal?.removeEventListener('abort', waiter.onAbort);
+          group.waiters.delete(waiter);
+          if (!group.waiters.size && this._groups.get(key) === group) this._groups.delete(key);
+          if (!this._groups.size) this._stop();
+        },
+      };
+      waiter.timer = setTimeout(() => { waiter.done(); reject(new Error(timeoutMessage)); }, timeout);
+      waiter.onAbort = () => { waiter.done(); reject(abortError()); };
+      signal?.addEventListener('abort', waiter.onAbort);
+      group.waiters.add(waiter);
+      this._start();
+    });
+  },
+
+  _start() {
+    if (this._observer) return;
+    this._observer = new MutationObserver(() => this._schedule());
+    this._observer.observe(document.documentElement || document, {
+      childList: true,
+      subtree: true,
+      characterData: true,
+      attributes: true,
+      attributeFilter: ['class', 'style', 'hidden', 'aria-hidden', 'disabled', 'value'],
+    });
+    this._fallback = setInterval(() => this._flush(), WAIT_FALLBACK_MS);
+  },
+
+  _stop() {
+    this._observer?.disconnect();
+    this._observer = null;
+    clearInterval(this._fallback);
+    clearTimeout(this._scheduled);
+    this._scheduled = null;
+  },
+
+  _schedule() {
+    if (this._scheduled || !this._groups.size) return;
+    this._scheduled = setTimeout(() => { this._scheduled = null; this._flush(); }, WAIT_THROTTLE_MS);
+  },
+
+  _flush() {
+    for (const group of [...this._groups.values()]) {
+      const result = group.check();
+      if (!result) continue;
+      for (const waiter of [...group.waiters]) {
+        waiter.done();
+        waiter.resolve(result);
+      }
+    }
+  },
+};
+
+function abortError() {
+  return new DOMException('Script cancelled', 'AbortError');
+}
+
+// Same-document navigations (SPA routing) do not reload the content script
+for (const type of ['popstate', 'hashchange']) {
+  window.addEventListener(type, () => WaitEngine._schedule());
+}
+if (window.navigation) {
+  window.navigation.addEventListener('currententrychange', () => WaitEngine._schedule());
+}
+
 // ─── CyRunner: Cypress-like API ────────────────────────────────────────────
 
+const activeRunners = new Set();
+
 class CyRunner {
   constructor() {
     this._queue = [];
     this._subject = null;
+    this._abort = new AbortController();
+  }
+
+  /** Stops the script; the pending command rejects with an AbortError */
+  cancel() {
+    this._abort.abort();
   }
 
   // Add internal command to the queue
@@ -20,9 +128,15 @@ class CyRunner {
   // Execute queue sequentially
   async _execute() {
     this._subject = null;
-    for (const cmd of this._queue) {
-      console.debug(`[KioskCmd] ▶ ${cmd.label}`);
-      await cmd.fn.call(this);
+    activeRunners.add(this);
+    try {
+      for (const cmd of this._queue) {
+        if (this._abort.signal.aborted) throw abortError();
+        console.debug(`[KioskCmd] ▶ ${cmd.label}`);
+        await cmd.fn.call(this);
+      }
+    } finally {
+      activeRunners.delete(this);
     }
   }
 
@@ -152,25 +266,30 @@ class CyRunner {
   /** Waits until the URL contains a specific pattern */
   waitForUrl(pattern, timeout = 15000) {
     return this._enqueue(`waitForUrl("${pattern}")`, async () => {
-      const start = Date.now();
-      while (Date.now() - start < timeout) {
-        if (window.location.href.includes(pattern)) return;
-        await this._wait(300);
+      try {
+        await WaitEngine.waitFor(`url:${pattern}`, () => window.location.href.includes(pattern), {
+          timeout,
+          signal: this._abort.signal,
+          timeoutMessage: `URL did not contain "${pattern}" after ${timeout}ms.`,
+        });
+      } catch (err) {
+        if (err.name !== 'AbortError') err.message += ` Current URL: ${window.location.href}`;
+        throw err;
       }
-      throw new Error(`URL did not contain "${pattern}" after ${timeout}ms. Current URL: ${window.location.href}`);
     });
   }
 
   /** Waits until an element disappears */
   waitForHidden(selector, timeout = 10000) {
     return this._enqueue(`waitForHidden("${selector}")`, async () => {
-      const start = Date.now();
-      while (Date.now() - start < timeout) {
+      await WaitEngine.waitFor(`hidden:${selector}`, () => {
         const el = document.querySelector(selector);
-        if (!el || el.offsetParent === null) return;
-        await this._wait(200);
-      }
-      throw new Error(`Element "${selector}" was not hidden after ${timeout}ms`);
+        return !el || el.offsetParent === null;
+      }, {
+        timeout,
+        signal: this._abort.signal,
+        timeoutMessage: `Element "${selector}" was not hidden after ${timeout}ms`,
+      });
     });
   }
 
@@ -227,7 +346,13 @@ class CyRunner {
   // ── Private Helper Methods ────────────────────────────────────────────────
 
   _wait(ms) {
-    return new Promise(resolve => setTimeout(resolve, ms));
+    const signal = this._abort.signal;
+    return new Promise((resolve, reject) => {
+      if (signal.aborted) return reject(abortError());
+      const onAbort = () => { clearTimeout(timer); reject(abortError()); };
+      const timer = setTimeout(() => { signal.removeEventListener('abort', onAbort); resolve(); }, ms);
+      signal.addEventListener('abort', onAbort, { once: true });
+    });
   }
 
   /** Triggers browser autofill and notifies React/Angular about the value */
@@ -274,43 +399,31 @@ class CyRunner {
   }
 
   _waitForSelector(selector, timeout = 10000) {
-    return new Promise((resolve, reject) => {
-      const start = Date.now();
-      const check = () => {
-        const el = document.querySelector(selector);
-        if (el) return resolve(el);
-        if (Date.now() - start > timeout) {
-          return reject(new Error(
-            `Selector "${selector}" not found after ${timeout}ms`
-          ));
-        }
-        setTimeout(check, 200);
-      };
-      check();
+    return WaitEngine.waitFor(`selector:${selector}`, () => document.querySelector(selector), {
+      timeout,
+      signal: this._abort.signal,
+      timeoutMessage: `Selector "${selector}" not found after ${timeout}ms`,
     });
   }
 
   _waitForText(text, timeout = 10000) {
-    return new Promise((resolve, reject) => {
-      const start = Date.now();
-      const check = () => {
-        // Search all interactive and text elements
-        const candidates = document.querySelectorAll(
-          'button, a, label, span, p, h1, h2, h3, h4, h5, li, td, th, div'
-        );
-        for (const el of candidates) {
-          // Only leaf-like elements (few children) or exact match
-          if (el.textContent.trim() === text ||
-              (el.children.length === 0 && el.textContent.includes(text))) {
-            return resolve(el);
-          }
-        }
-        if (Date.now() - start > timeout) {
-          return reject(new Error(`Element with text "${text}" not found after ${timeout}ms`));
+    return WaitEngine.waitFor(`text:${text}`, () => {
+      // Search all interactive and text elements
+      const candidates = document.querySelectorAll(
+        'button, a, label, span, p, h1, h2, h3, h4, h5, li, td, th, div'
+      );
+      for (const el of candidates) {
+        // Only leaf-like elements (few children) or exact match
+        if (el.textContent.trim() === text ||
+            (el.children.length === 0 && el.textContent.includes(text))) {
+          return el;
         }
-        setTimeout(check, 200);
-      };
-      check();
+      }
+      return null;
+    }, {
+      timeout,
+      signal: this._abort.signal,
+      timeoutMessage: `Element with text "${text}" not found after ${timeout}ms`,
     });
   }
 }
@@ -437,6 +550,45 @@ function _parseChain(stmt) {
   return calls.length > 0 ? calls : null;
 }
 
+// Parsed scripts are cached by content hash in chrome.storage.local, so a
+// script is tokenized once and not again on every navigation.
+const PARSED_SCRIPTS_MAX = 50;
+const parsedScripts = new Map(); // hash → calls, for this page
+
+/** 53-bit string hash (cyrb53); not cryptographic, only a cache key */
+function hashScript(source) {
+  let h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+  for (let i = 0; i < source.length; i++) {
+    const ch = source.charCodeAt(i);
+    h1 = Math.imul(h1 ^ ch, 2654435761);
+    h2 = Math.imul(h2 ^ ch, 1597334677);
+  }
+  h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+  h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+  return `${(4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(16)}:${source.length}`;
+}
+
+async function getParsedScript(source) {
+  const key = hashScript(source);
+  if (parsedScripts.has(key)) return parsedScripts.get(key);
+
+  let stored = {};
+  try {
+    ({ parsedScripts: stored } = await chrome.storage.local.get({ parsedScripts: {} }));
+  } catch {
+    // Storage access can fail on some pages
+  }
+  let calls = stored[key];
+  if (!calls) {
+    calls = parseScript(source);
+    // Keep the most recently added entries only
+    const entries = Object.entries(stored).filter(([k]) => k !== key).slice(-(PARSED_SCRIPTS_MAX - 1));
+    chrome.storage.local.set({ parsedScripts: Object.fromEntries([...entries, [key, calls]]) }).catch(() => {});
+  }
+  parsedScripts.set(key, calls);
+  return calls;
+}
+
 function parseScript(source) {
   const stmts = _splitStatements(_removeComments(source));
   const all = [];
@@ -453,7 +605,7 @@ window.__kioskRunScript = (content, name) => executeScript(content, name);
 
 async function executeScript(content, name) {
   console.log(`[KioskCmd] 🚀 Starting script: "${name}"`);
-  const calls = parseScript(content);
+  const calls = await getParsedScript(content);
   const cy = new CyRunner();
 
   for (const { method, args } of calls) {
@@ -486,6 +638,63 @@ async function executeScript(content, name) {
 
 // ─── Auto-Trigger: URL Pattern Detection ────────────────────────────────────
 
+// Remote scripts are stored by the background worker under `script:<key>`
+async function loadRemoteScript(key) {
+  const storageKey = 'script:' + key;
+  const data = await chrome.storage.local.get(storageKey);
+  if (!data[storageKey]) throw new Error('Remote script is no longer available');
+  return data[storageKey];
+}
+
+// Compiled regexes of the server's URL matcher (see matchers.py in the Kiosk Manager)
+const ruleRegexCache = new Map();
+
+// Returns the first rule of the matcher that matches the URL. Only the rules
+// indexed under the URL's host, its parent domains and the host-independent
+// ones are tested, so the cost does not grow with the number of scripts.
+function findMatchingRule(matcher, url) {
+  if (!matcher || !matcher.rules.length) return null;
+  let hostname;
+  try {
+    hostname = new URL(url).hostname;
+  } catch {
+    return null;
+  }
+
+  const candidates = [...(matcher.hosts[hostname] || []), ...matcher.any];
+  for (let domain = hostname; domain; domain = domain.slice(domain.indexOf('.') + 1 || domain.length)) {
+    candidates.push(...(matcher.domains[domain] || []));
+  }
+  candidates.sort((a, b) => a - b);
+
+  for (const position of candidates) {
+    const rule = matcher.rules[position];
+    let regex = ruleRegexCache.get(rule.regex);
+    if (!regex) {
+      regex = new RegExp(rule.regex);
+      ruleRegexCache.set(rule.regex, regex);
+    }
+    if (regex.test(url)) return rule;
+  }
+  return null;
+}
+
+function findLocalScript(scripts, url) {
+  for (const script of scripts) {
+    try {
+      // Convert wildcard pattern (* → .*) to RegExp
+      const regexStr = script.urlPattern
+        .replace(/[.+?^${}()|[\]\\]/g, '\\$&')
+        .replace(/\*/g, '.*');
+
+      if (new RegExp(`^${regexStr}$`).test(url) || new RegExp(regexStr).test(url)) return script;
+    } catch (err) {
+      console.warn(`[KioskCmd] Invalid URL pattern in script "${script.name}":`, err.message);
+    }
+  }
+  return null;
+}
+
 async function checkAutoTrigger() {
   const currentUrl = window.location.href;
 
@@ -494,68 +703,56 @@ async function checkAutoTrigger() {
 
   let data;
   try {
-    data = await chrome.storage.local.get({ scripts: [], remoteScripts: [] });
+    data = await chrome.storage.local.get({ scripts: [], remoteScripts: [], scriptMatcher: null });
   } catch (err) {
     // Storage access can fail on some pages
     return;
   }
 
   // Remote scripts (from Kiosk Manager) take precedence over local scripts.
-  // Local scripts with the same name are skipped if a remote script matches first.
-  const remoteScripts = (data.remoteScripts || [])
-    .filter(s => s.url_pattern)
-    .map(s => ({ name: s.name, urlPattern: s.url_pattern, content: s.content, enabled: true, _source: 'remote' }));
+  // Their URL patterns arrive precompiled in scriptMatcher; local scripts with
+  // the name of a remote script are skipped.
+  const remoteScripts = data.remoteScripts || [];
+  const remoteNames = new Set(remoteScripts.map(s => s.name));
+  let script = null;
 
-  const localScripts = (data.scripts || [])
-    .filter(s => s.enabled !== false && s.urlPattern)
-    .map(s => ({ ...s, _source: 'local' }));
+  const rule = findMatchingRule(data.scriptMatcher, currentUrl);
+  if (rule) {
+    const remote = remoteScripts.find(s => s.key === rule.script);
+    if (remote) script = { name: remote.name, key: remote.key, _source: 'remote' };
+  }
+  if (!script) {
+    const localScripts = (data.scripts || [])
+      .filter(s => s.enabled !== false && s.urlPattern && !remoteNames.has(s.name))
+      .map(s => ({ ...s, _source: 'local' }));
+    script = findLocalScript(localScripts, currentUrl);
+  }
+  if (!script) return;
 
-  // Remote first, then local – remote wins on name collision
-  const remoteNames = new Set(remoteScripts.map(s => s.name));
-  const allScripts = [
-    ...remoteScripts,
-    ...localScripts.filter(s => !remoteNames.has(s.name))
-  ];
+  const source = script._source === 'remote' ? '☁ remote' : '💾 local';
+  console.log(`[KioskCmd] 🔍 Auto-Trigger [${source}]: Script "${script.name}" for: ${currentUrl}`);
 
-  for (const script of allScripts) {
+  // Brief wait for page to finish loading, then execute
+  // (only the first matching script is executed)
+  setTimeout(async () => {
     try {
-      // Convert wildcard pattern (* → .*) to RegExp
-      const regexStr = script.urlPattern
-        .replace(/[.+?^${}()|[\]\\]/g, '\\$&')
-        .replace(/\*/g, '.*');
-
-      if (new RegExp(`^${regexStr}$`).test(currentUrl) ||
-          new RegExp(regexStr).test(currentUrl)) {
-
-        const source = script._source === 'remote' ? '☁ remote' : '💾 local';
-        console.log(`[KioskCmd] 🔍 Auto-Trigger [${source}]: Script "${script.name}" for: ${currentUrl}`);
-
-        // Brief wait for page to finish loading, then execute
-        setTimeout(async () => {
-          try {
-            await executeScript(script.content, script.name);
-            chrome.runtime.sendMessage({
-              action: 'scriptCompleted',
-              scriptName: script.name,
-              success: true
-            }).catch(() => {});
-          } catch (err) {
-            console.error(`[KioskCmd] ❌ Auto-Script "${script.name}" failed:`, err.message);
-            chrome.runtime.sendMessage({
-              action: 'scriptCompleted',
-              scriptName: script.name,
-              success: false,
-              error: err.message
-            }).catch(() => {});
-          }
-        }, 800);
-
-        break; // Always execute only the first matching script
-      }
+      const content = script.content ?? (await loadRemoteScript(script.key)).content;
+      await executeScript(content, script.name);
+      chrome.runtime.sendMessage({
+        action: 'scriptCompleted',
+        scriptName: script.name,
+        success: true
+      }).catch(() => {});
     } catch (err) {
-      console.warn(`[KioskCmd] Invalid URL pattern in script "${script.name}":`, err.message);
+      console.error(`[KioskCmd] ❌ Auto-Script "${script.name}" failed:`, err.message);
+      chrome.runtime.sendMessage({
+        action: 'scriptCompleted',
+        scriptName: script.name,
+        success: false,
+        error: err.message
+      }).catch(() => {});
     }
-  }
+  }, 800);
 }
 
 // ─── Message Handler ────────────────────────────────────────────────────────
@@ -583,6 +780,11 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
     return true; // Asynchronous response
   }
 
+  if (message.action === 'cancelScripts') {
+    for (const runner of activeRunners) runner.cancel();
+    sendResponse({ success: true, cancelled: activeRunners.size });
+  }
+
   if (message.action === 'ping') {
     sendResponse({ success: true, url: window.location.href, title: document.title });
   }
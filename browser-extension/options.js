@@ -66,13 +66,15 @@ async function loadSettings() {
   const settings = await chrome.storage.sync.get({
     kioskManagerUrl: '',
     kioskEnabled: true,
-    pollInterval: 1
+    pollInterval: 1,
+    prerenderSeconds: 20
   });
   const local = await chrome.storage.local.get({ browserId: '' });
 
   document.getElementById('kioskManagerUrl').value = settings.kioskManagerUrl;
   document.getElementById('kioskEnabled').checked = settings.kioskEnabled;
   document.getElementById('pollInterval').value = settings.pollInterval;
+  document.getElementById('prerenderSeconds').value = settings.prerenderSeconds;
   document.getElementById('browserIdDisplay').value = local.browserId || '(generated on first use)';
 }
 
@@ -91,7 +93,8 @@ async function saveSettings() {
   const settings = {
     kioskManagerUrl: document.getElementById('kioskManagerUrl').value.trim().replace(/\/$/, ''),
     kioskEnabled: document.getElementById('kioskEnabled').checked,
-    pollInterval: Math.max(1, parseInt(document.getElementById('pollInterval').value) || 1)
+    pollInterval: Math.max(1, parseInt(document.getElementById('pollInterval').value) || 1),
+    prerenderSeconds: Math.max(0, parseInt(document.getElementById('prerenderSeconds').value) || 0)
   };
 
   await chrome.storage.sync.set(settings);
@@ -165,11 +165,15 @@ async function loadScripts() {
 
   const data = await chrome.storage.local.get({ scripts: [], remoteScripts: [] });
 
+  // remoteScripts only references the stored scripts (`script:<key>`)
+  const stored = await chrome.storage.local.get(
+    (data.remoteScripts || []).filter(s => s.key).map(s => 'script:' + s.key)
+  );
   const remoteScripts = (data.remoteScripts || []).map(s => ({
     id: '_remote_' + s.name,
     name: s.name,
     urlPattern: s.url_pattern || '',
-    content: s.content,
+    content: s.content ?? stored['script:' + s.key]?.content ?? '',
     enabled: true,
     _source: 'remote'
   }));
@@ -0,0 +1,22 @@
+"""gunicorn settings, picked up automatically from the working directory.
+
+Prepares the Prometheus multiprocess directory (see kioskmanager/metrics.py):
+samples of previous runs are removed on start-up, and the live gauges of a
+worker that exits are dropped.
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
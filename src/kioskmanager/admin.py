@@ -1,7 +1,22 @@
 # kioskmanager/admin.py
+import json
+
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.models import Group as AuthGroup
-from .models import Browser, DisplayGroup, ContentItem, PlaylistEntry, AutomationScript
+from django import forms
+from django.core.exceptions import PermissionDenied
+from django.forms.models import BaseInlineFormSet
+from django.http import Http404, JsonResponse
+from django.template.defaultfilters import pluralize
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.views.decorators.http import require_POST
+from .models import Browser, DisplayGroup, ContentItem, PlaylistEntry, AutomationScript, UploadSession, VideoRendition
+from .playlist import reorder_playlist
+from .signals import content_item_saved
 from unfold.admin import ModelAdmin, TabularInline
 
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
@@ -42,6 +57,17 @@ def _can_manage_scripts(user):
     return user.is_superuser or user.has_perm('kioskmanager.manage_automation_scripts')
 
 
+def _managed_group_ids(request):
+    """Return the IDs of the DisplayGroups the user manages.
+
+    Loaded once per request: the admin checks permissions many times while
+    rendering a single page (once per object on the changelist).
+    """
+    if not hasattr(request, '_managed_group_ids'):
+        request._managed_group_ids = set(request.user.managed_display_groups.values_list('pk', flat=True))
+    return request._managed_group_ids
+
+
 # ─── Browser ─────────────────────────────────────────────────────────────────
 
 @admin.register(Browser)
@@ -51,6 +77,8 @@ class BrowserAdmin(ModelAdmin):
     search_fields = ('identifier', 'name')
     readonly_fields = ('identifier', 'last_seen')  # identifier is generated by the frontend
     autocomplete_fields = ['group']
+    list_select_related = ('group',)
+    show_full_result_count = False  # Saves a COUNT(*) over all browsers on filtered lists
 
     # Browsers register themselves automatically; manual creation is rarely needed.
     def has_add_permission(self, request):
@@ -62,14 +90,63 @@ class BrowserAdmin(ModelAdmin):
 
 # ─── Inlines ─────────────────────────────────────────────────────────────────
 
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """AutocompleteSelect that takes the selected option from preloaded objects.
+
+    The stock widget looks up the label of the selected object with one
+    query per rendered form, i.e. one query per inline row.
+    """
+    preloaded = None  # str(pk) -> instance, set by the formset
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        if not self.preloaded or any(pk not in self.preloaded for pk in selected):
+            return super().optgroups(name, value, attr)
+
+        default = (None, [], 0)
+        if not self.is_required and not self.allow_multiple_selected:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        for pk in selected:
+            obj = self.preloaded[pk]
+            label = self.choices.field.label_from_instance(obj)
+            default[1].append(self.create_option(name, obj.pk, label, set(selected), len(default[1])))
+        return [default]
+
+
+class PlaylistEntryFormSet(BaseInlineFormSet):
+    """Hands the content items loaded with the entries to the autocomplete widgets."""
+
+    @cached_property
+    def content_items(self):
+        return {str(entry.content_item_id): entry.content_item for entry in self.get_queryset()}
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        widget = form.fields['content_item'].widget
+        widget = getattr(widget, 'widget', widget)  # Unwrap RelatedFieldWidgetWrapper
+        if isinstance(widget, PreloadedAutocompleteSelect):
+            widget.preloaded = self.content_items
+        return form
+
+
 class PlaylistEntryInline(TabularInline):
     model = PlaylistEntry
+    formset = PlaylistEntryFormSet
     extra = 1
     autocomplete_fields = ['content_item']
     fields = ('order', 'content_item')
     ordering = ('order',)
     fk_name = "group"
 
+    def get_queryset(self, request):
+        # PlaylistEntry.__str__ (shown for every row) uses the group and the content item
+        return super().get_queryset(request).select_related('group', 'content_item')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'content_item':
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 class AutomationScriptInline(TabularInline):
     """Inline that shows which scripts are linked to a ContentItem (read-only).
@@ -95,15 +172,15 @@ class AutomationScriptInline(TabularInline):
         return _can_manage_scripts(request.user)
 
 
-class BrowserInline(TabularInline):
-    """Read-only list of browsers assigned to a DisplayGroup."""
-    model = Browser
+class VideoRenditionInline(TabularInline):
+    """Read-only transcoding status of a video (see ``transcode.py``)."""
+    model = VideoRendition
     extra = 0
     can_delete = False
-    readonly_fields = ('identifier', 'name', 'last_seen')
-    fields = ('identifier', 'name', 'last_seen')
-    verbose_name = "Assigned Browser"
-    verbose_name_plural = "Assigned Browsers"
+    fields = ('name', 'status', 'width', 'height', 'bitrate', 'file', 'error')
+    readonly_fields = fields
+    verbose_name = "Rendition"
+    verbose_name_plural = "Renditions (transcoded in the background)"
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -118,8 +195,20 @@ class BrowserInline(TabularInline):
 class DisplayGroupAdmin(ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
-    inlines = [PlaylistEntryInline, BrowserInline]
+    inlines = [PlaylistEntryInline]
     filter_horizontal = ('managers',)
+    readonly_fields = ('assigned_browsers',)
+
+    class Media:
+        css = {'all': ('admin/css/playlist_reorder.css',)}
+        js = ('admin/js/playlist_reorder.js',)
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('<path:object_id>/reorder/', self.admin_site.admin_view(self.reorder_view),
+                 name='%s_%s_reorder' % info),
+        ] + super().get_urls()
 
     def get_queryset(self, request):
         """Limit list view to groups the user manages (superusers see all)."""
@@ -128,19 +217,33 @@ class DisplayGroupAdmin(ModelAdmin):
             return qs
         return qs.filter(managers=request.user)
 
+    @admin.display(description="Assigned Browsers")
+    def assigned_browsers(self, obj):
+        """Number of browsers in the group, linked to the filtered Browser list.
+
+        A group can hold thousands of browsers, too many to list inline.
+        """
+        if obj.pk is None:
+            return "-"
+        if not hasattr(obj, '_browser_count'):
+            obj._browser_count = obj.browsers.count()  # The admin renders the field several times
+        count = obj._browser_count
+        url = f"{reverse('admin:kioskmanager_browser_changelist')}?group__id__exact={obj.pk}"
+        return format_html('<a href="{}">{} browser{}</a>', url, count, pluralize(count))
+
     def has_view_or_change_permission(self, request, obj=None):
         """Grant access only to superusers or managers of the specific group."""
         if request.user.is_superuser:
             return True
         if obj is not None:
-            return obj.managers.filter(pk=request.user.pk).exists()
+            return obj.pk in _managed_group_ids(request)
         return self.has_module_permission(request)
 
     def has_delete_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
         if obj is not None:
-            return obj.managers.filter(pk=request.user.pk).exists()
+            return obj.pk in _managed_group_ids(request)
         return False
 
     def has_add_permission(self, request):
@@ -152,14 +255,62 @@ class DisplayGroupAdmin(ModelAdmin):
     def save_formset(self, request, form, formset, change):
         """Verify the user has change permission on the parent group before saving."""
         group_instance = form.instance
+        # The managers of the group may just have been changed by this request
+        request.__dict__.pop('_managed_group_ids', None)
         if not self.has_view_or_change_permission(request, group_instance):
-            from django.core.exceptions import PermissionDenied
             raise PermissionDenied("You do not have permission to modify this group's playlist.")
         super().save_formset(request, form, formset, change)
 
+    @method_decorator(require_POST)
+    def reorder_view(self, request, object_id):
+        """Apply a new playlist order submitted by drag and drop (``playlist_reorder.js``).
+
+        Expects ``{"entries": [<PlaylistEntry id>, ...]}`` listing every entry
+        of the group in the new order and saves it in a single transaction.
+        """
+        group = self.get_object(request, object_id)
+        if group is None:
+            raise Http404
+        if not (self.has_change_permission(request, group) and self.has_view_or_change_permission(request, group)):
+            raise PermissionDenied("You do not have permission to modify this group's playlist.")
+        try:
+            entry_ids = [int(pk) for pk in json.loads(request.body)['entries']]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': "Expected {\"entries\": [<entry id>, ...]}."}, status=400)
+        try:
+            entries = reorder_playlist(group, entry_ids)
+        except ValueError as e:
+            # The playlist was changed in the meantime, e.g. in another tab
+            return JsonResponse({'error': str(e)}, status=409)
+        return JsonResponse({'entries': [{'id': pk, 'order': order} for pk, order in entries]})
+
 
 # ─── ContentItem ─────────────────────────────────────────────────────────────
 
+class ContentItemAdminForm(forms.ModelForm):
+    """ContentItem form that also accepts a video uploaded in chunks.
+
+    ``chunked_upload.js`` uploads the selected file through ``/api/uploads/``
+    and submits only the id of the completed upload session.
+    """
+    uploaded_video = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    current_user = None  # Set by ContentItemAdmin.get_form
+
+    class Meta:
+        model = ContentItem
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('uploaded_video')
+        if upload_id:
+            session = UploadSession.objects.filter(pk=upload_id, user=self.current_user).first()
+            if session is None or not session.complete:
+                raise forms.ValidationError({'video_file': "The uploaded video was not found. Please upload it again."})
+            cleaned_data['video_file'] = session.file_name
+        return cleaned_data
+
+
 @admin.register(ContentItem)
 class ContentItemAdmin(ModelAdmin):
     """Admin view for content items (videos and websites).
@@ -168,7 +319,8 @@ class ContentItemAdmin(ModelAdmin):
     ``manage_automation_scripts`` permission, so regular content managers
     cannot see or edit scripts.
     """
-    inlines = [AutomationScriptInline]
+    form = ContentItemAdminForm
+    inlines = [AutomationScriptInline, VideoRenditionInline]
     list_display = ('title', 'content_type', 'uploaded_at')
     list_filter = ('content_type',)
     search_fields = ('title', 'url')
@@ -178,7 +330,7 @@ class ContentItemAdmin(ModelAdmin):
         }),
         ('Video Details (Type: Video)', {
             'classes': ('content-type-section', 'content-type-video'),
-            'fields': ('video_file',),
+            'fields': ('video_file', 'uploaded_video'),
         }),
         ('Website Details (Type: Website)', {
             'classes': ('content-type-section', 'content-type-website'),
@@ -188,11 +340,31 @@ class ContentItemAdmin(ModelAdmin):
 
     class Media:
         css = {'all': ('admin/css/content_item_admin.css',)}
-        js = ('admin/js/content_item_admin.js',)
+        js = ('admin/js/content_item_admin.js', 'admin/js/chunked_upload.js')
 
     def get_queryset(self, request):
         return super().get_queryset(request)
 
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.current_user = request.user
+        return form
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if form.cleaned_data.get('uploaded_video'):
+            # The ContentItem owns the file now
+            UploadSession.objects.filter(pk=form.cleaned_data['uploaded_video']).delete()
+
+    def save_related(self, request, form, formsets, change):
+        """Invalidate cached playlists after the script inline was saved.
+
+        The inline edits the auto-created M2M through model, which sends no
+        model signals of its own.
+        """
+        super().save_related(request, form, formsets, change)
+        content_item_saved(sender=ContentItem, instance=form.instance)
+
     def has_change_permission(self, request, obj=None):
         return super().has_change_permission(request, obj)
 
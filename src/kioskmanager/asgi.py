@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import reverse
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kioskmanager.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from kioskmanager.stream import CancelOnDisconnect  # noqa: E402 (needs the app registry)
+
+# Unsubscribe playlist streams as soon as the kiosk disconnects
+application = CancelOnDisconnect(django_application, reverse('playlist_stream_api'))
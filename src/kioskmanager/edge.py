@@ -0,0 +1,91 @@
+"""Sync endpoint for site-local edge relays.
+
+An edge relay (``python manage.py kiosk_edge``, see ``edge_relay.py``) runs
+on a box at a branch site and answers the playlist API and serves the videos
+for the kiosks there.  Instead of one poll per screen, the server sees one
+sync per site every few seconds::
+
+    POST /api/edge/sync/
+    Authorization: Bearer <EDGE_TOKEN>
+
+    {"browsers": ["<browser uuid>", ...], "groups": {"<group id>": "<version>", ...}}
+
+``browsers`` are the browsers that polled the relay since its last sync;
+unknown ones are registered, known ones get a heartbeat.  ``groups`` are the
+playlist versions the relay holds.  The response maps the browsers to their
+groups and contains the snapshot of each of these groups whose version
+differs, in payload format 2 with all scripts::
+
+    {"browsers": {"<browser uuid>": <group id or null>, ...},
+     "groups": {"<group id>": {"version": ..., "group_name": ..., "show_status": ...,
+                               "playlist": [...], "scripts": {...}, "matcher": {...}}
+                            | {"version": ...}  # unchanged
+                            | null,             # deleted
+                ...}}
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound, JsonResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .heartbeat import heartbeats
+from .models import Browser
+from .playlist import get_group_version, get_playlist_snapshot, playlist_payload
+from .routers import replica_reads
+from .views import _register_browser
+
+MAX_BROWSERS = 5000  # Per sync
+
+
+@csrf_exempt
+@require_POST
+@replica_reads()
+def edge_sync_view(request):
+    if not settings.EDGE_TOKEN:
+        return HttpResponseNotFound()
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.EDGE_TOKEN}'):
+        return HttpResponseForbidden()
+
+    try:
+        body = json.loads(request.body)
+        browser_ids = {uuid.UUID(browser_id) for browser_id in body.get('browsers', [])}
+        held = {str(group_id): version for group_id, version in body.get('groups', {}).items()}
+    except (ValueError, TypeError, AttributeError):
+        return HttpResponseBadRequest("Invalid sync request.")
+    if len(browser_ids) > MAX_BROWSERS:
+        return HttpResponseBadRequest(f"At most {MAX_BROWSERS} browsers per sync.")
+
+    browser_groups = dict(Browser.objects.filter(identifier__in=browser_ids).values_list('identifier', 'group_id'))
+    now = timezone.now()
+    for browser_id in browser_ids:
+        if browser_id in browser_groups:
+            heartbeats.record(browser_id, now)
+        else:
+            browser_groups[browser_id] = _register_browser(browser_id).group_id
+
+    groups = {}
+    for group_id in {group_id for group_id in browser_groups.values() if group_id}:
+        version = get_group_version(group_id)
+        if held.get(str(group_id)) == version:
+            groups[str(group_id)] = {'version': version}
+            continue
+        snapshot = get_playlist_snapshot(group_id, request)
+        if snapshot is None:
+            groups[str(group_id)] = None
+            continue
+        groups[str(group_id)] = {
+            'version': snapshot['version'],
+            'group_name': snapshot['group_name'],
+            'show_status': snapshot['show_status'],
+            **playlist_payload(snapshot, payload_format=2),
+        }
+
+    return JsonResponse({
+        'browsers': {str(browser_id): group_id for browser_id, group_id in browser_groups.items()},
+        'groups': groups,
+    })
@@ -0,0 +1,405 @@
+"""Site-local edge relay for the playlist API and the videos.
+
+Runs on a box at a branch site (``python manage.py kiosk_edge``, which
+starts gunicorn with ``edge_wsgi.py`` and ``edge_settings.py``), which the
+kiosks there use as their Kiosk Manager server.  This module is the relay's
+URLconf; the relay needs no database.
+
+* ``/api/playlist/`` is answered from the snapshots of the site's groups,
+  with the same payload formats and ETags as the server.  The relay syncs
+  with the server's ``/api/edge/sync/`` every few seconds, one request for
+  all kiosks of the site (see ``edge.py``).  A browser the relay does not
+  know yet triggers an immediate sync, shared by all polls waiting for it.
+  While the server is unreachable, known browsers get the last playlist.
+* The videos and renditions referenced by the snapshots are mirrored into
+  ``<cache dir>/content/``: after a sync, the manifest of referenced files
+  (URL path, sha256, size) is diffed against the mirrored one; new files are
+  downloaded, resuming partial downloads and verified against their sha256
+  or size, and files no longer referenced are deleted.  Payloads point at
+  the relay for mirrored files and at the server until then.  HLS ladders
+  are not mirrored; the relay leaves them out, so players use the MP4
+  renditions.
+* Every other GET (the player page, static files) is passed through to the
+  server.  ``/api/playlist/stream/`` answers 501, so kiosks keep polling.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote, unquote, urlsplit
+
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import path, re_path
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+
+from . import health, media
+from .models import Browser
+from .views import _not_modified, _parse_browser_id, _parse_payload_format, _playlist_response, playlist_etag
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'state.json'
+MANIFEST_FILE = 'manifest.json'
+DOWNLOAD_BLOCK = 256 * 1024
+MIRROR_RETRY_INTERVAL = 60  # Seconds until failed downloads are retried
+WAIT_FOR_SYNC = 10  # Seconds the first poll of a browser waits for its registration
+# Passed on to the server by the proxy, in both directions
+PROXY_REQUEST_HEADERS = ('Accept', 'Accept-Language', 'If-Modified-Since', 'If-None-Match', 'If-Range', 'Range',
+                         'User-Agent')
+PROXY_RESPONSE_HEADERS = ('Accept-Ranges', 'Cache-Control', 'Content-Length', 'Content-Range',
+                          'Cross-Origin-Opener-Policy', 'ETag', 'Last-Modified', 'Vary', 'X-Frame-Options')
+
+
+def _read_json(file_name, default):
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except ValueError as e:
+        logger.warning("Ignoring unreadable %s: %s", file_name, e)
+        return default
+
+
+def _write_json(file_name, data):
+    with open(f'{file_name}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{file_name}.tmp', file_name)
+
+
+class MediaMirror:
+    """Keeps ``<cache dir>/content/`` in sync with the files the snapshots reference."""
+
+    def __init__(self, cache_dir, upstream, timeout):
+        self.root = os.path.abspath(cache_dir)
+        self.upstream = upstream
+        self.netloc = urlsplit(upstream).netloc
+        self.timeout = timeout
+        self.manifest_file = os.path.join(self.root, MANIFEST_FILE)
+        self.files = _read_json(self.manifest_file, {})  # Mirrored: URL path -> {'sha256', 'size'}
+        self._wanted = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+    def url_path(self, url):
+        """Path of ``url`` if it is a file of the server that can be mirrored, else None."""
+        parts = urlsplit(url or '')
+        if parts.netloc != self.netloc or not parts.path.startswith('/content/'):
+            return None
+        return unquote(parts.path)
+
+    def manifest(self, snapshots):
+        """Return ``{URL path: {'sha256', 'size'}}`` of the files referenced by ``snapshots``."""
+        files = {}
+        for snapshot in snapshots:
+            for item in snapshot['playlist']:
+                if item.get('type') != 'video':
+                    continue
+                url_path = self.url_path(item.get('url'))
+                if url_path:
+                    files[url_path] = {'sha256': item.get('sha256'), 'size': item.get('size')}
+                for rendition in item.get('renditions', []):
+                    url_path = self.url_path(rendition['url'])
+                    if url_path:
+                        files.setdefault(url_path, {'sha256': None, 'size': None})
+        return files
+
+    def want(self, snapshots):
+        with self._lock:
+            self._wanted = self.manifest(snapshots)
+        self._changed.set()
+
+    def start(self):
+        threading.Thread(target=self._run, name='edge-mirror', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._changed.wait(MIRROR_RETRY_INTERVAL)
+            self._changed.clear()
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Mirroring the media failed.")
+
+    def local_file(self, url_path):
+        file_name = os.path.normpath(os.path.join(self.root, url_path.lstrip('/')))
+        if not file_name.startswith(os.path.join(self.root, 'content') + os.sep):
+            raise ValueError(f"Refusing to mirror {url_path!r} outside the cache directory.")
+        return file_name
+
+    def update(self):
+        """Apply the difference between the wanted and the mirrored manifest."""
+        with self._lock:
+            wanted = dict(self._wanted)
+
+        for url_path in [p for p in self.files if p not in wanted]:
+            try:
+                os.remove(self.local_file(url_path))
+            except (FileNotFoundError, ValueError):
+                pass
+            del self.files[url_path]
+            _write_json(self.manifest_file, self.files)
+            logger.info("Removed %s, it is no longer in any playlist.", url_path)
+
+        for url_path, entry in wanted.items():
+            if self.files.get(url_path) == entry:
+                continue
+            try:
+                self._download(url_path, entry)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not mirror %s (retrying later): %s", url_path, e)
+                continue
+            self.files[url_path] = entry
+            _write_json(self.manifest_file, self.files)
+            logger.info("Mirrored %s.", url_path)
+
+    def _download(self, url_path, entry):
+        file_name = self.local_file(url_path)
+        part = f'{file_name}.part'
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        # Resume the download an earlier attempt left behind
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request = urllib.request.Request(self.upstream + quote(url_path))
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if response.status != 206:
+                    offset = 0  # The server sent the whole file
+                with open(part, 'ab' if offset else 'wb') as f:
+                    shutil.copyfileobj(response, f, DOWNLOAD_BLOCK)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # The part is complete already
+
+        if entry['size'] is not None and os.path.getsize(part) != entry['size']:
+            os.remove(part)
+            raise ValueError(f"expected {entry['size']} bytes")
+        if entry['sha256']:
+            sha256 = hashlib.sha256()
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(DOWNLOAD_BLOCK), b''):
+                    sha256.update(block)
+            if sha256.hexdigest() != entry['sha256']:
+                os.remove(part)
+                raise ValueError("sha256 mismatch")
+        os.replace(part, file_name)
+
+    def localize(self, snapshot, base):
+        """Return ``snapshot`` with the URLs of mirrored files pointing at ``base``.
+
+        The version (and so the ETag) gets a suffix naming the mirrored files,
+        so kiosks fetch the playlist again when another file of it is mirrored.
+        """
+        mirrored = set()
+
+        def local(url):
+            url_path = self.url_path(url)
+            if url_path not in self.files:
+                return url
+            mirrored.add(url_path)
+            return base + quote(url_path)
+
+        playlist = []
+        for item in snapshot['playlist']:
+            if item.get('type') == 'video':
+                item = {key: value for key, value in item.items() if key != 'hls'}
+                item['url'] = local(item.get('url'))
+                item['renditions'] = [{**r, 'url': local(r['url'])} for r in item.get('renditions', [])]
+            playlist.append(item)
+        version = snapshot['version']
+        if mirrored:
+            digest = hashlib.sha256('\n'.join([base, *sorted(mirrored)]).encode()).hexdigest()
+            version = f'{version}-m{digest[:10]}'
+        return {**snapshot, 'version': version, 'playlist': playlist}
+
+
+class EdgeRelay:
+    """Browser assignments and group snapshots of the site, synced with the server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._sync_now = threading.Event()
+        self.browsers = {}   # Browser UUID -> group id (None: no group)
+        self.snapshots = {}  # Group id -> snapshot
+        self.seen = set()    # Browsers that polled since the last sync
+        self.syncs = 0       # Sync attempts, successful or not
+        self.syncing = False
+        self.mirror = None
+
+    def configure(self, upstream, token, cache_dir, interval=5, timeout=30):
+        self.upstream = upstream.rstrip('/')
+        self.token = token
+        self.interval = interval
+        self.timeout = timeout
+        self.state_file = os.path.join(cache_dir, STATE_FILE)
+        # Serve the last known playlists even if the server is unreachable at startup
+        state = _read_json(self.state_file, {})
+        self.browsers = state.get('browsers', {})
+        self.snapshots = state.get('snapshots', {})
+        self.mirror = MediaMirror(cache_dir, self.upstream, timeout)
+        self.mirror.want(self.snapshots.values())
+
+    def start(self):
+        threading.Thread(target=self._run, name='edge-sync', daemon=True).start()
+        self.mirror.start()
+
+    def _run(self):
+        while True:
+            self._sync_now.wait(self.interval)
+            self._sync_now.clear()
+            self.sync()
+
+    def sync(self):
+        """Sync with the server once; return True on success."""
+        with self._lock:
+            self.syncing = True
+            sent = set(self.seen)
+            held = {group_id: snapshot['version'] for group_id, snapshot in self.snapshots.items()}
+        data = None
+        try:
+            request = urllib.request.Request(
+                f'{self.upstream}/api/edge/sync/',
+                data=json.dumps({'browsers': sorted(sent), 'groups': held}).encode(),
+                headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'},
+            )
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.load(response)
+        except (OSError, ValueError) as e:
+            logger.warning("Sync with %s failed, serving the last known playlists: %s", self.upstream, e)
+
+        with self._lock:
+            changed = data is not None and self._apply(data, sent)
+            if changed:
+                state = {'browsers': dict(self.browsers), 'snapshots': dict(self.snapshots)}
+            self.syncs += 1
+            self.syncing = False
+            self._synced.notify_all()
+        if changed:
+            _write_json(self.state_file, state)
+            self.mirror.want(state['snapshots'].values())
+        return data is not None
+
+    def _apply(self, data, sent):
+        self.seen -= sent
+        browsers = {**self.browsers, **data['browsers']}
+        snapshots = dict(self.snapshots)
+        for group_id, entry in data['groups'].items():
+            if entry is None:
+                snapshots.pop(group_id, None)
+            elif 'playlist' in entry:
+                snapshots[group_id] = entry
+        # Groups without browsers at this site anymore
+        referenced = {str(group_id) for group_id in browsers.values() if group_id}
+        snapshots = {group_id: s for group_id, s in snapshots.items() if group_id in referenced}
+        changed = browsers != self.browsers or snapshots != self.snapshots
+        self.browsers, self.snapshots = browsers, snapshots
+        return changed
+
+    def group_of(self, browser_uuid):
+        """Return ``(known, group id)`` of a browser, waiting for a sync if it is new."""
+        key = str(browser_uuid)
+        with self._lock:
+            self.seen.add(key)
+            if key not in self.browsers:
+                # A running sync may have been sent before this browser was added
+                target = self.syncs + (2 if self.syncing else 1)
+                self._sync_now.set()
+                self._synced.wait_for(lambda: key in self.browsers or self.syncs >= target, WAIT_FOR_SYNC)
+            if key not in self.browsers:
+                return False, None
+            return True, self.browsers[key]
+
+    def snapshot(self, group_id, base):
+        """Return the snapshot of a group for a request against ``base`` (None if unknown)."""
+        with self._lock:
+            snapshot = self.snapshots.get(str(group_id))
+        return self.mirror.localize(snapshot, base.rstrip('/')) if snapshot else None
+
+
+relay = EdgeRelay()
+
+
+def _unreachable(status):
+    response = HttpResponse("The Kiosk Manager server is unreachable.", status=status)
+    response['Retry-After'] = '30'
+    return response
+
+
+@require_safe
+def playlist_api(request):
+    browser_uuid, error = _parse_browser_id(request)
+    if error:
+        return error
+
+    payload_format, known_scripts, error = _parse_payload_format(request)
+    if error:
+        return error
+
+    known, group_id = relay.group_of(browser_uuid)
+    if not known:
+        return _unreachable(503)
+    snapshot = relay.snapshot(group_id, request.build_absolute_uri('/')) if group_id else None
+    browser = Browser(identifier=browser_uuid, group_id=group_id if snapshot else None)
+
+    etag = playlist_etag(browser.group_id, snapshot and snapshot['version'], payload_format)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return _not_modified(etag)
+    return _playlist_response(browser, snapshot, payload_format, known_scripts)
+
+
+def playlist_stream(request):
+    return HttpResponse("The edge relay does not stream; keep polling.", status=501)
+
+
+@require_safe
+def content(request, path):
+    url_path = f'/content/{path}'
+    if url_path not in relay.mirror.files:
+        # Not (yet) mirrored
+        return HttpResponseRedirect(relay.upstream + quote(url_path))
+    return media.serve_media(request, path)  # MEDIA_ROOT is the cache directory
+
+
+def _stream(response):
+    try:
+        yield from iter(lambda: response.read(DOWNLOAD_BLOCK), b'')
+    finally:
+        response.close()
+
+
+@require_safe
+def proxy(request, path):
+    upstream_request = urllib.request.Request(
+        relay.upstream + request.get_full_path(), method=request.method,
+        headers={header: request.headers[header] for header in PROXY_REQUEST_HEADERS if header in request.headers},
+    )
+    try:
+        upstream = urllib.request.urlopen(upstream_request, timeout=relay.timeout)
+    except urllib.error.HTTPError as e:
+        upstream = e  # Error responses (and 304) are passed on as well
+    except OSError:
+        return _unreachable(502)
+
+    response = StreamingHttpResponse(_stream(upstream), status=upstream.getcode(),
+                                     content_type=upstream.headers.get('Content-Type'))
+    for header in PROXY_RESPONSE_HEADERS:
+        if header in upstream.headers:
+            response[header] = upstream.headers[header]
+    return response
+
+
+urlpatterns = [
+    path('api/playlist/', playlist_api),
+    path('api/playlist/stream/', playlist_stream),
+    path('content/<path:path>', content),
+    path('livez/', health.livez),
+    re_path(r'^(?P<path>.*)$', proxy),
+]
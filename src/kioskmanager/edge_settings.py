@@ -0,0 +1,23 @@
+"""Settings of the site-local edge relay (see ``edge_relay.py`` and ``edge_wsgi.py``).
+
+The relay serves its own URLconf and the mirrored videos from its cache
+directory.  It has no database and provisions nothing.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'kioskmanager.edge_relay'
+DATABASES = {}
+KIOSK_PROVISION_ON_STARTUP = False
+METRICS_ENABLED = False
+
+# Base URL of the Kiosk Manager server; EDGE_TOKEN must match the server's
+EDGE_UPSTREAM = os.environ.get('EDGE_UPSTREAM', '')
+# Mirrored videos (below content/) and the last known playlists
+EDGE_CACHE_DIR = os.path.abspath(os.environ.get('EDGE_CACHE_DIR', 'edge-cache'))
+EDGE_SYNC_INTERVAL = float(os.environ.get('EDGE_SYNC_INTERVAL', '5'))  # Seconds between syncs
+EDGE_TIMEOUT = float(os.environ.get('EDGE_TIMEOUT', '30'))  # Seconds per request to the server
+
+MEDIA_ROOT = EDGE_CACHE_DIR
+MEDIA_SERVE_MODE = 'django'
@@ -0,0 +1,31 @@
+"""
+WSGI entry point of the site-local edge relay (see ``edge_relay.py``).
+
+Run it with gunicorn and exactly one worker process, which owns the cache
+directory and runs the sync and mirror threads; its threads answer the
+kiosks (the first poll of an unknown browser waits for a sync)::
+
+    EDGE_UPSTREAM=https://kiosk.example.com EDGE_TOKEN=<token> EDGE_CACHE_DIR=/var/cache/kiosk-edge \\
+        gunicorn --workers 1 --threads 32 --bind :8080 kioskmanager.edge_wsgi
+
+``python manage.py kiosk_edge`` starts it the same way.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kioskmanager.edge_settings')
+
+application = get_wsgi_application()
+
+from kioskmanager.edge_relay import relay  # noqa: E402
+
+if not settings.EDGE_UPSTREAM or not settings.EDGE_TOKEN:
+    raise ImproperlyConfigured("Set EDGE_UPSTREAM to the server's URL and EDGE_TOKEN to its EDGE_TOKEN.")
+os.makedirs(os.path.join(settings.EDGE_CACHE_DIR, 'content'), exist_ok=True)
+relay.configure(settings.EDGE_UPSTREAM, settings.EDGE_TOKEN, settings.EDGE_CACHE_DIR,
+                settings.EDGE_SYNC_INTERVAL, settings.EDGE_TIMEOUT)
+relay.start()
@@ -0,0 +1,71 @@
+"""Liveness and readiness probes.
+
+``/healthz/`` runs every django-health-check plugin on each request,
+including the migrations check that loads the migration graph.  Probes hit
+the pods every few seconds, so they get cheaper endpoints:
+
+* ``/livez/`` answers from the process alone, without touching the database:
+  if it responds, the worker is alive.
+* ``/readyz/`` runs the health-check plugins, but at most once per
+  ``HEALTH_READY_CACHE_TTL`` seconds per process; probes in between get the
+  cached result.  The migrations check only runs until it passed once, i.e.
+  at startup, as migrations are applied before the pods are rolled.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.cache import never_cache
+from health_check.mixins import CheckMixin
+
+MIGRATIONS_CHECK = 'MigrationsHealthCheck'
+
+
+class ReadinessCheck(CheckMixin):
+    """The registered health-check plugins with a time-to-live for their results."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._result = None  # (checked at, {plugin: status}, healthy)
+        self.migrated = False
+
+    def filter_plugins(self, subset=None):
+        plugins = super().filter_plugins(subset)
+        if self.migrated:
+            plugins = {name: plugin for name, plugin in plugins.items() if name != MIGRATIONS_CHECK}
+        return plugins
+
+    def result(self):
+        """Return ``(statuses, healthy, age in seconds)``, running the checks if the result expired."""
+        with self._lock:
+            # Probes arriving while the checks run wait for and share that result
+            now = time.monotonic()
+            if self._result is None or now - self._result[0] >= settings.HEALTH_READY_CACHE_TTL:
+                plugins = self.filter_plugins()
+                errors = self.run_check()
+                statuses = {name: str(plugin.pretty_status()) for name, plugin in plugins.items()}
+                if MIGRATIONS_CHECK in plugins and not plugins[MIGRATIONS_CHECK].errors:
+                    self.migrated = True
+                if self.migrated and MIGRATIONS_CHECK in self.plugins:
+                    statuses.setdefault(MIGRATIONS_CHECK, "working")
+                self._result = (now, statuses, not errors)
+            checked_at, statuses, healthy = self._result
+            return statuses, healthy, now - checked_at
+
+
+readiness = ReadinessCheck()
+
+
+@never_cache
+def livez(request):
+    return HttpResponse("ok", content_type='text/plain')
+
+
+@never_cache
+def readyz(request):
+    statuses, healthy, age = readiness.result()
+    return JsonResponse(
+        {'status': 'ok' if healthy else 'unavailable', 'checks': statuses, 'age': round(age, 1)},
+        status=200 if healthy else 503,
+    )
@@ -0,0 +1,106 @@
+"""Write-behind buffer for ``Browser.last_seen`` heartbeats.
+
+Every playlist poll is a heartbeat.  Instead of one single-row UPDATE per
+poll, heartbeats are collected in process memory and written with a single
+``bulk_update`` every ``HEARTBEAT_FLUSH_INTERVAL`` seconds by a background
+thread (and when the worker process exits), so ``last_seen`` lags by at most
+that interval, even when no further poll reaches the process.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .routers import unpinned_writes
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatBuffer:
+    """Collects the latest heartbeat per browser and flushes them in batches."""
+
+    def __init__(self):
+        self._pending = {}  # browser UUID -> last seen datetime
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+
+    def _add(self, browser_uuid, when):
+        """Remember a heartbeat; return True if a flush is due."""
+        with self._lock:
+            self._pending[browser_uuid] = when or timezone.now()
+            if self._flusher is None:
+                # Started by the first heartbeat, i.e. in the worker process
+                self._flusher = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+                self._flusher.start()
+            return time.monotonic() - self._last_flush >= settings.HEARTBEAT_FLUSH_INTERVAL
+
+    def _run(self):
+        """Flush every interval, so quiet processes don't hold heartbeats back."""
+        while True:
+            time.sleep(max(1.0, self._last_flush + settings.HEARTBEAT_FLUSH_INTERVAL - time.monotonic()))
+            if time.monotonic() - self._last_flush < settings.HEARTBEAT_FLUSH_INTERVAL:
+                continue  # A poll flushed in the meantime
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing browser heartbeats failed.")
+            finally:
+                connections.close_all()  # This thread's connections only
+
+    def record(self, browser_uuid, when=None):
+        """Remember a heartbeat; flushes if the flush interval has elapsed."""
+        if self._add(browser_uuid, when):
+            self.flush()
+
+    async def arecord(self, browser_uuid, when=None):
+        """Async ``record()``: the flush runs in a worker thread, not on the event loop."""
+        if self._add(browser_uuid, when):
+            await sync_to_async(self.flush)()
+
+    def flush(self):
+        """Write all pending heartbeats with one bulk UPDATE. Returns the row count."""
+        from .models import Browser
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            # Rows of browsers deleted in the meantime simply match nothing.
+            # A poll that happens to flush must not be pinned to the primary.
+            with unpinned_writes():
+                Browser.objects.bulk_update(
+                    [Browser(identifier=uuid, last_seen=seen) for uuid, seen in pending.items()],
+                    ['last_seen'],
+                    batch_size=settings.HEARTBEAT_FLUSH_BATCH_SIZE,
+                )
+        except Exception as e:
+            logger.warning("Could not flush %s browser heartbeats (%s). Retrying with the next flush.", len(pending), e)
+            with self._lock:
+                for uuid, seen in pending.items():
+                    # Keep newer heartbeats recorded while we were flushing
+                    self._pending.setdefault(uuid, seen)
+            return 0
+
+        logger.debug("Flushed %s browser heartbeats.", len(pending))
+        return len(pending)
+
+
+heartbeats = HeartbeatBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Runs when a gunicorn/uvicorn worker shuts down gracefully
+    try:
+        heartbeats.flush()
+    except Exception as e:
+        logger.warning("Could not flush browser heartbeats on shutdown: %s", e)
@@ -0,0 +1,59 @@
+"""Run a site-local edge relay (see ``kioskmanager/edge_relay.py``).
+
+The kiosks of a branch site use the relay as their Kiosk Manager server; the
+server only sees the relay's syncs and media downloads::
+
+    EDGE_TOKEN=<token> python manage.py kiosk_edge --upstream https://kiosk.example.com \\
+        --cache-dir /var/cache/kiosk-edge
+
+``EDGE_TOKEN`` must match the server's.  The command replaces itself with
+gunicorn serving ``kioskmanager.edge_wsgi`` (one worker process, which owns
+the cache directory, with ``--threads`` threads) and the relay's settings
+module, so it can run as the service's entry point.
+"""
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Serve the playlist API and mirrored videos to the kiosks of a site, synced with the server."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--upstream', required=True, help="Base URL of the Kiosk Manager server.")
+        parser.add_argument('--token', default='', help="Sync token (default: EDGE_TOKEN).")
+        parser.add_argument('--listen', default='0.0.0.0:8080', help="Address and port to serve the kiosks on.")
+        parser.add_argument('--cache-dir', default='edge-cache', help="Directory for the mirrored videos and state.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between syncs with the server.")
+        parser.add_argument('--timeout', type=float, default=30, help="Timeout of requests to the server in seconds.")
+        parser.add_argument('--threads', type=int, default=32, help="Requests served at the same time.")
+
+    def handle(self, *args, **options):
+        token = options['token'] or settings.EDGE_TOKEN
+        if not token:
+            raise CommandError("Set EDGE_TOKEN or --token to the server's EDGE_TOKEN.")
+        host, _, port = options['listen'].rpartition(':')
+        if not port.isdigit():
+            raise CommandError("--listen must be <address>:<port>, e.g. 0.0.0.0:8080.")
+
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='kioskmanager.edge_settings',
+            EDGE_UPSTREAM=options['upstream'],
+            EDGE_TOKEN=token,
+            EDGE_CACHE_DIR=os.path.abspath(options['cache_dir']),
+            EDGE_SYNC_INTERVAL=str(options['interval']),
+            EDGE_TIMEOUT=str(options['timeout']),
+        )
+        command = [
+            sys.executable, '-m', 'gunicorn', 'kioskmanager.edge_wsgi',
+            '--bind', options['listen'], '--workers', '1', '--worker-class', 'gthread',
+            '--threads', str(options['threads']),
+        ]
+        self.stdout.write(f"Edge relay for {options['upstream']} listening on http://{options['listen']}/ "
+                          f"(cache: {env['EDGE_CACHE_DIR']})")
+        self.stdout.flush()
+        os.execvpe(command[0], command, env)
@@ -0,0 +1,363 @@
+"""Load generator and benchmark for the kiosk playlist API.
+
+Seeds a fleet of display groups, browsers and playlists (with automation
+scripts), then drives the playlist API either in-process or against a
+running server, and reports throughput, latency percentiles and database
+queries per request.
+
+In-process runs call the playlist view directly, in one of two modes:
+``sync`` calls ``get_playlist_api`` from a pool of ``--concurrency`` threads
+(like a threaded WSGI server), ``async`` runs ``--concurrency`` coroutines
+calling ``get_playlist_api_async`` on one event loop (like an ASGI server).
+``--compare-modes`` runs both at each of ``--concurrency-levels``.
+
+Examples::
+
+    python manage.py kiosk_loadtest --groups 20 --browsers 2000 --items 30
+    python manage.py kiosk_loadtest --mode async --concurrency 200
+    python manage.py kiosk_loadtest --compare-modes --concurrency-levels 1,10,50,200 --output modes.json
+    python manage.py kiosk_loadtest --url http://localhost:8000 --concurrency 50 --output results.json
+"""
+import asyncio
+import json
+import math
+import platform
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, RequestFactory
+from django.utils import timezone
+
+from kioskmanager.metrics import count_queries
+from kioskmanager.models import AutomationScript, Browser, ContentItem, DisplayGroup, PlaylistEntry
+from kioskmanager.views import get_playlist_api, get_playlist_api_async
+
+SEED_PREFIX = 'loadtest-'
+
+SCRIPT_CONTENT = '\n'.join([
+    'cy.get(\'input[name="loginfmt"]\').type("kiosk@example.com");',
+    'cy.get(\'#idSIButton9\').click();',
+    'cy.wait(2000);',
+    'cy.get(\'input[name="passwd"]\').type("secret");',
+    'cy.get(\'#idSIButton9\').click();',
+])
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Seed a kiosk fleet and benchmark the playlist API (throughput, latency, queries per request)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=10, help="Number of display groups to seed.")
+        parser.add_argument('--browsers', type=int, default=200, help="Number of browsers, spread over the groups.")
+        parser.add_argument('--items', type=int, default=20, help="Playlist length per group.")
+        parser.add_argument('--scripts', type=int, default=2, help="Automation scripts linked to every playlist item.")
+        parser.add_argument('--requests', type=int, default=2000, help="Total number of playlist requests.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Number of concurrent clients.")
+        parser.add_argument('--mode', choices=['sync', 'async'], default='sync',
+                            help="In-process only: threads calling the sync view or coroutines calling the async view.")
+        parser.add_argument('--compare-modes', action='store_true',
+                            help="In-process only: run both modes at each of --concurrency-levels.")
+        parser.add_argument('--concurrency-levels', default='1,10,50,200',
+                            help="Comma-separated concurrency levels for --compare-modes.")
+        parser.add_argument('--warmup', type=int, default=0, help="Requests sent before measuring.")
+        parser.add_argument('--url', default='', help="Base URL of a running server. Default: drive the API in-process.")
+        parser.add_argument('--revalidate', action='store_true',
+                            help="Send If-None-Match like real clients after their first poll.")
+        parser.add_argument('--no-seed', action='store_true', help=f"Reuse browsers seeded earlier (named {SEED_PREFIX}*).")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data after the run.")
+        parser.add_argument('--cleanup', action='store_true', help="Only delete previously seeded data and exit.")
+        parser.add_argument('--output', default='', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.cleanup()
+            return
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be positive.")
+        if options['compare_modes']:
+            if options['url']:
+                raise CommandError("--compare-modes runs in-process; the mode of a server is its configuration.")
+            try:
+                levels = [int(level) for level in options['concurrency_levels'].split(',')]
+            except ValueError:
+                levels = []
+            if not levels or min(levels) < 1:
+                raise CommandError("--concurrency-levels must be a list of positive integers, e.g. 1,10,50.")
+
+        if not options['no_seed']:
+            self.cleanup()
+            self.seed(options)
+        browser_ids = [str(pk) for pk in Browser.objects.filter(name__startswith=SEED_PREFIX).values_list('pk', flat=True)]
+        if not browser_ids:
+            raise CommandError("No seeded browsers found – run without --no-seed first.")
+
+        try:
+            if options['compare_modes']:
+                results = {'comparison': [
+                    self.run(browser_ids, dict(options, mode=mode, concurrency=level))
+                    for level in levels for mode in ('sync', 'async')
+                ]}
+            else:
+                results = self.run(browser_ids, options)
+        finally:
+            if not options['keep'] and not options['no_seed']:
+                self.cleanup()
+
+        if options['compare_modes']:
+            self.report_comparison(results['comparison'])
+        else:
+            self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    # ── Seeding ──────────────────────────────────────────────────────────────
+
+    @transaction.atomic
+    def seed(self, options):
+        start = time.perf_counter()
+        groups = DisplayGroup.objects.bulk_create([
+            DisplayGroup(name=f'{SEED_PREFIX}group-{g}') for g in range(options['groups'])
+        ])
+        items = ContentItem.objects.bulk_create([
+            ContentItem(
+                title=f'{SEED_PREFIX}item-{g}-{i}',
+                content_type='website',
+                url=f'https://dashboard.example.com/{g}/{i}',
+                duration=30,
+            )
+            for g in range(len(groups)) for i in range(options['items'])
+        ])
+        PlaylistEntry.objects.bulk_create([
+            PlaylistEntry(group=groups[n // options['items']], content_item=item, order=n % options['items'])
+            for n, item in enumerate(items)
+        ])
+        scripts = AutomationScript.objects.bulk_create([
+            AutomationScript(name=f'{SEED_PREFIX}script-{s}', url_pattern='*://login.example.com/*',
+                             content=SCRIPT_CONTENT, order=s)
+            for s in range(options['scripts'])
+        ])
+        AutomationScript.content_items.through.objects.bulk_create([
+            AutomationScript.content_items.through(automationscript=script, contentitem=item)
+            for script in scripts for item in items
+        ])
+        now = timezone.now()
+        Browser.objects.bulk_create([
+            Browser(identifier=uuid.uuid4(), name=f'{SEED_PREFIX}browser-{b}',
+                    group=groups[b % len(groups)] if groups else None, last_seen=now)
+            for b in range(options['browsers'])
+        ], batch_size=500)
+        self.stdout.write(
+            f"Seeded {len(groups)} groups, {options['browsers']} browsers, {len(items)} items and "
+            f"{len(scripts)} scripts in {time.perf_counter() - start:.1f}s."
+        )
+
+    def cleanup(self):
+        Browser.objects.filter(name__startswith=SEED_PREFIX).delete()
+        DisplayGroup.objects.filter(name__startswith=SEED_PREFIX).delete()
+        ContentItem.objects.filter(title__startswith=SEED_PREFIX).delete()
+        AutomationScript.objects.filter(name__startswith=SEED_PREFIX).delete()
+
+    # ── Load generation ──────────────────────────────────────────────────────
+
+    def run(self, browser_ids, options):
+        etags = {}
+
+        def next_etag(browser_id):
+            return etags.get(browser_id) if options['revalidate'] else None
+
+        def remember(browser_id, sample):
+            if sample['etag']:
+                etags[browser_id] = sample['etag']
+            return sample
+
+        if options['url'] or options['mode'] == 'sync':
+            send = self._remote_sender(options['url']) if options['url'] else self._sync_sender()
+
+            def one(n):
+                browser_id = browser_ids[n % len(browser_ids)]
+                return remember(browser_id, send(browser_id, next_etag(browser_id)))
+
+            def drive(count):
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    return list(pool.map(one, range(count)))
+        else:
+            send = self._async_sender()
+
+            async def drive_async(count):
+                pending = iter(range(count))
+                samples = []
+
+                async def client():
+                    for n in pending:  # Shared by all clients
+                        browser_id = browser_ids[n % len(browser_ids)]
+                        samples.append(remember(browser_id, await send(browser_id, next_etag(browser_id))))
+
+                await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+                return samples
+
+            def drive(count):
+                return asyncio.run(drive_async(count))
+
+        if options['warmup']:
+            drive(options['warmup'])
+
+        start = time.perf_counter()
+        samples = drive(options['requests'])
+        elapsed = time.perf_counter() - start
+
+        return self.summarize(samples, elapsed, options)
+
+    @staticmethod
+    def _sample(start, response, queries):
+        return {
+            'latency': time.perf_counter() - start,
+            'status': response.status_code,
+            'etag': response.get('ETag'),
+            'queries': queries.count,
+            'query_time': queries.duration,
+            'bytes': len(response.content),
+        }
+
+    def _sync_sender(self):
+        factory = RequestFactory()
+
+        def send(browser_id, etag):
+            headers = {'If-None-Match': etag} if etag else {}
+            request = factory.get('/api/playlist/', {'browser_id': browser_id}, headers=headers)
+            start = time.perf_counter()
+            with count_queries() as queries:
+                response = get_playlist_api(request)
+            return self._sample(start, response, queries)
+
+        return send
+
+    def _async_sender(self):
+        factory = AsyncRequestFactory()
+
+        async def send(browser_id, etag):
+            headers = {'If-None-Match': etag} if etag else {}
+            request = factory.get('/api/playlist/', {'browser_id': browser_id}, headers=headers)
+            start = time.perf_counter()
+            # Like the ASGI handler: the ORM calls of each request share a thread of their own
+            async with ThreadSensitiveContext():
+                with count_queries() as queries:
+                    response = await get_playlist_api_async(request)
+            return self._sample(start, response, queries)
+
+        return send
+
+    def _remote_sender(self, base_url):
+        base_url = base_url.rstrip('/')
+
+        def send(browser_id, etag):
+            request = urllib.request.Request(f'{base_url}/api/playlist/?browser_id={browser_id}')
+            if etag:
+                request.add_header('If-None-Match', etag)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    body = response.read()
+                    status, new_etag = response.status, response.headers.get('ETag')
+            except urllib.error.HTTPError as e:
+                body, status, new_etag = b'', e.code, e.headers.get('ETag')
+            except OSError:
+                body, status, new_etag = b'', 0, None
+            return {
+                'latency': time.perf_counter() - start,
+                'status': status,
+                'etag': new_etag,
+                'queries': None,
+                'query_time': None,
+                'bytes': len(body),
+            }
+
+        return send
+
+    # ── Reporting ────────────────────────────────────────────────────────────
+
+    def summarize(self, samples, elapsed, options):
+        latencies = sorted(s['latency'] * 1000 for s in samples)
+        statuses = {}
+        for s in samples:
+            statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+        ok = sum(1 for s in samples if s['status'] in (200, 304))
+        queries = [s['queries'] for s in samples if s['queries'] is not None]
+        query_times = [s['query_time'] * 1000 for s in samples if s['query_time'] is not None]
+
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'environment': {
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+            },
+            'config': {
+                'mode': 'remote' if options['url'] else options['mode'],
+                'url': options['url'] or None,
+                'groups': options['groups'],
+                'browsers': options['browsers'],
+                'items': options['items'],
+                'scripts': options['scripts'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'revalidate': options['revalidate'],
+            },
+            'requests': len(samples),
+            'errors': len(samples) - ok,
+            'status_codes': statuses,
+            'duration_s': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+            'latency_ms': {
+                'mean': round(statistics.fmean(latencies), 3),
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'db_queries_per_request': {
+                'mean': round(statistics.fmean(queries), 2),
+                'max': max(queries),
+                'time_ms_mean': round(statistics.fmean(query_times), 3),
+            } if queries else None,
+            'bytes_per_request_mean': round(statistics.fmean(s['bytes'] for s in samples), 1),
+        }
+
+    def report(self, results):
+        lat = results['latency_ms']
+        self.stdout.write(
+            f"{results['requests']} requests ({results['config']['mode']}, concurrency "
+            f"{results['config']['concurrency']}) in {results['duration_s']}s: "
+            f"{results['throughput_rps']} req/s, {results['errors']} errors"
+        )
+        self.stdout.write(f"Latency ms: p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+        if results['db_queries_per_request']:
+            q = results['db_queries_per_request']
+            self.stdout.write(f"DB queries/request: mean {q['mean']}  max {q['max']}  ({q['time_ms_mean']} ms)")
+        self.stdout.write(f"Status codes: {results['status_codes']}")
+
+    def report_comparison(self, runs):
+        self.stdout.write(f"{'mode':<6} {'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for results in runs:
+            lat = results['latency_ms']
+            self.stdout.write(
+                f"{results['config']['mode']:<6} {results['config']['concurrency']:>11} {results['throughput_rps']:>9} "
+                f"{lat['p50']:>9} {lat['p95']:>9} {lat['p99']:>9} {results['errors']:>7}"
+            )
@@ -0,0 +1,60 @@
+"""Move videos uploaded before content-addressed storage into it.
+
+Older uploads live under ``content/videos/<name>``; this hashes each file,
+moves it to ``content/videos/sha256/...`` (duplicates are stored once) and
+points the ContentItems and their renditions at the new name::
+
+    python manage.py kiosk_migrate_storage --dry-run
+    python manage.py kiosk_migrate_storage
+"""
+import hashlib
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from kioskmanager.models import ContentItem, VideoRendition
+from kioskmanager.playlist import bump_group_versions
+from kioskmanager.signals import groups_for_content_items
+from kioskmanager.storage import digest_from_name
+
+
+class Command(BaseCommand):
+    help = "Move legacy video uploads into the content-addressed video storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be moved.")
+
+    def handle(self, *args, **options):
+        storage = ContentItem._meta.get_field('video_file').storage
+        names = ContentItem.objects.exclude(video_file='').exclude(video_file__isnull=True)\
+                                   .values_list('video_file', flat=True).distinct()
+        legacy = sorted(name for name in names if not digest_from_name(name))
+        moved = saved = 0
+        for name in legacy:
+            if not storage.exists(name):
+                self.stderr.write(f"Missing file {name}, skipped.")
+                continue
+            path = storage.path(name)
+            size = os.path.getsize(path)
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(block)
+            digest = sha256.hexdigest()
+            new_name = storage.hashed_name(digest, os.path.splitext(name)[1])
+            duplicate = storage.exists(new_name)
+            self.stdout.write(f"{name} -> {new_name}{' (duplicate)' if duplicate else ''}")
+            if options['dry_run']:
+                continue
+
+            with transaction.atomic():
+                new_name = storage.adopt(path, digest, os.path.splitext(name)[1])
+                # update() skips the signal handlers: the file was moved, not replaced
+                item_ids = list(ContentItem.objects.filter(video_file=name).values_list('pk', flat=True))
+                ContentItem.objects.filter(pk__in=item_ids).update(video_file=new_name)
+                VideoRendition.objects.filter(source_name=name).update(source_name=new_name)
+                bump_group_versions(groups_for_content_items(item_ids))
+            moved += 1
+            saved += size if duplicate else 0
+        self.stdout.write(f"Moved {moved} of {len(legacy)} legacy videos, {saved / 2 ** 20:.1f} MiB saved by deduplication.")
@@ -0,0 +1,53 @@
+"""Background worker that transcodes uploaded videos (see ``transcode.py``).
+
+Runs next to the web server (the Helm chart starts it as a second
+container) and processes pending renditions one at a time::
+
+    python manage.py kiosk_transcode_worker
+    python manage.py kiosk_transcode_worker --enqueue-missing --once
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from kioskmanager.models import ContentItem
+from kioskmanager.transcode import claim_next_rendition, enqueue_renditions, process_rendition
+
+
+class Command(BaseCommand):
+    help = "Transcode uploaded videos into the renditions configured in VIDEO_RENDITIONS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=5, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help="Queue renditions for videos uploaded before transcoding was enabled.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        if options['enqueue_missing']:
+            queued = sum(len(enqueue_renditions(item)) for item in ContentItem.objects.filter(content_type='video'))
+            self.stdout.write(f"Queued {queued} renditions.")
+
+        while not self.stopping:
+            close_old_connections()
+            rendition = claim_next_rendition()
+            if rendition is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Transcoding {rendition.name} of {rendition.source_name} ...")
+            start = time.monotonic()
+            status = process_rendition(rendition)
+            self.stdout.write(f"  {status or 'discarded'} after {time.monotonic() - start:.1f}s")
+
+    def stop(self, signum, frame):
+        # Finish the current rendition, then exit
+        self.stdout.write("Stopping after the current rendition.")
+        self.stopping = True
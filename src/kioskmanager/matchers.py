@@ -0,0 +1,111 @@
+"""URL patterns of automation scripts.
+
+``AutomationScript.url_pattern`` is a glob in the style of browser extension
+match patterns::
+
+    <scheme>://<host>[/<path>]
+
+* ``scheme`` is ``*`` (http and https) or a literal scheme such as ``https``.
+* ``host`` is ``*`` (any host), ``*.example.com`` (example.com and all its
+  subdomains) or a literal host name, optionally with a port.  Other ``*``
+  in the host match within a single host name.
+* ``path`` may contain ``*`` anywhere; a missing path matches every path.
+
+Patterns are compiled when a script is saved into an anchored regular
+expression (valid in Python and JavaScript) plus the host the pattern is
+bound to.  The playlist API ships these as an index keyed by host, so the
+extension only tests the few scripts that can match a URL.
+"""
+import re
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+
+PATTERN = re.compile(r'^(?P<scheme>\*|[a-z][a-z0-9+.-]*)://(?P<host>[^/]+)(?P<path>/.*)?$')
+HOST = re.compile(r'^[a-z0-9*._-]+(:(\d+|\*))?$')
+
+# ``host`` is '' when the pattern matches any host, '*.example.com' for a
+# domain with its subdomains and the literal host name otherwise.
+UrlMatcher = namedtuple('UrlMatcher', ['host', 'regex'])
+
+
+def _glob(text, wildcard='.*'):
+    return wildcard.join(re.escape(part) for part in text.split('*'))
+
+
+def compile_url_pattern(pattern):
+    """Return the UrlMatcher of ``pattern``; raise ValidationError if it is malformed."""
+    if not pattern or pattern != pattern.strip() or any(c.isspace() for c in pattern):
+        raise ValidationError("URL patterns must not be empty or contain whitespace.")
+    match = PATTERN.match(pattern)
+    if not match:
+        raise ValidationError(
+            "Enter a pattern of the form <scheme>://<host>/<path>, e.g. *://login.microsoftonline.com/*."
+        )
+    scheme, host, path = match['scheme'], match['host'].lower(), match['path'] or '/*'
+    if not HOST.match(host) or '..' in host:
+        raise ValidationError("'%(host)s' is not a valid host name.", params={'host': host})
+
+    scheme_regex = 'https?' if scheme == '*' else re.escape(scheme)
+    name, port = host.partition(':')[::2]
+    if name == '*':
+        host_key, host_regex = '', '[^/]*'
+    elif name.startswith('*.') and '*' not in name[2:]:
+        host_key, host_regex = name, r'([^/.]+\.)*' + re.escape(name[2:])
+    elif '*' in name:
+        # e.g. login.*.example.com – cannot be indexed by host
+        host_key, host_regex = '', _glob(name, '[^/:]*')
+    else:
+        host_key, host_regex = name, re.escape(name)
+    if port == '*':
+        host_regex += '(:[0-9]+)?'
+    elif port:
+        host_regex += re.escape(':' + port)
+
+    return UrlMatcher(host_key, f'^{scheme_regex}://{host_regex}{_glob(path)}$')
+
+
+def legacy_url_matcher(pattern):
+    """Matcher with the semantics the extension used before patterns were validated.
+
+    Keeps scripts that were saved with a malformed pattern working until the
+    pattern is edited: ``*`` matches anything, and the pattern may match any
+    part of the URL.
+    """
+    return UrlMatcher('', _glob(pattern))
+
+
+def url_matcher(pattern):
+    """Return the UrlMatcher of ``pattern``, falling back to the legacy semantics."""
+    try:
+        return compile_url_pattern(pattern)
+    except ValidationError:
+        return legacy_url_matcher(pattern)
+
+
+def host_index_key(host):
+    """Split a matcher host into the index it belongs to and its key."""
+    if not host:
+        return 'any', None
+    if host.startswith('*.'):
+        return 'domains', host[2:]
+    return 'hosts', host
+
+
+def build_matcher_index(rules):
+    """Build the matcher of the playlist API from ``(script_key, UrlMatcher)`` pairs.
+
+    ``rules`` must be in execution order; the extension runs the first
+    rule whose regex matches.  The indexes map a host name (``hosts``) or a
+    domain whose subdomains match as well (``domains``) to rule positions;
+    ``any`` lists the rules that are not bound to a host.
+    """
+    index = {'rules': [], 'hosts': {}, 'domains': {}, 'any': []}
+    for position, (key, matcher) in enumerate(rules):
+        index['rules'].append({'script': key, 'regex': matcher.regex})
+        kind, host = host_index_key(matcher.host)
+        if host is None:
+            index[kind].append(position)
+        else:
+            index[kind].setdefault(host, []).append(position)
+    return index
@@ -0,0 +1,181 @@
+"""Serving of uploaded media below ``/content/``.
+
+Kiosks seek in videos and resume interrupted downloads, so the view answers
+single byte ranges with ``206 Partial Content`` and handles conditional
+requests (``If-None-Match``, ``If-Modified-Since``, ``If-Range``).
+
+``MEDIA_SERVE_MODE`` decides who sends the bytes:
+
+* ``django`` streams the file from the worker (development, small setups).
+  Under ASGI the blocks are read in the thread pool by an async iterator,
+  so a download neither is buffered in memory nor occupies the sync thread.
+* ``x-accel-redirect`` only returns the headers plus an internal redirect to
+  ``MEDIA_ACCEL_REDIRECT_PREFIX``; nginx sends the file, including ranges.
+* ``x-sendfile`` does the same for Apache/lighttpd with an absolute path.
+
+Either way the caching headers come from here, so the nginx sidecar needs
+no per-path rules.
+"""
+import functools
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+MEDIA_DIR = 'content'
+# Content-addressed videos (storage.py) and renditions never change content
+IMMUTABLE_PREFIXES = ('videos/sha256/', 'renditions/')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STREAM_BLOCK = 256 * 1024
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/mp4',
+    '.webm': 'video/webm',
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` of a single byte range, or None to send the whole file.
+
+    Malformed headers and multiple ranges are ignored, as RFC 9110 allows.
+    Raises RangeNotSatisfiable if the range lies beyond the end of the file.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable
+        start, end = max(size - suffix, 0), size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _resolve(path):
+    # Hidden files and directories (e.g. partial uploads in .uploads/) are never served
+    if any(not part or part.startswith('.') for part in path.split('/')):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, MEDIA_DIR, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return full_path
+
+
+def _content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+async def _aread_range(path, start, length):
+    # Django would buffer a sync iterator with sync_to_async(list) under ASGI
+    read_in_thread = functools.partial(sync_to_async, thread_sensitive=False)
+    f = await read_in_thread(open)(path, 'rb')
+    try:
+        await read_in_thread(f.seek)(start)
+        while length > 0:
+            block = await read_in_thread(f.read)(min(STREAM_BLOCK, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+@require_safe
+def serve_media(request, path):
+    full_path = _resolve(path)
+    stat = os.stat(full_path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    # Same format as nginx, so the ETag does not change with MEDIA_SERVE_MODE
+    etag = f'"{last_modified:x}-{size:x}"'
+
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(last_modified)
+    headers['Accept-Ranges'] = 'bytes'
+    headers['Cache-Control'] = (IMMUTABLE_CACHE_CONTROL if path.startswith(IMMUTABLE_PREFIXES)
+                                else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=headers)
+    if conditional is not headers:
+        return conditional  # 304 Not Modified or 412 Precondition Failed
+
+    content_type = _content_type(full_path)
+    mode = settings.MEDIA_SERVE_MODE
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The web server answers ranges and sends the bytes
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{path}")
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if 'Range' in request.headers and (not if_range or if_range == etag
+                                           or parse_http_date_safe(if_range) == last_modified):
+            try:
+                byte_range = parse_range(request.headers['Range'], size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        elif isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(_aread_range(full_path, start, length), content_type=content_type)
+        elif byte_range:
+            response = StreamingHttpResponse(_read_range(full_path, start, length), content_type=content_type)
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+
+    for header in ('ETag', 'Last-Modified', 'Accept-Ranges', 'Cache-Control'):
+        response[header] = headers[header]
+    return response
@@ -0,0 +1,204 @@
+"""Prometheus metrics for the playlist API and the kiosk fleet.
+
+Request, cache and registration metrics are collected with
+``prometheus_client``.  When ``PROMETHEUS_MULTIPROC_DIR`` is set (as in the
+container image), every worker process writes its samples there and the
+``/metrics`` view aggregates them, so counters stay correct across gunicorn
+workers.  Fleet gauges are computed at scrape time from a single aggregated
+query over ``Browser``.
+"""
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Q
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+from .routers import replica_reads
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+PLAYLIST_REQUESTS = Counter(
+    'kioskmanager_playlist_requests_total',
+    'Playlist API requests by HTTP status.',
+    ['status'],
+)
+PLAYLIST_LATENCY = Histogram(
+    'kioskmanager_playlist_request_duration_seconds',
+    'Playlist API request duration.',
+    buckets=(0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+PLAYLIST_DB_QUERIES = Histogram(
+    'kioskmanager_playlist_db_queries',
+    'Database queries per playlist API request.',
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 20, 50),
+)
+PLAYLIST_DB_TIME = Histogram(
+    'kioskmanager_playlist_db_duration_seconds',
+    'Database time per playlist API request.',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+SNAPSHOT_CACHE = Counter(
+    'kioskmanager_playlist_snapshot_cache_total',
+    'Playlist snapshot cache lookups by result (hit/miss).',
+    ['result'],
+)
+REGISTRATIONS = Counter(
+    'kioskmanager_browser_registrations_total',
+    'Browsers registered through the playlist API.',
+)
+
+
+class QueryCounter:
+    """Number and duration of the queries run inside ``count_queries()``."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# Counters of the enclosing count_queries() blocks.  A context variable, so
+# that the queries the async ORM runs in worker threads are counted as well.
+_query_counters = ContextVar('kioskmanager_query_counters', default=())
+
+
+def _count_queries(execute, sql, params, many, context):
+    counters = _query_counters.get()
+    if not counters:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for counter in counters:
+            counter.count += 1
+            counter.duration += duration
+
+
+@receiver(connection_created)
+def _install_query_counter(sender, connection, **kwargs):
+    # Every thread (and database alias) has its own connection object
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+@contextmanager
+def count_queries():
+    """Count the queries on all databases inside the block, in sync and async code."""
+    for connection in connections.all(initialized_only=True):
+        # Connected before this module was imported
+        _install_query_counter(None, connection)
+    counter = QueryCounter()
+    token = _query_counters.set(_query_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _query_counters.reset(token)
+
+
+def _observe(start, status, queries):
+    PLAYLIST_LATENCY.observe(time.perf_counter() - start)
+    PLAYLIST_REQUESTS.labels(status=str(status)).inc()
+    PLAYLIST_DB_QUERIES.observe(queries.count)
+    PLAYLIST_DB_TIME.observe(queries.duration)
+
+
+def instrument_playlist_api(view):
+    """Record count, latency and DB usage of a (sync or async) playlist API view."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            with count_queries() as queries:
+                try:
+                    response = await view(request, *args, **kwargs)
+                    status = response.status_code
+                    return response
+                finally:
+                    _observe(start, status, queries)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            with count_queries() as queries:
+                try:
+                    response = view(request, *args, **kwargs)
+                    status = response.status_code
+                    return response
+                finally:
+                    _observe(start, status, queries)
+    return wrapper
+
+
+@replica_reads()
+def _fleet_rows(cutoff):
+    from .models import Browser
+
+    return list(Browser.objects.values('group__name').annotate(
+        total=Count('pk'),
+        online=Count('pk', filter=Q(last_seen__gte=cutoff)),
+    ).order_by())
+
+
+class FleetCollector:
+    """Per-group browser counts, computed with one aggregated query per scrape."""
+
+    def collect(self):
+        rows = _fleet_rows(timezone.now() - timedelta(seconds=settings.METRICS_ONLINE_THRESHOLD))
+
+        total = GaugeMetricFamily('kioskmanager_browsers', 'Registered browsers per display group.', labels=['group'])
+        online = GaugeMetricFamily(
+            'kioskmanager_browsers_online',
+            f'Browsers per display group seen within the last {settings.METRICS_ONLINE_THRESHOLD}s.',
+            labels=['group'],
+        )
+        for row in rows:
+            group = row['group__name'] or ''  # Unassigned browsers
+            total.add_metric([group], row['total'])
+            online.add_metric([group], row['online'])
+        yield total
+        yield online
+
+
+def metrics_view(request):
+    """Expose all metrics in the Prometheus text format.
+
+    Outside ``DEBUG`` the endpoint requires ``METRICS_TOKEN``: the fleet
+    gauges carry the group names, and ``/metrics`` is reachable through the
+    ingress.
+    """
+    if not settings.METRICS_ENABLED or not (settings.METRICS_TOKEN or settings.DEBUG):
+        return HttpResponseNotFound()
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponseForbidden()
+
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    fleet = CollectorRegistry()
+    fleet.register(FleetCollector())
+
+    return HttpResponse(generate_latest(registry) + generate_latest(fleet), content_type=CONTENT_TYPE_LATEST)
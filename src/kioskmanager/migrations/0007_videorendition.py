@@ -0,0 +1,36 @@
+# Generated by Django 4.2.25 on 2026-10-18 12:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kioskmanager', '0006_automationscript_m2m_content_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="E.g. '720p' or 'hls'.", max_length=20)),
+                ('kind', models.CharField(choices=[('mp4', 'MP4'), ('hls', 'HLS ladder')], default='mp4', max_length=3)),
+                ('height', models.PositiveIntegerField(blank=True, help_text='Target height in pixels (MP4 only).', null=True)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('bitrate', models.PositiveIntegerField(blank=True, help_text='Video bitrate in kbit/s (MP4 only).', null=True)),
+                ('source_name', models.CharField(help_text='Name of the video file this rendition was made from.', max_length=255)),
+                ('file', models.FileField(blank=True, max_length=255, upload_to='')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('skipped', 'Skipped'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='kioskmanager.contentitem')),
+            ],
+            options={
+                'ordering': ['content_item', 'kind', 'height'],
+                'unique_together': {('content_item', 'name')},
+            },
+        ),
+    ]
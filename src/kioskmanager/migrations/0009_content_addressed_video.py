@@ -0,0 +1,19 @@
+# Generated by Django 4.2.25 on 2026-10-18 12:48
+
+from django.db import migrations, models
+import kioskmanager.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kioskmanager', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contentitem',
+            name='video_file',
+            field=models.FileField(blank=True, help_text="Required if type is 'Video'.", max_length=255, null=True, storage=kioskmanager.storage.ContentAddressedStorage(), upload_to='content/videos/'),
+        ),
+    ]
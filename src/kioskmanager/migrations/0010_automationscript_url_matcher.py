@@ -0,0 +1,34 @@
+# Generated by Django 4.2.25 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+from kioskmanager.matchers import url_matcher
+
+
+def compile_url_patterns(apps, schema_editor):
+    AutomationScript = apps.get_model('kioskmanager', 'AutomationScript')
+    for script in AutomationScript.objects.exclude(url_pattern__isnull=True).exclude(url_pattern=''):
+        matcher = url_matcher(script.url_pattern)
+        script.url_host, script.url_regex = matcher.host, matcher.regex
+        script.save(update_fields=['url_host', 'url_regex'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kioskmanager', '0009_content_addressed_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationscript',
+            name='url_host',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='automationscript',
+            name='url_regex',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(compile_url_patterns, migrations.RunPython.noop),
+    ]
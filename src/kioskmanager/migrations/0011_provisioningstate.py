@@ -0,0 +1,23 @@
+# Generated by Django 4.2.25 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kioskmanager', '0010_automationscript_url_matcher'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('admin_password', models.CharField(blank=True, help_text='Password hash of the admin user after provisioning.', max_length=128)),
+                ('provisioned_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
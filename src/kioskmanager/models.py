@@ -5,6 +5,9 @@ from django.utils import timezone
 import os
 import uuid # For browser IDs
 
+from .matchers import compile_url_pattern, url_matcher
+from .storage import video_storage
+
 class DisplayGroup(models.Model):
     """A group of displays that show the same content playlist."""
     name = models.CharField(max_length=100, unique=True)
@@ -45,7 +48,8 @@ class ContentItem(models.Model):
     content_type = models.CharField(max_length=10, choices=CONTENT_TYPES)
 
     # Video specific
-    video_file = models.FileField(upload_to='content/videos/', blank=True, null=True, help_text="Required if type is 'Video'.")
+    # Stored by content hash, so identical uploads share one file (see storage.py)
+    video_file = models.FileField(upload_to='content/videos/', storage=video_storage, max_length=255, blank=True, null=True, help_text="Required if type is 'Video'.")
 
     # Website specific
     url = models.URLField(max_length=2048, blank=True, null=True, help_text="Required if type is 'Website'.")
@@ -79,18 +83,16 @@ class ContentItem(models.Model):
     def __str__(self):
         return f"{self.title} ({self.get_content_type_display()})"
 
-    # Handle file deletion on model deletion
-    def delete(self, *args, **kwargs):
-        if self.content_type == 'video' and self.video_file:
-            storage, path = self.video_file.storage, self.video_file.path
-            # Check if file exists before trying to delete
-            if storage.exists(path):
-                 try:
-                     storage.delete(path)
-                     print(f"Deleted file: {path}") # Logging
-                 except Exception as e:
-                     print(f"Error deleting file {path}: {e}") # Proper logging needed
-        super().delete(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored video, so a replaced file can be released after saving
+        if 'video_file' in field_names:
+            instance._loaded_video_name = instance.__dict__['video_file'] or ''
+        return instance
+
+    # The video file itself is released by a signal handler once no other
+    # ContentItem references it (see signals.py), also for queryset deletes.
 
 
 class AutomationScript(models.Model):
@@ -132,6 +134,9 @@ class AutomationScript(models.Model):
         default=0,
         help_text="Execution order when multiple scripts match (ascending).",
     )
+    # url_pattern compiled on save (see matchers.py)
+    url_host = models.CharField(max_length=255, blank=True, editable=False)
+    url_regex = models.TextField(blank=True, editable=False)
 
     class Meta:
         ordering = ['order', 'name']
@@ -144,6 +149,24 @@ class AutomationScript(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        """Reject URL patterns the extension could not match reliably."""
+        if self.url_pattern:
+            try:
+                compile_url_pattern(self.url_pattern)
+            except ValidationError as e:
+                raise ValidationError({'url_pattern': e.messages})
+
+    def save(self, *args, **kwargs):
+        # Scripts saved before patterns were validated keep their old, lenient matching
+        matcher = url_matcher(self.url_pattern) if self.url_pattern else None
+        self.url_host = matcher.host if matcher else ''
+        self.url_regex = matcher.regex if matcher else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'url_pattern' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'url_host', 'url_regex'}
+        super().save(*args, **kwargs)
+
 
 class PlaylistEntry(models.Model):
     """Defines the order of a specific ContentItem within a DisplayGroup."""
@@ -158,4 +181,101 @@ class PlaylistEntry(models.Model):
         # unique_together = ('group', 'content_item',) # Prevents adding same item twice to one group
 
     def __str__(self):
-        return f"{self.group.name} - Order {self.order}: {self.content_item.title}"
\ No newline at end of file
+        return f"{self.group.name} - Order {self.order}: {self.content_item.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored group, so moving the entry also invalidates the old group
+        if 'group_id' in field_names:
+            instance._loaded_group_id = instance.__dict__['group_id']
+        return instance
+
+class VideoRendition(models.Model):
+    """A transcoded version of a ContentItem's video file.
+
+    Created as *pending* whenever a video is uploaded or replaced and
+    processed by the ``kiosk_transcode_worker`` management command (see
+    ``transcode.py``).  ``file`` is an H.264/AAC MP4 for ``kind='mp4'`` and
+    the HLS master playlist for ``kind='hls'``.
+    """
+    KIND_MP4 = 'mp4'
+    KIND_HLS = 'hls'
+    KINDS = [
+        (KIND_MP4, 'MP4'),
+        (KIND_HLS, 'HLS ladder'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_SKIPPED, 'Skipped'),  # Larger than the source video
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    content_item = models.ForeignKey(ContentItem, on_delete=models.CASCADE, related_name='renditions')
+    name = models.CharField(max_length=20, help_text="E.g. '720p' or 'hls'.")
+    kind = models.CharField(max_length=3, choices=KINDS, default=KIND_MP4)
+    height = models.PositiveIntegerField(null=True, blank=True, help_text="Target height in pixels (MP4 only).")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True, help_text="Video bitrate in kbit/s (MP4 only).")
+    source_name = models.CharField(max_length=255, help_text="Name of the video file this rendition was made from.")
+    file = models.FileField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING, db_index=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['content_item', 'kind', 'height']
+        unique_together = ('content_item', 'name')
+
+    def __str__(self):
+        return f"{self.content_item.title} – {self.name} ({self.get_status_display()})"
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload of a video file (see ``uploads.py``).
+
+    Chunks are written to ``temp_path`` in order; ``received`` is the number
+    of bytes acknowledged so far, i.e. the offset the next chunk starts at.
+    On completion the file is moved to ``content/videos/`` and its storage
+    name is kept in ``file_name`` until a ContentItem takes it over.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255, help_text="Name of the file on the uploading computer.")
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    file_name = models.CharField(max_length=255, blank=True, help_text="Storage name once the upload is complete.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def complete(self):
+        return bool(self.file_name)
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.UPLOAD_TEMP_DIR, f'{self.pk}.part')
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
+
+
+class ProvisioningState(models.Model):
+    """Fingerprint of the defaults set up by ``provisioning.provision()``."""
+    key = models.CharField(max_length=50, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    admin_password = models.CharField(max_length=128, blank=True, help_text="Password hash of the admin user after provisioning.")
+    provisioned_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.provisioned_at:%Y-%m-%d %H:%M})"
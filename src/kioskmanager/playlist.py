@@ -0,0 +1,326 @@
+"""Per-group playlist snapshots.
+
+Every browser in a DisplayGroup receives exactly the same playlist, so the
+serialized playlist is built once per group and stored in Django's cache
+under the group's current *version*.  The version is an opaque token kept in
+the cache as well; the handlers in ``signals.py`` replace it whenever a
+PlaylistEntry, ContentItem, AutomationScript or DisplayGroup changes, which
+makes all previously cached snapshots of that group unreachable.  Versions
+start with their creation time, so that snapshots of a version younger than
+the tolerated replication lag are built from the primary database (see
+``routers.py``).
+
+Use a shared cache backend (file-based or database) when running more than
+one worker process, otherwise an invalidation in one worker is not seen by
+the others.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Prefetch, Value, When
+
+from .matchers import UrlMatcher, build_matcher_index
+from .metrics import SNAPSHOT_CACHE
+from .routers import primary_reads, replica_may_lag
+from .storage import digest_from_name
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'kioskmanager:playlist:version:{group_id}'
+SNAPSHOT_KEY = 'kioskmanager:playlist:snapshot3:{group_id}:{version}:{base}'
+
+# Payload formats of /api/playlist/: 1 embeds the automation scripts in every
+# item, 2 lists each script once in ``scripts`` and items reference it by key.
+PAYLOAD_FORMATS = (1, 2)
+
+
+def get_cache():
+    return caches[settings.PLAYLIST_CACHE_ALIAS]
+
+
+def _new_version():
+    # Creation time in milliseconds (11 hex digits) plus a random part
+    return f'{int(time.time() * 1000):011x}{uuid.uuid4().hex[:5]}'
+
+
+def version_age(version):
+    """Seconds since ``version`` was created (0 for versions without a timestamp)."""
+    try:
+        return max(time.time() - int(version[:11], 16) / 1000, 0)
+    except ValueError:
+        return 0
+
+
+def get_group_version(group_id):
+    """Return the current playlist version of a group, creating one if needed."""
+    cache = get_cache()
+    key = VERSION_KEY.format(group_id=group_id)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        # add() so that concurrent workers settle on a single version
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_group_version(group_id):
+    """Async ``get_group_version()``."""
+    cache = get_cache()
+    key = VERSION_KEY.format(group_id=group_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = _new_version()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_group_versions(group_ids):
+    """Invalidate the cached snapshots of the given groups.
+
+    The bump is deferred until the surrounding transaction commits, so a
+    concurrent poll can never cache the old database state under the new
+    version.
+    """
+    group_ids = {gid for gid in group_ids if gid is not None}
+    if not group_ids:
+        return
+
+    def bump():
+        get_cache().set_many(
+            {VERSION_KEY.format(group_id=gid): _new_version() for gid in group_ids},
+            timeout=None,
+        )
+        logger.debug("Bumped playlist version for groups %s", sorted(group_ids))
+
+    transaction.on_commit(bump)
+
+
+def script_key(script):
+    """Content hash of an automation script as it is sent to the extension.
+
+    128 bits of SHA-256 keep the references in the payload short.
+    """
+    payload = json.dumps([script.name, script.url_pattern or '', script.content])
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def reorder_playlist(group, entry_ids):
+    """Give the PlaylistEntries of ``group`` the order of ``entry_ids`` atomically.
+
+    The entries keep the set of ``order`` values they have (gaps such as
+    10, 20, 30 are preserved); only the assignment changes.  Renumbering
+    runs in two UPDATE statements regardless of the playlist length: the
+    first moves every entry to its new position above the current maximum,
+    the second shifts all of them down again, so the ``(group, order)``
+    unique constraint never sees two equal values.  Bulk updates send no
+    signals, so the playlist version is bumped once here.
+
+    Raises ValueError unless ``entry_ids`` lists every entry of the group
+    exactly once.
+    """
+    from .models import PlaylistEntry
+
+    with transaction.atomic():
+        # Lock the entries, so a concurrent reorder or inline save waits
+        current = list(PlaylistEntry.objects.select_for_update()
+                                            .filter(group=group)
+                                            .order_by('order')
+                                            .values_list('pk', 'order'))
+        if len(entry_ids) != len(current) or set(entry_ids) != {pk for pk, _ in current}:
+            raise ValueError("The new order must list every entry of the playlist exactly once.")
+        if not current:
+            return []
+        orders = [order for _, order in current]
+        offset = orders[-1] + 1
+
+        entries = PlaylistEntry.objects.filter(group=group)
+        entries.update(order=Case(
+            *[When(pk=pk, then=Value(offset + order)) for pk, order in zip(entry_ids, orders)],
+            output_field=IntegerField(),
+        ))
+        entries.update(order=F('order') - offset)
+        bump_group_versions([group.pk])
+    return list(zip(entry_ids, orders))
+
+
+def build_playlist_snapshot(group, request):
+    """Serialize the playlist of ``group`` straight from the database.
+
+    Costs three queries regardless of playlist length: the entries with their
+    content items, the enabled automation scripts and the finished video
+    renditions of all those items.
+    """
+    from .models import AutomationScript, PlaylistEntry, VideoRendition
+
+    entries = PlaylistEntry.objects.filter(group=group)\
+                                   .order_by('order')\
+                                   .select_related('content_item')\
+                                   .prefetch_related(Prefetch(
+                                       'content_item__automation_scripts',
+                                       queryset=AutomationScript.objects.filter(enabled=True).order_by('order', 'name'),
+                                       to_attr='enabled_scripts',
+                                   ), Prefetch(
+                                       'content_item__renditions',
+                                       queryset=VideoRendition.objects.filter(status=VideoRendition.STATUS_DONE)
+                                                                      .order_by('height'),
+                                       to_attr='ready_renditions',
+                                   ))
+
+    playlist_items = []
+    scripts = {}
+    rules = {}  # script key -> (sort key, UrlMatcher) of scripts with a URL pattern
+    for entry in entries:
+        item = entry.content_item
+        data = {
+            'id': item.id,
+            'title': item.title,
+            'type': item.content_type,
+        }
+        if item.content_type == 'video' and item.video_file:
+            try:
+                data['url'] = request.build_absolute_uri(item.video_file.url)
+            except ValueError:
+                logger.warning("Could not build URL for video file: %s", item.video_file)
+                continue
+            digest = digest_from_name(item.video_file.name)
+            if digest:
+                data['sha256'] = digest  # The URL never changes its content
+            try:
+                data['size'] = item.video_file.size  # Lets offline players detect replaced legacy files
+            except OSError:
+                pass
+            # Transcoded versions; the player picks one that fits its screen
+            data['renditions'] = [
+                {
+                    'url': request.build_absolute_uri(r.file.url),
+                    'width': r.width,
+                    'height': r.height,
+                    'bitrate': r.bitrate,
+                }
+                for r in item.ready_renditions if r.kind == VideoRendition.KIND_MP4
+            ]
+            hls = [r for r in item.ready_renditions if r.kind == VideoRendition.KIND_HLS]
+            if hls:
+                data['hls'] = request.build_absolute_uri(hls[0].file.url)
+        elif item.content_type == 'website' and item.url and item.duration:
+            data['url'] = item.url
+            data['duration'] = item.duration
+        else:
+            logger.warning("Skipping invalid playlist item: ID=%s", item.id)
+            continue
+
+        # Automation scripts linked to this content item (M2M, prefetched
+        # above), stored once per content hash however many items share them
+        data['script_keys'] = []
+        for s in item.enabled_scripts:
+            key = script_key(s)
+            scripts.setdefault(key, {'name': s.name, 'url_pattern': s.url_pattern or '', 'content': s.content})
+            data['script_keys'].append(key)
+            if s.url_regex:
+                rules[key] = ((s.order, s.name, key), UrlMatcher(s.url_host, s.url_regex))
+
+        playlist_items.append(data)
+
+    return {
+        'group_name': group.name,
+        'playlist': playlist_items,
+        'scripts': scripts,
+        'matcher': build_matcher_index(
+            (key, matcher) for key, (_, matcher) in sorted(rules.items(), key=lambda rule: rule[1][0])
+        ),
+        'show_status': group.show_status,
+    }
+
+
+def playlist_payload(snapshot, payload_format=1, known_scripts=()):
+    """Return the ``playlist`` (and for format 2 ``scripts``) part of the API response.
+
+    Format 1 repeats the full scripts in every item.  Format 2 sends every
+    script once, keyed by its content hash, and leaves out the scripts whose
+    keys are in ``known_scripts`` because the client already stores them.
+    Its ``matcher`` lists the compiled URL patterns of all scripts in
+    execution order, indexed by host (see ``matchers.build_matcher_index``).
+    """
+    if payload_format == 1:
+        playlist = []
+        for item in snapshot['playlist']:
+            data = {k: v for k, v in item.items() if k != 'script_keys'}
+            data['scripts'] = [snapshot['scripts'][key] for key in item['script_keys']]
+            playlist.append(data)
+        return {'playlist': playlist}
+
+    return {
+        'playlist': snapshot['playlist'],
+        'scripts': {key: script for key, script in snapshot['scripts'].items() if key not in known_scripts},
+        'matcher': snapshot['matcher'],
+    }
+
+
+# Playlist part of a snapshot for browsers without a group
+EMPTY_PLAYLIST = {'playlist': [], 'scripts': {}, 'matcher': build_matcher_index(())}
+
+
+def _snapshot_key(group_id, version, request):
+    base = hashlib.sha1(request.build_absolute_uri('/').encode()).hexdigest()[:12]
+    return SNAPSHOT_KEY.format(group_id=group_id, version=version, base=base)
+
+
+def _build_snapshot(group_id, version, request, key):
+    """Build and cache the snapshot of ``version``; ``None`` if the group does not exist."""
+    from .models import DisplayGroup
+
+    # A replica may not have the change behind a new version yet; caching its
+    # state under that version would serve the old playlist until the next change.
+    reads = primary_reads() if replica_may_lag(version_age(version)) else nullcontext()
+    with reads:
+        group = DisplayGroup.objects.filter(pk=group_id).first()
+        if group is None:
+            return None
+        snapshot = build_playlist_snapshot(group, request)
+    snapshot['version'] = version
+    get_cache().set(key, snapshot, timeout=settings.PLAYLIST_CACHE_TIMEOUT)
+    return snapshot
+
+
+def get_playlist_snapshot(group_id, request):
+    """Return the cached playlist snapshot of a group, building it on a miss.
+
+    Video URLs are absolute, so snapshots are additionally keyed by the base
+    URL the request was made against.  Returns ``None`` if the group does not
+    exist (anymore).
+    """
+    version = get_group_version(group_id)
+    key = _snapshot_key(group_id, version, request)
+    snapshot = get_cache().get(key)
+    if snapshot is not None:
+        SNAPSHOT_CACHE.labels(result='hit').inc()
+        return snapshot
+    SNAPSHOT_CACHE.labels(result='miss').inc()
+    return _build_snapshot(group_id, version, request, key)
+
+
+async def aget_playlist_snapshot(group_id, request, version=None):
+    """Async ``get_playlist_snapshot()``.
+
+    Hits are served with async cache calls.  Misses, once per version, build
+    the snapshot in a worker thread: it relies on prefetch_related, which
+    the async ORM of Django 4.2 cannot iterate.
+    """
+    version = version or await aget_group_version(group_id)
+    key = _snapshot_key(group_id, version, request)
+    snapshot = await get_cache().aget(key)
+    if snapshot is not None:
+        SNAPSHOT_CACHE.labels(result='hit').inc()
+        return snapshot
+    SNAPSHOT_CACHE.labels(result='miss').inc()
+    return await sync_to_async(_build_snapshot)(group_id, version, request, key)
@@ -0,0 +1,139 @@
+"""Default group, permissions and admin user.
+
+``provision()`` creates the "Content Managers" group with its permissions and
+the admin user from ``ADMIN_USERNAME``/``ADMIN_PASSWORD``.  It runs once per
+deploy (``python manage.py kiosk_provision``, the chart's init container)
+and records a fingerprint of the state it established in ProvisioningState:
+
+* a hash of the group name, the permission list, the admin username and an
+  HMAC of ``ADMIN_PASSWORD`` (the desired state), and
+* the admin user's password hash as stored in the database.
+
+``is_provisioned()`` compares both with a single query, so process startups
+(``KIOSK_PROVISION_ON_STARTUP``) skip the permission lookups and the PBKDF2
+run of ``check_password`` unless the deploy changed something or the admin
+password was changed in the database.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from django.db import transaction
+from django.db.models import Subquery
+from django.utils.crypto import salted_hmac
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'defaults'
+GROUP_NAME = "Content Managers"
+# (codename, model) of the permissions of the "Content Managers" group
+GROUP_PERMISSIONS = [
+    ('change_displaygroup', 'displaygroup'),  # To edit groups they manage (incl. playlist)
+    ('view_displaygroup', 'displaygroup'),    # To see groups they manage in admin lists
+    ('add_playlistentry', 'playlistentry'),
+    ('change_playlistentry', 'playlistentry'),
+    ('delete_playlistentry', 'playlistentry'),
+    ('view_playlistentry', 'playlistentry'),  # Needed for inline display
+    ('add_contentitem', 'contentitem'),
+    ('change_contentitem', 'contentitem'),
+    ('view_contentitem', 'contentitem'),
+    # ('delete_contentitem', 'contentitem'),  # Decide if they can delete shared content
+]
+
+
+def admin_credentials():
+    return os.environ.get('ADMIN_USERNAME', 'admin'), os.environ.get('ADMIN_PASSWORD')
+
+
+def desired_fingerprint():
+    """Hash of the state ``provision()`` establishes (never contains the password)."""
+    username, password = admin_credentials()
+    password_hmac = salted_hmac('kioskmanager.provisioning', password).hexdigest() if password else None
+    payload = json.dumps([GROUP_NAME, GROUP_PERMISSIONS, username, password_hmac])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_provisioned():
+    """Return True if ``provision()`` already established the desired state (one query)."""
+    from django.contrib.auth import get_user_model
+    from .models import ProvisioningState
+
+    username, password = admin_credentials()
+    state = ProvisioningState.objects.filter(key=STATE_KEY, fingerprint=desired_fingerprint())
+    if password:
+        # The admin password may have been changed in the admin since
+        User = get_user_model()
+        state = state.filter(admin_password=Subquery(
+            User.objects.filter(**{User.USERNAME_FIELD: username}).values('password')[:1]
+        ))
+    return state.exists()
+
+
+def ensure_provisioned():
+    if is_provisioned():
+        logger.debug("Default group and admin user are up to date.")
+        return False
+    provision()
+    return True
+
+
+def provision():
+    """Create or update the "Content Managers" group and the admin user.
+
+    Idempotent.  The fingerprint is only recorded if everything could be set
+    up, e.g. not before the migrations created all permissions.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Group, Permission
+    from .models import ProvisioningState
+
+    User = get_user_model()
+    complete = True
+    with transaction.atomic():
+        group, created = Group.objects.get_or_create(name=GROUP_NAME)
+        if created:
+            logger.info("Created group '%s'.", GROUP_NAME)
+
+        permissions = list(Permission.objects.filter(
+            content_type__app_label='kioskmanager',
+            codename__in=[codename for codename, _ in GROUP_PERMISSIONS],
+        ).select_related('content_type'))
+        found = {(p.codename, p.content_type.model) for p in permissions}
+        for codename, model in GROUP_PERMISSIONS:
+            if (codename, model) not in found:
+                logger.warning("Permission '%s' for model %s not found. Skipping. Was migrate run?", codename, model)
+                complete = False
+        group.permissions.set(permissions)
+        logger.info("Set/updated permissions for group '%s'.", GROUP_NAME)
+
+        username, password = admin_credentials()
+        admin_password = ''
+        if not password:
+            logger.warning("ADMIN_PASSWORD environment variable not set. Cannot create/update admin user.")
+        else:
+            user, created = User.objects.get_or_create(
+                **{User.USERNAME_FIELD: username},
+                defaults={'is_staff': True, 'is_superuser': True},
+            )
+            if created:
+                logger.info("Created admin user '%s'.", username)
+            update_fields = []
+            if not user.is_staff or not user.is_superuser:
+                user.is_staff = user.is_superuser = True
+                update_fields += ['is_staff', 'is_superuser']
+            # The password always matches the environment variable
+            if created or not user.check_password(password):
+                user.set_password(password)
+                update_fields.append('password')
+                logger.info("Password for admin user '%s' set from environment variable.", username)
+            if update_fields:
+                user.save(update_fields=update_fields)
+            admin_password = user.password
+
+        if complete:
+            ProvisioningState.objects.update_or_create(key=STATE_KEY, defaults={
+                'fingerprint': desired_fingerprint(),
+                'admin_password': admin_password,
+            })
+    return complete
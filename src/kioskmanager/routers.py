@@ -0,0 +1,269 @@
+"""Optional read replica for the kiosk polling path.
+
+With a ``replica`` database configured (``DATABASE_REPLICA_HOST``, or
+``DATABASE_REPLICA_NAME`` for a second SQLite file in development), the reads
+of the playlist API and of the fleet metrics go to the replica; everything
+else, and all writes, stays on ``default``:
+
+* Code opts in with ``replica_reads()`` (a context manager and decorator).
+  Without it, reads go to the primary.
+* Once a request wrote, its remaining reads go to the primary, and
+  ``replica_routing_middleware`` sets a cookie that pins the browser's next
+  requests to the primary for ``DATABASE_REPLICA_PIN_SECONDS``, so the admin
+  always reads its own writes.  Bookkeeping writes of the polling path
+  (heartbeats, browser registration) run in ``unpinned_writes()`` and pin
+  nothing.
+* The replication lag is measured at most every
+  ``DATABASE_REPLICA_LAG_CHECK_INTERVAL`` seconds per process.  While it
+  exceeds ``DATABASE_REPLICA_MAX_LAG``, or the replica is unreachable, reads
+  fall back to the primary.  A function decorated with ``replica_reads()``
+  whose replica read fails with a connection error is run once more against
+  the primary, and the replica is skipped until the next check.
+
+The replica alias mirrors ``default`` in tests (``TEST['MIRROR']``).
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, OperationalError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'kioskmanager_primary'
+# Errors of an unreachable or failing replica, retried on the primary
+REPLICA_ERRORS = (OperationalError, InterfaceError)
+
+# Seconds the replica is behind the primary, 0 if it is not a hot standby
+# (e.g. the test mirror).  NULL if nothing was replayed yet.
+POSTGRESQL_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+@dataclass
+class RoutingState:
+    use_replica: bool = False
+    pinned: bool = False  # The client wrote recently (pin cookie)
+    wrote: bool = False
+    pin_writes: bool = True  # False inside unpinned_writes()
+    used_replica: bool = False
+
+
+_routing = ContextVar('kioskmanager_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class ReplicaLag:
+    """Measures the replication lag, at most once per check interval."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self.lag = None  # Seconds, None if unknown or the replica is unreachable
+
+    def measure(self):
+        connection = connections[REPLICA_DB_ALIAS]
+        if connection.vendor != 'postgresql':
+            # Nothing to measure, e.g. two local SQLite files
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRESQL_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return None if lag is None else float(lag)
+
+    def acceptable(self):
+        """Return True if the replica may serve reads right now."""
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+                self._checked_at = now
+                try:
+                    lag = self.measure()
+                except DatabaseError as e:
+                    logger.warning("Read replica unavailable, reading from the primary: %s", e)
+                    lag = None
+                if lag is not None and lag > settings.DATABASE_REPLICA_MAX_LAG:
+                    logger.warning("Read replica is %.1fs behind, reading from the primary.", lag)
+                self.lag = lag
+            return self.lag is not None and self.lag <= settings.DATABASE_REPLICA_MAX_LAG
+
+    def failed(self, error):
+        """Read from the primary until the next check, after a failed replica read."""
+        logger.warning("Read replica failed, reading from the primary: %s", error)
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self.lag = None
+
+
+replica_lag = ReplicaLag()
+
+
+@contextmanager
+def _reads(use_replica):
+    state = _routing.get()
+    token = None
+    if state is None:
+        # Outside a request (management commands, tests without the middleware)
+        state = RoutingState()
+        token = _routing.set(state)
+    previous, state.use_replica = state.use_replica, use_replica
+    try:
+        yield state
+    finally:
+        state.use_replica = previous
+        if token is not None:
+            _routing.reset(token)
+
+
+class _ReplicaReads:
+    """``replica_reads()``: a context manager, and a decorator that retries on the primary."""
+
+    def __enter__(self):
+        self._reads = _reads(True)
+        return self._reads.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._reads.__exit__(*exc_info)
+
+    def __call__(self, func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with _reads(True) as state:
+                    state.used_replica = False
+                    try:
+                        return await func(*args, **kwargs)
+                    except REPLICA_ERRORS as e:
+                        if not state.used_replica:
+                            raise
+                        replica_lag.failed(e)
+                with _reads(False):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _reads(True) as state:
+                    state.used_replica = False
+                    try:
+                        return func(*args, **kwargs)
+                    except REPLICA_ERRORS as e:
+                        if not state.used_replica:
+                            raise
+                        replica_lag.failed(e)
+                with _reads(False):
+                    return func(*args, **kwargs)
+        return wrapper
+
+
+def replica_reads():
+    """Send the reads inside the block to the replica, if it is configured and in sync.
+
+    As a decorator, the function runs once more against the primary if a
+    replica read fails with a connection error, so it must be safe to repeat.
+    """
+    return _ReplicaReads()
+
+
+def primary_reads():
+    """Send the reads inside the block to the primary, e.g. within ``replica_reads()``."""
+    return _reads(False)
+
+
+@contextmanager
+def unpinned_writes():
+    """Writes inside the block neither pin the client to the primary nor its later reads.
+
+    For bookkeeping writes that the client never reads back, e.g. heartbeats.
+    """
+    state = _routing.get()
+    if state is None:
+        yield
+        return
+    previous, state.pin_writes = state.pin_writes, False
+    try:
+        yield
+    finally:
+        state.pin_writes = previous
+
+
+def replica_may_lag(seconds):
+    """Return True if a commit ``seconds`` ago may not have reached a replica in use yet."""
+    return seconds < settings.DATABASE_REPLICA_MAX_LAG + settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+
+
+class ReplicaRouter:
+    """Routes reads inside ``replica_reads()`` to the replica and everything else to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.use_replica or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if not replica_configured() or not replica_lag.acceptable():
+            return DEFAULT_DB_ALIAS
+        state.used_replica = True
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and state.pin_writes:
+            state.wrote = True  # Read our own writes for the rest of the request
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}:
+            return True
+        return None
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Tracks writes per request and pins clients that wrote to the primary for a while."""
+
+    def begin(request):
+        return _routing.set(RoutingState(pinned=PIN_COOKIE in request.COOKIES))
+
+    def end(token):
+        state = _routing.get()
+        _routing.reset(token)
+        return state
+
+    def pin(state, response):
+        if state.wrote and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = begin(request)
+            try:
+                response = await get_response(request)
+            finally:
+                state = end(token)
+            return pin(state, response)
+    else:
+        def middleware(request):
+            token = begin(request)
+            try:
+                response = get_response(request)
+            finally:
+                state = end(token)
+            return pin(state, response)
+    return middleware
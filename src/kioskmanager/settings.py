@@ -60,6 +60,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'kioskmanager.routers.replica_routing_middleware',  # Outermost, to see the session writes as well
     "django.middleware.locale.LocaleMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,6 +91,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'kioskmanager.wsgi.application'
+ASGI_APPLICATION = 'kioskmanager.asgi.application'
 
 
 # Database
@@ -119,6 +121,115 @@ else:
         }
     }
 
+# Optional read replica for the playlist API and the fleet metrics (see routers.py).
+# Set DATABASE_REPLICA_HOST (PostgreSQL hot standby, same credentials) or, with
+# DJANGO_DEBUG, DATABASE_REPLICA_NAME (a second SQLite file). Reads fall back to
+# the primary while the replica is more than DATABASE_REPLICA_MAX_LAG seconds
+# behind; clients that wrote are pinned to the primary for DATABASE_REPLICA_PIN_SECONDS.
+if DEBUG and os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': os.environ['DATABASE_REPLICA_NAME']}
+elif not DEBUG and os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DATABASE_REPLICA_HOST'],
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': {'connect_timeout': 3},  # Fall back to the primary quickly if it is down
+    }
+if 'replica' in DATABASES:
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['kioskmanager.routers.ReplicaRouter']
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', '5'))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('DATABASE_REPLICA_LAG_CHECK_INTERVAL', '5'))
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', '15'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The default local-memory cache is only shared within one process. When running
+# several gunicorn workers, use a shared backend, e.g.
+#   CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache CACHE_LOCATION=/tmp/kioskmanager-cache
+#   CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache CACHE_LOCATION=kioskmanager_cache (run createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'kioskmanager'),
+    }
+}
+
+# Cache alias and lifetime (seconds) of the per-group playlist snapshots.
+# Snapshots are invalidated by signals, the timeout only bounds memory usage.
+PLAYLIST_CACHE_ALIAS = os.environ.get('PLAYLIST_CACHE_ALIAS', 'default')
+PLAYLIST_CACHE_TIMEOUT = int(os.environ.get('PLAYLIST_CACHE_TIMEOUT', str(24 * 60 * 60)))
+
+# Serve /api/playlist/ with the async view (async ORM and cache calls). Only pays off
+# under an ASGI server; the container image, which runs one, sets it to True. Under
+# WSGI (runserver, wsgi.py) the async view would need an event loop per request.
+PLAYLIST_API_ASYNC = os.environ.get('PLAYLIST_API_ASYNC', 'False') == 'True'
+
+# Playlist push stream (/api/playlist/stream/, ASGI only). All values in seconds:
+# how often each group's version is checked, the keep-alive comment interval,
+# the maximum stream lifetime before clients reconnect (resuming with Last-Event-ID,
+# so a short lifetime only costs a reconnect), and the client retry delay.
+PLAYLIST_STREAM_POLL_INTERVAL = float(os.environ.get('PLAYLIST_STREAM_POLL_INTERVAL', '2'))
+PLAYLIST_STREAM_KEEPALIVE = float(os.environ.get('PLAYLIST_STREAM_KEEPALIVE', '15'))
+PLAYLIST_STREAM_MAX_AGE = float(os.environ.get('PLAYLIST_STREAM_MAX_AGE', '60'))
+PLAYLIST_STREAM_RETRY = float(os.environ.get('PLAYLIST_STREAM_RETRY', '5'))
+
+# Browser.last_seen heartbeats are buffered per worker process and written in
+# one bulk UPDATE every HEARTBEAT_FLUSH_INTERVAL seconds (and on shutdown).
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', '60'))
+HEARTBEAT_FLUSH_BATCH_SIZE = int(os.environ.get('HEARTBEAT_FLUSH_BATCH_SIZE', '500'))
+
+# Prometheus metrics at /metrics. Scrapers send "Authorization: Bearer <METRICS_TOKEN>";
+# without a token the endpoint is only served with DEBUG. A browser counts as online if it polled
+# within METRICS_ONLINE_THRESHOLD seconds (mind HEARTBEAT_FLUSH_INTERVAL).
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ONLINE_THRESHOLD = int(os.environ.get('METRICS_ONLINE_THRESHOLD', '180'))
+
+# Video transcoding (kiosk_transcode_worker, see transcode.py). Uploaded videos are
+# converted to H.264/AAC MP4 renditions, given as "<height>:<video kbit/s>" pairs;
+# renditions larger than the source are skipped. VIDEO_HLS_ENABLED additionally
+# builds an HLS ladder from the same renditions.
+VIDEO_TRANSCODE_ENABLED = os.environ.get('VIDEO_TRANSCODE_ENABLED', 'True') == 'True'
+VIDEO_RENDITIONS = [
+    tuple(int(value) for value in spec.split(':'))
+    for spec in os.environ.get('VIDEO_RENDITIONS', '1080:5000,720:2800,480:1200').split(',')
+    if spec.strip()
+]
+VIDEO_HLS_ENABLED = os.environ.get('VIDEO_HLS_ENABLED', 'False') == 'True'
+VIDEO_TRANSCODE_TIMEOUT = int(os.environ.get('VIDEO_TRANSCODE_TIMEOUT', str(2 * 60 * 60)))  # Seconds per ffmpeg call
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+# Player (/play/): the next item is loaded into a hidden second <video>/<iframe>
+# PLAYER_PRELOAD_LEAD_SECONDS before the current one ends and then swapped in.
+# Videos larger than PLAYER_PRELOAD_MAX_MB are only buffered partially ahead of
+# time, to stay within the memory and bandwidth of weak kiosk hardware.
+PLAYER_PRELOAD_LEAD_SECONDS = int(os.environ.get('PLAYER_PRELOAD_LEAD_SECONDS', '15'))
+PLAYER_PRELOAD_MAX_MB = int(os.environ.get('PLAYER_PRELOAD_MAX_MB', '200'))
+PLAYER_PRELOAD_WEBSITES = os.environ.get('PLAYER_PRELOAD_WEBSITES', 'True') == 'True'
+
+# Site-local edge relays (python manage.py kiosk_edge) sync through /api/edge/sync/
+# with "Authorization: Bearer <EDGE_TOKEN>"; the endpoint is disabled while unset.
+EDGE_TOKEN = os.environ.get('EDGE_TOKEN', '')
+
+# /readyz/ runs the health checks at most once per HEALTH_READY_CACHE_TTL seconds
+# per process; /livez/ never touches the database (see health.py).
+HEALTH_READY_CACHE_TTL = float(os.environ.get('HEALTH_READY_CACHE_TTL', '10'))
+
+# Default group and admin user (see provisioning.py). Deployments that run
+# "python manage.py kiosk_provision" once per deploy can switch the check at
+# process startup off; it costs one query when nothing changed.
+KIOSK_PROVISION_ON_STARTUP = os.environ.get('KIOSK_PROVISION_ON_STARTUP', 'True') == 'True'
+
+# Resumable chunked uploads of video files (/api/uploads/, used by the ContentItem admin).
+# Partial uploads are kept in UPLOAD_TEMP_DIR, which should be on the same volume as
+# the media files so that completed uploads are moved instead of copied.
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(50 * 1024 ** 3)))
+UPLOAD_SESSION_MAX_AGE = int(os.environ.get('UPLOAD_SESSION_MAX_AGE', str(2 * 24 * 60 * 60)))  # Seconds
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -175,6 +286,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Media files (uploaded content)
 MEDIA_URL = '/'  # URL to access media files
 MEDIA_ROOT = BASE_DIR  # Directory where media files are stored
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', str(MEDIA_ROOT / 'content' / '.uploads'))
+
+# How /content/ files are sent (see media.py): 'django' streams them itself,
+# 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) only answer
+# with headers and let the web server send the bytes.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django').lower()
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 30 * 24 * 3600))  # Seconds, for mutable files
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')  # Directory where static files are collected
 
@@ -0,0 +1,122 @@
+"""Signal handlers that invalidate cached playlist snapshots.
+
+Anything that ends up in a group's playlist payload bumps the playlist
+version of every affected group (see ``playlist.py``).  Uploaded videos
+are queued for transcoding (see ``transcode.py``) and their files are
+released once no ContentItem references them anymore (see
+``storage.py``).  Connected in
+``KioskmanagerConfig.ready()``.
+"""
+import os
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import AutomationScript, ContentItem, DisplayGroup, PlaylistEntry, UploadSession, VideoRendition
+from .playlist import bump_group_versions
+from .storage import delete_unreferenced_video
+from .transcode import delete_rendition_files, enqueue_renditions
+
+ScriptItemLink = AutomationScript.content_items.through
+
+
+def groups_for_content_items(content_item_ids):
+    return set(
+        PlaylistEntry.objects.filter(content_item_id__in=content_item_ids)
+                             .values_list('group_id', flat=True)
+                             .distinct()
+    )
+
+
+def groups_for_script(script):
+    return set(
+        PlaylistEntry.objects.filter(content_item__automation_scripts=script)
+                             .values_list('group_id', flat=True)
+                             .distinct()
+    )
+
+
+@receiver(post_save, sender=PlaylistEntry)
+@receiver(post_delete, sender=PlaylistEntry)
+def playlist_entry_changed(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_group_id', None)
+    bump_group_versions([instance.group_id, previous])
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=DisplayGroup)
+@receiver(post_delete, sender=DisplayGroup)
+def display_group_changed(sender, instance, **kwargs):
+    bump_group_versions([instance.pk])
+
+
+@receiver(post_save, sender=ContentItem)
+def content_item_saved(sender, instance, **kwargs):
+    bump_group_versions(groups_for_content_items([instance.pk]))
+
+
+@receiver(post_save, sender=ContentItem)
+def content_item_video_changed(sender, instance, **kwargs):
+    enqueue_renditions(instance)
+    previous = getattr(instance, '_loaded_video_name', '')
+    current = instance.video_file.name if instance.video_file else ''
+    if previous != current:
+        delete_unreferenced_video(previous)
+    instance._loaded_video_name = current
+
+
+@receiver(post_delete, sender=VideoRendition)
+def video_rendition_deleted(sender, instance, **kwargs):
+    delete_rendition_files(instance)
+    if instance.status == VideoRendition.STATUS_DONE:
+        bump_group_versions(groups_for_content_items([instance.content_item_id]))
+
+
+@receiver(pre_delete, sender=ContentItem)
+def content_item_deleting(sender, instance, **kwargs):
+    # Collect before the cascade removes the item's playlist entries.
+    instance._kiosk_affected_groups = groups_for_content_items([instance.pk])
+
+
+@receiver(post_delete, sender=ContentItem)
+def content_item_deleted(sender, instance, **kwargs):
+    bump_group_versions(getattr(instance, '_kiosk_affected_groups', ()))
+    if instance.video_file:
+        delete_unreferenced_video(instance.video_file.name)
+
+
+@receiver(post_save, sender=AutomationScript)
+def automation_script_saved(sender, instance, **kwargs):
+    bump_group_versions(groups_for_script(instance))
+
+
+@receiver(pre_delete, sender=AutomationScript)
+def automation_script_deleting(sender, instance, **kwargs):
+    # The M2M links are gone by the time post_delete fires, so collect now.
+    instance._kiosk_affected_groups = groups_for_script(instance)
+
+
+@receiver(post_delete, sender=AutomationScript)
+def automation_script_deleted(sender, instance, **kwargs):
+    bump_group_versions(getattr(instance, '_kiosk_affected_groups', ()))
+
+
+@receiver(m2m_changed, sender=ScriptItemLink)
+def automation_script_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Handle ``script.content_items`` changes (and the reverse accessor)."""
+    if action in ('post_add', 'post_remove'):
+        item_ids = [instance.pk] if reverse else pk_set
+        bump_group_versions(groups_for_content_items(item_ids or ()))
+    elif action == 'pre_clear':
+        if reverse:
+            bump_group_versions(groups_for_content_items([instance.pk]))
+        else:
+            bump_group_versions(groups_for_script(instance))
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_deleted(sender, instance, **kwargs):
+    try:
+        os.remove(instance.temp_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,135 @@
+// Resumable, chunked upload of the ContentItem video file (see kioskmanager/uploads.py).
+// The selected file is uploaded in chunks right away; the form then only submits the
+// id of the completed upload. Interrupted uploads resume from the last acknowledged
+// chunk, also after a page reload when the same file is selected again.
+(function() {
+    'use strict';
+
+    const API_ENDPOINT = '/api/uploads/';
+    const MAX_RETRY_DELAY_MS = 30000;
+
+    document.addEventListener('DOMContentLoaded', function() {
+        const fileInput = document.getElementById('id_video_file');
+        const uploadInput = document.getElementById('id_uploaded_video');
+        if (!fileInput || !uploadInput || !window.fetch || !Blob.prototype.slice) {
+            return; // Fall back to the regular multipart upload
+        }
+        const form = fileInput.form;
+        const csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+        const status = document.createElement('div');
+        status.className = 'chunked-upload-status';
+        fileInput.insertAdjacentElement('afterend', status);
+        let uploading = false;
+
+        fileInput.addEventListener('change', function() {
+            if (fileInput.files.length) {
+                uploadFile(fileInput.files[0]);
+            }
+        });
+
+        form.addEventListener('submit', function(event) {
+            if (uploading) {
+                event.preventDefault();
+                alert('Please wait until the video upload has finished.');
+            }
+        });
+
+        function showStatus(message) {
+            status.textContent = message;
+        }
+
+        async function api(url, options = {}) {
+            const headers = Object.assign({'X-CSRFToken': csrfToken}, options.headers || {});
+            const response = await fetch(url, Object.assign({}, options, {headers, credentials: 'same-origin'}));
+            const data = await response.json().catch(() => ({}));
+            return {response, data};
+        }
+
+        async function sha256(blob) {
+            if (!window.crypto || !crypto.subtle) return null; // Only available on https/localhost
+            const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+            return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        }
+
+        async function startOrResume(file, storageKey) {
+            const knownId = localStorage.getItem(storageKey);
+            if (knownId) {
+                const {response, data} = await api(`${API_ENDPOINT}${knownId}/`);
+                if (response.ok) return data;
+                localStorage.removeItem(storageKey);
+            }
+            const {response, data} = await api(API_ENDPOINT, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size}),
+            });
+            if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+            localStorage.setItem(storageKey, data.id);
+            return data;
+        }
+
+        async function uploadFile(file) {
+            const storageKey = `kioskmanager.upload:${file.name}:${file.size}:${file.lastModified}`;
+            uploading = true;
+            uploadInput.value = '';
+            let retryDelay = 1000;
+            try {
+                let session = await startOrResume(file, storageKey);
+                let offset = session.offset;
+                if (offset > 0 && !session.complete) {
+                    showStatus(`Resuming upload at ${Math.floor(offset / file.size * 100)}%`);
+                }
+
+                while (!session.complete && offset < file.size) {
+                    const chunk = file.slice(offset, Math.min(offset + session.chunk_size, file.size));
+                    const headers = {
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': `bytes ${offset}-${offset + chunk.size - 1}/${file.size}`,
+                    };
+                    const checksum = await sha256(chunk);
+                    if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+                    let result;
+                    try {
+                        result = await api(`${API_ENDPOINT}${session.id}/`, {method: 'PUT', headers, body: chunk});
+                    } catch (error) {
+                        // Network hiccup: retry the same chunk with backoff
+                        showStatus(`Connection lost, retrying in ${retryDelay / 1000}s ...`);
+                        await new Promise(resolve => setTimeout(resolve, retryDelay));
+                        retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY_MS);
+                        continue;
+                    }
+                    const {response, data} = result;
+                    if (response.ok || response.status === 409 || response.status === 422) {
+                        offset = data.offset; // Acknowledged offset, also where to resume after a conflict
+                        retryDelay = 1000;
+                    } else if (response.status >= 500) {
+                        await new Promise(resolve => setTimeout(resolve, retryDelay));
+                        retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY_MS);
+                    } else {
+                        throw new Error(data.error || `HTTP ${response.status}`);
+                    }
+                    showStatus(`Uploading ${file.name}: ${Math.floor(offset / file.size * 100)}%`);
+                }
+
+                if (!session.complete) {
+                    showStatus(`Finishing upload of ${file.name} ...`);
+                    const {response, data} = await api(`${API_ENDPOINT}${session.id}/complete/`, {method: 'POST'});
+                    if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+                    session = data;
+                }
+
+                uploadInput.value = session.id;
+                fileInput.value = ''; // Don't send the file again with the form
+                localStorage.removeItem(storageKey);
+                showStatus(`Uploaded ${file.name}. Save to use it.`);
+            } catch (error) {
+                console.error('Chunked upload failed:', error);
+                showStatus(`Upload failed: ${error.message}. Select the file again to resume.`);
+                fileInput.value = '';
+            } finally {
+                uploading = false;
+            }
+        }
+    });
+})();
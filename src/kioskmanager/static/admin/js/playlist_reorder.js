@@ -0,0 +1,87 @@
+// Drag-and-drop reordering of the playlist on the DisplayGroup change page.
+// Saved entries get a drag handle; "Save order" submits the order of all
+// entries in one request to DisplayGroupAdmin.reorder_view, which renumbers
+// them atomically. Editing the order fields and saving the form still works.
+(function() {
+    'use strict';
+
+    const PREFIX = 'playlist_entries';
+
+    document.addEventListener('DOMContentLoaded', function() {
+        const group = document.getElementById(`${PREFIX}-group`);
+        if (!group || !window.fetch) return;
+        const form = group.closest('form');
+        const csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+        const rows = Array.from(group.querySelectorAll('tbody.has_original')).filter(entryId);
+        if (rows.length < 2) return;
+
+        const toolbar = document.createElement('div');
+        toolbar.className = 'playlist-reorder-toolbar';
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.textContent = 'Save order';
+        button.disabled = true;
+        const status = document.createElement('span');
+        status.textContent = 'Drag the entries by their handle to reorder the playlist.';
+        toolbar.append(button, status);
+        rows[0].closest('table').parentElement.insertAdjacentElement('beforebegin', toolbar);
+
+        let dragged = null;
+        for (const row of rows) {
+            const handle = document.createElement('span');
+            handle.className = 'playlist-reorder-handle';
+            handle.textContent = '⠿';
+            handle.title = 'Drag to reorder';
+            row.querySelector('td').prepend(handle);
+
+            // Only the handle starts a drag, so the fields stay usable
+            handle.addEventListener('mousedown', () => { row.draggable = true; });
+            row.addEventListener('dragstart', (event) => {
+                dragged = row;
+                row.classList.add('playlist-reorder-dragging');
+                event.dataTransfer.effectAllowed = 'move';
+                event.dataTransfer.setData('text/plain', entryId(row));
+            });
+            row.addEventListener('dragend', () => {
+                row.draggable = false;
+                row.classList.remove('playlist-reorder-dragging');
+                dragged = null;
+            });
+            row.addEventListener('dragover', (event) => {
+                if (!dragged || dragged === row) return;
+                event.preventDefault();
+                const rect = row.getBoundingClientRect();
+                const after = event.clientY > rect.top + rect.height / 2;
+                row.parentNode.insertBefore(dragged, after ? row.nextSibling : row);
+                button.disabled = false;
+                status.textContent = 'The new order is not saved yet.';
+            });
+        }
+
+        button.addEventListener('click', async function() {
+            const entries = Array.from(group.querySelectorAll('tbody.has_original')).map(entryId).filter(Boolean);
+            button.disabled = true;
+            status.textContent = 'Saving…';
+            try {
+                const response = await fetch(new URL('../reorder/', window.location.href), {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+                    body: JSON.stringify({entries}),
+                });
+                const data = await response.json().catch(() => ({}));
+                if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+                // The order fields of the form are outdated now
+                window.location.reload();
+            } catch (error) {
+                status.textContent = `Could not save the order: ${error.message}`;
+                button.disabled = false;
+            }
+        });
+    });
+
+    function entryId(row) {
+        const input = row.querySelector(`input[name^="${PREFIX}-"][name$="-id"]`);
+        return input && input.value;
+    }
+})();
@@ -0,0 +1,130 @@
+"""Content-addressed storage for uploaded videos.
+
+Video files are stored under the sha256 of their content, sharded by the
+first two byte pairs of the digest::
+
+    content/videos/sha256/ab/cd/abcd...ef.mp4
+
+Uploading the same clip twice stores it once, and a URL always refers to
+the same bytes, so clients and nginx may cache it forever.  Several
+ContentItems can share a blob; it is only deleted when no ContentItem
+(and no pending upload) references it anymore.
+
+Storing a blob and deleting it are serialized per file name with
+``lock_video()``, held until the transaction ends: an upload of identical
+content that commits its reference concurrently either keeps the blob from
+being deleted or writes it anew.
+"""
+import hashlib
+import logging
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+VIDEO_PREFIX = 'content/videos'
+HASHED_NAME = re.compile(r'/sha256/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.[\w]+)?$')
+
+
+def lock_video(name):
+    """Lock the blob ``name`` until the surrounding transaction ends.
+
+    Uses a PostgreSQL advisory lock; other backends (SQLite in development)
+    don't lock.  Outside a transaction the lock is released right away.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+def digest_from_name(name):
+    """Return the sha256 of a content-addressed file name (None for legacy names)."""
+    match = HASHED_NAME.search(name or '')
+    return match['digest'] if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after the sha256 of their content."""
+
+    def __init__(self, prefix=VIDEO_PREFIX, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+
+    def hashed_name(self, digest, extension=''):
+        return f'{self.prefix}/sha256/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+    @staticmethod
+    def digest(content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+        return sha256.hexdigest()
+
+    def _save(self, name, content):
+        # Only the extension of the uploaded name is kept
+        hashed = self.hashed_name(self.digest(content), os.path.splitext(name)[1])
+        lock_video(hashed)  # Until the ContentItem is committed
+        if not self.exists(hashed):
+            # Write under a unique name first; a concurrent upload of the same
+            # content is replaced by identical bytes.
+            temp = super()._save(f'{hashed}.{uuid.uuid4().hex}.part', content)
+            os.replace(self.path(temp), self.path(hashed))
+        return hashed
+
+    def adopt(self, path, digest, extension=''):
+        """Move a local file with a known sha256 into the store and return its name.
+
+        Call it in the transaction that saves the reference to the name.
+        """
+        name = self.hashed_name(digest, extension)
+        lock_video(name)
+        if self.exists(name):
+            os.remove(path)
+            return name
+        try:
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            os.replace(path, self.path(name))  # Same volume: no copy
+            if self.file_permissions_mode is not None:
+                os.chmod(self.path(name), self.file_permissions_mode)
+        except OSError:
+            with open(path, 'rb') as f:
+                name = self.save(name, File(f))
+            os.remove(path)
+        return name
+
+
+video_storage = ContentAddressedStorage()
+
+
+def delete_unreferenced_video(name):
+    """Delete a video blob after the commit unless it is still referenced."""
+    if name:
+        # Checked after the commit, so a rolled back delete keeps its file
+        transaction.on_commit(lambda: _delete_if_unreferenced(name))
+
+
+def _delete_if_unreferenced(name):
+    from .models import ContentItem, UploadSession
+
+    with transaction.atomic():
+        # Wait for concurrent uploads of the same content, then check again
+        lock_video(name)
+        if ContentItem.objects.filter(video_file=name).exists() or UploadSession.objects.filter(file_name=name).exists():
+            return False
+        storage = ContentItem._meta.get_field('video_file').storage
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning("Could not delete video file %s: %s", name, e)
+            return False
+    logger.info("Deleted video file %s", name)
+    return True
@@ -0,0 +1,208 @@
+"""Server-push of playlist changes (Server-Sent Events).
+
+Browsers subscribe to ``/api/playlist/stream/`` and stay idle until the
+playlist version of their group changes.  Only available under ASGI
+(``kioskmanager/asgi.py``); under WSGI the endpoint answers 501 and clients
+keep polling.
+
+Fan-out is per group, not per subscriber: one watcher task per group with
+subscribers compares the cached playlist version every
+``PLAYLIST_STREAM_POLL_INTERVAL`` seconds (a cache read, no database
+access) and loads the new snapshot once for all subscribers of that group.
+
+Django 4.2 stops reading from the ASGI connection once the request body is
+read, and uvicorn silently drops the frames sent after the client left, so
+``CancelOnDisconnect`` (installed in ``asgi.py``) watches the stream's
+connection and cancels it when the client disconnects.  Streams also end
+after ``PLAYLIST_STREAM_MAX_AGE``; clients reconnect with ``Last-Event-ID``.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .playlist import EMPTY_PLAYLIST, get_group_version, get_playlist_snapshot, playlist_payload
+
+logger = logging.getLogger(__name__)
+
+
+class GroupChannel:
+    """Subscribers of one DisplayGroup and the watcher that wakes them up."""
+
+    def __init__(self, broadcaster, group_id):
+        self.broadcaster = broadcaster
+        self.group_id = group_id
+        self.version = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+        self._snapshots = {}  # base URL -> snapshot of self.version
+        self._snapshot_lock = asyncio.Lock()
+
+    async def watch(self):
+        interval = settings.PLAYLIST_STREAM_POLL_INTERVAL
+        while self.subscribers:
+            try:
+                version = await sync_to_async(get_group_version, thread_sensitive=False)(self.group_id)
+            except Exception as e:
+                logger.warning("Could not read playlist version of group %s: %s", self.group_id, e)
+            else:
+                if version != self.version:
+                    async with self.changed:
+                        self.version = version
+                        self._snapshots = {}
+                        self.changed.notify_all()
+            await asyncio.sleep(interval)
+        self.broadcaster.discard(self)
+
+    async def snapshot(self, request):
+        """Return the snapshot of the current version, loaded once per base URL."""
+        base = request.build_absolute_uri('/')
+        async with self._snapshot_lock:
+            snapshot = self._snapshots.get(base)
+            if snapshot is None:
+                snapshot = await sync_to_async(get_playlist_snapshot)(self.group_id, request)
+                if snapshot is not None:
+                    self._snapshots[base] = snapshot
+            return snapshot
+
+
+class PlaylistBroadcaster:
+    """Process-wide registry of GroupChannels."""
+
+    def __init__(self):
+        self._channels = {}
+
+    def join(self, group_id):
+        channel = self._channels.get(group_id)
+        if channel is None:
+            # The watcher reads the initial version on its first iteration
+            channel = self._channels[group_id] = GroupChannel(self, group_id)
+        channel.subscribers += 1
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.ensure_future(channel.watch())
+        return channel
+
+    def leave(self, channel):
+        channel.subscribers -= 1
+
+    def discard(self, channel):
+        if not channel.subscribers and self._channels.get(channel.group_id) is channel:
+            del self._channels[channel.group_id]
+
+
+broadcaster = PlaylistBroadcaster()
+
+
+class CancelOnDisconnect:
+    """ASGI middleware cancelling requests to ``path`` when the client disconnects."""
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+        disconnected = False
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] != 'http.request' or not message.get('more_body'):
+                body_read.set()
+            return message
+
+        async def watch():
+            nonlocal disconnected
+            await body_read.wait()  # Django has read the request; the connection is ours
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected = True
+            request.cancel()
+
+        request = asyncio.ensure_future(self.app(scope, receive_body, send))
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await request
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            watcher.cancel()
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def playlist_events(request, browser_id, group_id, last_etag, etag_for, payload_format=1, known_scripts=()):
+    """Yield SSE frames for one subscriber until ``PLAYLIST_STREAM_MAX_AGE``.
+
+    The stream ends after the maximum age so that clients reconnect and a
+    changed group assignment of the browser is picked up.  With payload
+    format 2 every script is sent at most once per connection.
+    """
+    known_scripts = set(known_scripts)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.PLAYLIST_STREAM_MAX_AGE
+    keepalive = settings.PLAYLIST_STREAM_KEEPALIVE
+
+    # Reconnect after the stream ends or drops (milliseconds)
+    yield f"retry: {int(settings.PLAYLIST_STREAM_RETRY * 1000)}\n\n"
+
+    if not group_id:
+        # Nothing to watch; the client reconnects after the stream ended
+        # and picks up a group assignment then.
+        if last_etag != etag_for(None, None):
+            data = {'browser_id': browser_id, 'format': payload_format, 'group_name': None, 'show_status': True}
+            data.update(playlist_payload(EMPTY_PLAYLIST, payload_format))
+            yield format_event('playlist', data, etag_for(None, None))
+        while loop.time() < deadline:
+            await asyncio.sleep(min(keepalive, max(0, deadline - loop.time())))
+            yield ": keepalive\n\n"
+        return
+
+    channel = broadcaster.join(group_id)
+    try:
+        sent_version = None
+        while loop.time() < deadline:
+            version = channel.version
+            if version is not None and version != sent_version:
+                sent_version = version
+                etag = etag_for(group_id, version)
+                if etag != last_etag:
+                    snapshot = await channel.snapshot(request)
+                    if snapshot is None:
+                        return  # Group was deleted – reconnect to pick up the new state
+                    last_etag = etag_for(group_id, snapshot['version'])
+                    data = {
+                        'browser_id': browser_id,
+                        'format': payload_format,
+                        'group_name': snapshot['group_name'],
+                        'show_status': snapshot['show_status'],
+                    }
+                    data.update(playlist_payload(snapshot, payload_format, known_scripts))
+                    known_scripts.update(data.get('scripts', ()))
+                    yield format_event('playlist', data, last_etag)
+                continue
+
+            timeout = min(keepalive, max(0, deadline - loop.time()))
+            try:
+                async with channel.changed:
+                    if channel.version == sent_version:
+                        await asyncio.wait_for(channel.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    except (asyncio.CancelledError, GeneratorExit):
+        logger.debug("Playlist stream of browser %s closed by the client.", browser_id)
+        raise
+    finally:
+        broadcaster.leave(channel)
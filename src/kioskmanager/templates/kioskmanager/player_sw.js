@@ -0,0 +1,158 @@
+// Service Worker of the kiosk player (/play/): keeps the player running offline.
+//
+// * The player page and the last good playlist response are cached, so a kiosk
+//   keeps playing when the uplink drops (network first, cache as fallback).
+// * Videos are downloaded once into Cache Storage when the player sends its
+//   asset list ('sync' message) and are then played from the cache, including
+//   Range requests. An asset is only downloaded again when its version (content
+//   hash, or size for older uploads) changes; assets that are no longer in the
+//   playlist are evicted.
+'use strict';
+
+const CACHE_VERSION = 'v1';
+const PAGE_CACHE = `kiosk-page-${CACHE_VERSION}`;
+const MEDIA_CACHE = `kiosk-media-${CACHE_VERSION}`;
+const VERSION_HEADER = 'X-Kiosk-Asset-Version';
+const PLAYLIST_PATH = '/api/playlist/';
+const MEDIA_PATH = '/content/';
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const current = [PAGE_CACHE, MEDIA_CACHE];
+        for (const name of await caches.keys()) {
+            if (name.startsWith('kiosk-') && !current.includes(name)) await caches.delete(name);
+        }
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (request.mode === 'navigate' && url.pathname === '/play/') {
+        event.respondWith(networkFirst(request, url.pathname));
+    } else if (url.pathname === PLAYLIST_PATH) {
+        event.respondWith(networkFirst(request, PLAYLIST_PATH));
+    } else if (url.pathname.startsWith(MEDIA_PATH)) {
+        event.respondWith(fromMediaCache(request));
+    }
+});
+
+// Serve from the network and remember the last good response; fall back to it when offline.
+async function networkFirst(request, cacheKey) {
+    const cache = await caches.open(PAGE_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.status === 200) await cache.put(cacheKey, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(cacheKey, {ignoreVary: true});
+        if (!cached) throw error;
+        const headers = new Headers(cached.headers);
+        headers.set('X-Kiosk-Offline', '1');
+        return new Response(cached.body, {status: 200, headers});
+    }
+}
+
+async function fromMediaCache(request) {
+    const cache = await caches.open(MEDIA_CACHE);
+    const cached = await cache.match(request.url, {ignoreVary: true});
+    if (!cached) return fetch(request);
+    const range = request.headers.get('Range');
+    if (!range) return cached;
+    return rangeResponse(cached, range);
+}
+
+// Video elements request byte ranges; answer them by slicing the cached body.
+async function rangeResponse(cached, range) {
+    const blob = await cached.blob();
+    const size = blob.size;
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    let start = 0;
+    let end = size - 1;
+    if (match && match[1]) {
+        start = Number(match[1]);
+        if (match[2]) end = Math.min(Number(match[2]), size - 1);
+    } else if (match && match[2]) {
+        start = Math.max(size - Number(match[2]), 0);
+    }
+    if (start >= size || end < start) {
+        return new Response(null, {status: 416, headers: {'Content-Range': `bytes */${size}`}});
+    }
+    return new Response(blob.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Content-Type': cached.headers.get('Content-Type') || 'application/octet-stream',
+            'Content-Range': `bytes ${start}-${end}/${size}`,
+            'Content-Length': String(end - start + 1),
+            'Accept-Ranges': 'bytes',
+        },
+    });
+}
+
+// --- Delta sync of the playlist's assets ---
+let syncRunning = false;
+let pendingAssets = null; // Newest asset list received while a sync was running
+
+self.addEventListener('message', (event) => {
+    if (!event.data || event.data.type !== 'sync') return;
+    pendingAssets = event.data.assets || [];
+    event.waitUntil(runSync());
+});
+
+async function runSync() {
+    if (syncRunning) return; // The running sync picks up pendingAssets when done
+    syncRunning = true;
+    try {
+        while (pendingAssets) {
+            const assets = pendingAssets;
+            pendingAssets = null;
+            await syncAssets(assets);
+        }
+    } finally {
+        syncRunning = false;
+    }
+}
+
+async function syncAssets(assets) {
+    const cache = await caches.open(MEDIA_CACHE);
+    const wanted = new Set(assets.map(asset => asset.url));
+    let downloaded = 0;
+    let failed = 0;
+
+    // Evict first, so space is freed before new downloads start
+    for (const request of await cache.keys()) {
+        if (!wanted.has(request.url)) await cache.delete(request);
+    }
+
+    // One download at a time keeps the uplink usable for the playing video
+    for (const asset of assets) {
+        const version = String(asset.version || '');
+        const cached = await cache.match(asset.url, {ignoreVary: true});
+        if (cached && cached.headers.get(VERSION_HEADER) === version) continue;
+        try {
+            const response = await fetch(asset.url, {cache: 'no-store'});
+            if (response.status !== 200) throw new Error(`HTTP ${response.status}`);
+            const headers = new Headers(response.headers);
+            headers.set(VERSION_HEADER, version);
+            headers.delete('Vary');
+            await cache.put(asset.url, new Response(response.body, {status: 200, headers}));
+            downloaded++;
+        } catch (error) {
+            console.warn(`Offline cache: could not download ${asset.url}:`, error);
+            failed++;
+        }
+    }
+    await notifyClients({type: 'sync-done', assets: assets.length, downloaded, failed});
+}
+
+async function notifyClients(message) {
+    for (const client of await self.clients.matchAll({type: 'window'})) {
+        client.postMessage(message);
+    }
+}
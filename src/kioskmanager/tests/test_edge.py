@@ -0,0 +1,149 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from kioskmanager import edge_relay
+from kioskmanager.edge_relay import EdgeRelay
+from kioskmanager.matchers import build_matcher_index
+from kioskmanager.models import Browser, ContentItem, DisplayGroup, PlaylistEntry
+
+
+@override_settings(EDGE_TOKEN='edge-token', HEARTBEAT_FLUSH_INTERVAL=3600)
+class EdgeSyncViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = DisplayGroup.objects.create(name='branch')
+        item = ContentItem.objects.create(title='dashboard', content_type='website',
+                                          url='https://dashboard.example.com/', duration=30)
+        PlaylistEntry.objects.create(group=cls.group, content_item=item, order=0)
+        cls.browser = Browser.objects.create(group=cls.group)
+
+    def sync(self, body, token='edge-token'):
+        return self.client.post(reverse('edge_sync'), json.dumps(body), content_type='application/json',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    @override_settings(EDGE_TOKEN='')
+    def test_disabled_without_a_token(self):
+        self.assertEqual(self.sync({}).status_code, 404)
+
+    def test_requires_the_token(self):
+        self.assertEqual(self.sync({}, token='wrong').status_code, 403)
+
+    def test_rejects_malformed_requests(self):
+        self.assertEqual(self.sync({'browsers': ['not a uuid']}).status_code, 400)
+
+    def test_registers_browsers_and_sends_changed_snapshots(self):
+        new_browser = uuid.uuid4()
+        data = self.sync({'browsers': [str(self.browser.pk), str(new_browser)]}).json()
+        self.assertEqual(data['browsers'], {str(self.browser.pk): self.group.pk, str(new_browser): None})
+        self.assertTrue(Browser.objects.filter(pk=new_browser).exists())
+        snapshot = data['groups'][str(self.group.pk)]
+        self.assertEqual(snapshot['group_name'], 'branch')
+        self.assertEqual([item['url'] for item in snapshot['playlist']], ['https://dashboard.example.com/'])
+
+        # A relay holding the current version only gets the version
+        held = {str(self.group.pk): snapshot['version']}
+        data = self.sync({'browsers': [str(self.browser.pk)], 'groups': held}).json()
+        self.assertEqual(data['groups'], {str(self.group.pk): {'version': snapshot['version']}})
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class EdgeRelayTests(SimpleTestCase):
+    """The relay against a static file server standing in for the Kiosk Manager server."""
+
+    def setUp(self):
+        self.upstream_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upstream_dir)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=self.upstream_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.upstream = f'http://127.0.0.1:{server.server_port}'
+
+        self.relay = EdgeRelay()
+        self.relay.configure(self.upstream, 'edge-token', self.cache_dir)
+
+    def upstream_file(self, name, data):
+        path = os.path.join(self.upstream_dir, 'content', 'videos', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return {'type': 'video', 'url': f'{self.upstream}/content/videos/{name}', 'renditions': [],
+                'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data), 'script_keys': []}
+
+    def snapshot(self, version, *items):
+        return {'version': version, 'group_name': 'branch', 'show_status': True,
+                'playlist': list(items), 'scripts': {}, 'matcher': build_matcher_index(())}
+
+    def test_apply_keeps_held_snapshots_and_drops_unused_groups(self):
+        self.relay.browsers = {'a': 1, 'b': 2}
+        self.relay.snapshots = {'1': self.snapshot('v1'), '2': self.snapshot('v2')}
+        self.relay.seen = {'a', 'c'}
+        changed = self.relay._apply({
+            'browsers': {'b': 3, 'c': None},
+            'groups': {'1': {'version': 'v1'}, '3': self.snapshot('v3')},
+        }, sent={'a', 'c'})
+        self.assertTrue(changed)
+        self.assertEqual(self.relay.browsers, {'a': 1, 'b': 3, 'c': None})
+        self.assertEqual({group: s['version'] for group, s in self.relay.snapshots.items()}, {'1': 'v1', '3': 'v3'})
+        self.assertEqual(self.relay.seen, set())
+
+        # Unchanged data
+        self.assertFalse(self.relay._apply({'browsers': {'a': 1}, 'groups': {'1': {'version': 'v1'}}}, sent=set()))
+
+    def test_mirror_downloads_verifies_and_removes_files(self):
+        mirror = self.relay.mirror
+        good = self.upstream_file('good.mp4', b'video' * 1000)
+        bad = {**self.upstream_file('bad.mp4', b'tampered'), 'sha256': hashlib.sha256(b'original').hexdigest()}
+        mirror.want([self.snapshot('v1', good, bad)])
+        mirror.update()
+        self.assertEqual(set(mirror.files), {'/content/videos/good.mp4'})
+        with open(mirror.local_file('/content/videos/good.mp4'), 'rb') as f:
+            self.assertEqual(f.read(), b'video' * 1000)
+
+        mirror.want([self.snapshot('v2')])
+        mirror.update()
+        self.assertEqual(mirror.files, {})
+        self.assertFalse(os.path.exists(mirror.local_file('/content/videos/good.mp4')))
+
+    def test_poll_after_the_mirror_completed_returns_local_urls(self):
+        item = self.upstream_file('clip.mp4', b'clip' * 1000)
+        browser_id = str(uuid.uuid4())
+        self.relay.browsers = {browser_id: 1}
+        self.relay.snapshots = {'1': self.snapshot('v1', item)}
+        self.relay.mirror.want(self.relay.snapshots.values())
+
+        factory = RequestFactory()
+        with mock.patch.object(edge_relay, 'relay', self.relay):
+            response = edge_relay.playlist_api(factory.get('/api/playlist/', {'browser_id': browser_id}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)['playlist'][0]['url'], item['url'])
+            etag = response['ETag']
+
+            self.relay.mirror.update()
+            response = edge_relay.playlist_api(factory.get('/api/playlist/', {'browser_id': browser_id},
+                                                           headers={'If-None-Match': etag}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)['playlist'][0]['url'],
+                             'http://testserver/content/videos/clip.mp4')
+
+            response = edge_relay.playlist_api(factory.get('/api/playlist/', {'browser_id': browser_id},
+                                                           headers={'If-None-Match': response['ETag']}))
+            self.assertEqual(response.status_code, 304)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+
+from kioskmanager import media
+
+
+class TrackingFile:
+    """Counts the bytes read from the wrapped file."""
+
+    def __init__(self, f, counter):
+        self.f = f
+        self.counter = counter
+
+    def read(self, size=-1):
+        block = self.f.read(size)
+        self.counter.append(len(block))
+        return block
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+class ServeMediaASGITests(SimpleTestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='django')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        os.makedirs(os.path.join(self.media_root, 'content', 'videos'))
+        self.data = os.urandom(3 * media.STREAM_BLOCK)
+        with open(os.path.join(self.media_root, 'content', 'videos', 'clip.mp4'), 'wb') as f:
+            f.write(self.data)
+
+    def get(self, **headers):
+        reads = []
+        request = AsyncRequestFactory().get('/content/videos/clip.mp4', headers=headers)
+        with mock.patch.object(media, 'open', create=True,
+                               side_effect=lambda *args: TrackingFile(open(*args), reads)):
+            response = media.serve_media(request, 'videos/clip.mp4')
+            self.assertTrue(response.is_async)  # Not buffered with sync_to_async(list)
+
+            async def body():
+                return b''.join([block async for block in response])
+            return response, async_to_sync(body)(), reads
+
+    def test_range_request_reads_only_the_requested_bytes(self):
+        response, body, reads = self.get(Range='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.data)}')
+        self.assertEqual(body, self.data[1000:2000])
+        self.assertEqual(sum(reads), 1000)
+
+    def test_whole_file_is_streamed_in_blocks(self):
+        response, body, reads = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(reads, [media.STREAM_BLOCK] * 3)
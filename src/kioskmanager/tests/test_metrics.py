@@ -0,0 +1,16 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+class MetricsViewTests(TestCase):
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_not_served_without_a_token_in_production(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'kioskmanager_browsers_online', response.content)
@@ -0,0 +1,63 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from kioskmanager.models import AutomationScript, Browser, ContentItem, DisplayGroup, PlaylistEntry
+from kioskmanager.playlist import bump_group_versions, get_group_version
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)  # Keep heartbeat flushes out of the counts
+class PlaylistApiQueryCountTests(TestCase):
+    """The uncached playlist must cost the same number of queries for any playlist length."""
+
+    # Browser, group, playlist entries with their items, scripts, video renditions
+    QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.scripts = [
+            AutomationScript.objects.create(name=f'script-{s}', url_pattern=f'*://login{s}.example.com/*',
+                                            content='cy.wait(1);', order=s)
+            for s in range(2)
+        ]
+
+    def create_browser(self, length):
+        group = DisplayGroup.objects.create(name=f'group-{length}')
+        items = ContentItem.objects.bulk_create([
+            ContentItem(title=f'item-{i}', content_type='website', url=f'https://dashboard.example.com/{i}', duration=10)
+            for i in range(length)
+        ])
+        PlaylistEntry.objects.bulk_create([
+            PlaylistEntry(group=group, content_item=item, order=i) for i, item in enumerate(items)
+        ])
+        for script in self.scripts:
+            script.content_items.add(*items)
+        return Browser.objects.create(group=group)
+
+    def test_query_count_does_not_grow_with_the_playlist(self):
+        for length in (1, 10, 100):
+            with self.subTest(length=length):
+                browser = self.create_browser(length)
+                path = f"{reverse('get_playlist_api')}?browser_id={browser.pk}"
+                with self.captureOnCommitCallbacks(execute=True):
+                    bump_group_versions([browser.group_id])
+                with self.assertNumQueries(self.QUERIES):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['playlist']), length)
+
+
+class PlaylistInvalidationTests(TestCase):
+
+    def test_moving_an_entry_bumps_both_groups(self):
+        old_group, new_group = DisplayGroup.objects.create(name='old'), DisplayGroup.objects.create(name='new')
+        item = ContentItem.objects.create(title='dashboard', content_type='website',
+                                          url='https://dashboard.example.com/', duration=10)
+        PlaylistEntry.objects.create(group=old_group, content_item=item, order=0)
+        versions = {group.pk: get_group_version(group.pk) for group in (old_group, new_group)}
+
+        entry = PlaylistEntry.objects.get()
+        entry.group = new_group
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.save()
+        for group_id, version in versions.items():
+            self.assertNotEqual(get_group_version(group_id), version)
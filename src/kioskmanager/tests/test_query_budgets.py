@@ -0,0 +1,183 @@
+"""Query and wall-time budgets for the admin pages and the playlist API.
+
+The query counts must not depend on the fixture size, so every budget is
+checked against a fleet at two scales: an N+1 pattern changes the count
+between them.  The time budgets (milliseconds) are checked on the larger
+fleet; ``QUERY_BUDGET_TIME_FACTOR`` multiplies them on slow machines.
+"""
+import os
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from kioskmanager.models import AutomationScript, Browser, ContentItem, DisplayGroup, PlaylistEntry
+from kioskmanager.playlist import bump_group_versions
+
+# Fleet at scale 1; the large fleet is LARGE_SCALE times this
+GROUPS = 4
+ITEMS = 40
+PLAYLIST_LENGTH = 20
+BROWSERS = 100
+SCRIPTS = 5
+LARGE_SCALE = 5
+TIME_FACTOR = float(os.environ.get('QUERY_BUDGET_TIME_FACTOR', '1'))
+
+MANAGER_PERMISSIONS = [
+    'view_displaygroup', 'change_displaygroup',
+    'view_playlistentry', 'add_playlistentry', 'change_playlistentry', 'delete_playlistentry',
+    'view_contentitem', 'add_contentitem', 'change_contentitem',
+    'view_browser',
+]
+
+
+def seed_fleet(test_case, scale):
+    """Groups with long playlists, shared automation scripts and many browsers."""
+    items_count, playlist_length, browsers_count = ITEMS * scale, PLAYLIST_LENGTH * scale, BROWSERS * scale
+    User = get_user_model()
+    test_case.admin = User.objects.create_superuser('budget-admin', 'admin@example.com', 'budget')
+    test_case.manager = User.objects.create_user('budget-manager', 'manager@example.com', 'budget', is_staff=True)
+    test_case.manager.user_permissions.set(Permission.objects.filter(
+        content_type__app_label='kioskmanager', codename__in=MANAGER_PERMISSIONS))
+
+    groups = DisplayGroup.objects.bulk_create([DisplayGroup(name=f'group-{g}') for g in range(GROUPS)])
+    for group in groups[::2]:
+        group.managers.add(test_case.manager)
+    items = ContentItem.objects.bulk_create([
+        ContentItem(title=f'item-{i}', content_type='website', url=f'https://dashboard.example.com/{i}', duration=30)
+        for i in range(items_count)
+    ])
+    PlaylistEntry.objects.bulk_create([
+        PlaylistEntry(group=group, content_item=items[(g + o) % items_count], order=o)
+        for g, group in enumerate(groups) for o in range(playlist_length)
+    ])
+    scripts = AutomationScript.objects.bulk_create([
+        AutomationScript(name=f'script-{s}', url_pattern=f'*://login{s}.example.com/*', content='cy.wait(1);', order=s)
+        for s in range(SCRIPTS)
+    ])
+    # Every item gets a few scripts, every script is shared by many items
+    AutomationScript.content_items.through.objects.bulk_create([
+        AutomationScript.content_items.through(automationscript=scripts[(i + k) % SCRIPTS], contentitem=item)
+        for i, item in enumerate(items) for k in range(3)
+    ])
+    now = timezone.now()
+    Browser.objects.bulk_create([
+        Browser(identifier=uuid.uuid4(), name=f'browser-{b}', group=groups[b % GROUPS], last_seen=now)
+        for b in range(browsers_count)
+    ])
+
+    test_case.group = groups[0]  # Managed by the manager
+    test_case.item = test_case.group.playlist_entries.first().content_item
+    test_case.browser = Browser.objects.filter(group=test_case.group).first()
+    test_case.script = scripts[0]
+
+
+def admin_url(name, *args):
+    with translation.override('en'):  # The admin lives below a language prefix
+        return reverse(f'admin:kioskmanager_{name}', args=args)
+
+
+class QueryBudgets:
+    """Mixin for the budget tests; ``SCALE`` is the fleet size, ``TIMED`` checks the time budgets."""
+    SCALE = 1
+    TIMED = False
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(cls, cls.SCALE)
+
+    def assertBudget(self, queries, ms, get):
+        with self.assertNumQueries(queries):
+            started = time.perf_counter()
+            response = get()
+            elapsed = (time.perf_counter() - started) * 1000
+        if self.TIMED:
+            self.assertLessEqual(elapsed, ms * TIME_FACTOR, f"{response.request['PATH_INFO']} took {elapsed:.0f} ms")
+        return response
+
+
+class AdminQueryBudgets(QueryBudgets):
+
+    def assertPageBudget(self, user, url, queries, ms):
+        self.client.force_login(user)
+        self.client.get(url)  # Warm up per-process caches (content types, permissions)
+        response = self.assertBudget(queries, ms, lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_displaygroup_changelist(self):
+        url = admin_url('displaygroup_changelist')
+        self.assertPageBudget(self.admin, url, 5, 500)
+        self.assertPageBudget(self.manager, url, 7, 500)
+
+    def test_displaygroup_change(self):
+        url = admin_url('displaygroup_change', self.group.pk)
+        self.assertPageBudget(self.admin, url, 9, 2000)
+        self.assertPageBudget(self.manager, url, 12, 2000)
+
+    def test_contentitem_changelist(self):
+        url = admin_url('contentitem_changelist')
+        self.assertPageBudget(self.admin, url, 5, 1000)
+        self.assertPageBudget(self.manager, url, 7, 1000)
+
+    def test_contentitem_change(self):
+        url = admin_url('contentitem_change', self.item.pk)
+        self.assertPageBudget(self.admin, url, 11, 500)
+        self.assertPageBudget(self.manager, url, 7, 500)
+
+    def test_browser_changelist(self):
+        self.assertPageBudget(self.admin, admin_url('browser_changelist'), 5, 1000)
+
+    def test_browser_change(self):
+        self.assertPageBudget(self.admin, admin_url('browser_change', self.browser.pk), 6, 500)
+
+    def test_automationscript_changelist(self):
+        self.assertPageBudget(self.admin, admin_url('automationscript_changelist'), 5, 500)
+
+    def test_automationscript_change(self):
+        url = admin_url('automationscript_change', self.script.pk)
+        self.assertPageBudget(self.admin, url, 7, 500)
+
+
+class AdminQueryBudgetTests(AdminQueryBudgets, TestCase):
+    pass
+
+
+class LargeFleetAdminQueryBudgetTests(AdminQueryBudgets, TestCase):
+    SCALE = LARGE_SCALE
+    TIMED = True
+
+
+class PlaylistApiQueryBudgets(QueryBudgets):
+
+    def setUp(self):
+        self.url = f"{reverse('get_playlist_api')}?browser_id={self.browser.pk}"
+        self.etag = self.client.get(self.url)['ETag']
+
+    def test_cold(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_group_versions([self.group.pk])
+        response = self.assertBudget(5, 250, lambda: self.client.get(self.url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached(self):
+        response = self.assertBudget(1, 50, lambda: self.client.get(self.url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        response = self.assertBudget(1, 50, lambda: self.client.get(self.url, headers={'If-None-Match': self.etag}))
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)  # Keep heartbeat flushes out of the counts
+class PlaylistApiQueryBudgetTests(PlaylistApiQueryBudgets, TestCase):
+    pass
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+class LargeFleetPlaylistApiQueryBudgetTests(PlaylistApiQueryBudgets, TestCase):
+    SCALE = LARGE_SCALE
+    TIMED = True
@@ -0,0 +1,32 @@
+import uuid
+
+from django.test import TestCase
+from prometheus_client import REGISTRY
+
+from kioskmanager.models import Browser, DisplayGroup
+from kioskmanager.views import _register_browser
+
+
+class RegisterBrowserTests(TestCase):
+
+    def registrations(self):
+        return REGISTRY.get_sample_value('kioskmanager_browser_registrations_total') or 0
+
+    def test_new_browser_is_counted(self):
+        before = self.registrations()
+        browser_uuid = uuid.uuid4()
+        with self.assertLogs('kioskmanager.views', 'INFO'):
+            browser = _register_browser(browser_uuid)
+        self.assertIsNone(browser.group_id)
+        self.assertTrue(Browser.objects.filter(identifier=browser_uuid).exists())
+        self.assertEqual(self.registrations(), before + 1)
+
+    def test_existing_browser_is_not_counted(self):
+        # E.g. the second of two racing first polls
+        group = DisplayGroup.objects.create(name='lobby')
+        existing = Browser.objects.create(group=group)
+        before = self.registrations()
+        with self.assertNoLogs('kioskmanager.views', 'INFO'):
+            browser = _register_browser(existing.identifier)
+        self.assertEqual(browser.group_id, group.pk)
+        self.assertEqual(self.registrations(), before)
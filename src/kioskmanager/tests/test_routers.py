@@ -0,0 +1,77 @@
+import uuid
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from kioskmanager.heartbeat import HeartbeatBuffer
+from kioskmanager.models import Browser, DisplayGroup
+from kioskmanager.routers import (
+    REPLICA_DB_ALIAS, ReplicaRouter, RoutingState, _routing, replica_lag, replica_reads,
+)
+from kioskmanager.views import _register_browser
+
+
+class ReplicaTestMixin:
+    """Pretends a healthy replica is configured and runs each test inside a request."""
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (mock.patch('kioskmanager.routers.replica_configured', return_value=True),
+                        mock.patch.object(replica_lag, 'acceptable', return_value=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.state = RoutingState()
+        token = _routing.set(self.state)
+        self.addCleanup(_routing.reset, token)
+
+
+class PinningTests(ReplicaTestMixin, TestCase):
+
+    def test_user_writes_pin_to_the_primary(self):
+        DisplayGroup.objects.create(name='lobby')
+        self.assertTrue(self.state.wrote)
+
+    def test_registration_does_not_pin(self):
+        _register_browser(uuid.uuid4())
+        self.assertFalse(self.state.wrote)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_heartbeat_flush_does_not_pin(self):
+        browser = Browser.objects.create()
+        self.state.wrote = False
+        buffer = HeartbeatBuffer()
+        buffer.record(browser.pk)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertFalse(self.state.wrote)
+
+
+class ReplicaFallbackTests(ReplicaTestMixin, SimpleTestCase):
+
+    def test_failed_replica_read_is_retried_on_the_primary(self):
+        aliases = []
+
+        @replica_reads()
+        def read():
+            alias = ReplicaRouter().db_for_read(Browser)
+            aliases.append(alias)
+            if alias == REPLICA_DB_ALIAS:
+                raise OperationalError("replica went away")
+            return alias
+
+        with mock.patch.object(replica_lag, 'failed') as failed:
+            self.assertEqual(read(), 'default')
+        self.assertEqual(aliases, [REPLICA_DB_ALIAS, 'default'])
+        failed.assert_called_once()
+
+    def test_errors_of_the_primary_are_not_retried(self):
+        calls = []
+
+        @replica_reads()
+        def write():
+            calls.append(1)
+            raise OperationalError("primary went away")
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
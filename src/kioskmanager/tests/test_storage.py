@@ -0,0 +1,36 @@
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from kioskmanager.models import ContentItem
+from kioskmanager.storage import video_storage
+
+
+class VideoDeduplicationTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_video(self, title):
+        item = ContentItem(title=title, content_type='video')
+        item.video_file.save('clip.mp4', ContentFile(b'same bytes'), save=False)
+        item.save()
+        return item
+
+    def test_shared_blob_is_kept_until_the_last_reference_is_gone(self):
+        first, second = self.create_video('first'), self.create_video('second')
+        self.assertEqual(first.video_file.name, second.video_file.name)
+        name = first.video_file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(video_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(video_storage.exists(name))
@@ -0,0 +1,45 @@
+import asyncio
+
+from django.core.asgi import get_asgi_application
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from kioskmanager.models import Browser, DisplayGroup
+from kioskmanager.stream import CancelOnDisconnect, broadcaster
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600, PLAYLIST_STREAM_POLL_INTERVAL=0.05)
+class PlaylistStreamDisconnectTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = DisplayGroup.objects.create(name='lobby')
+        cls.browser = Browser.objects.create(group=cls.group)
+
+    async def test_disconnect_unsubscribes_the_stream(self):
+        path = reverse('playlist_stream_api')
+        application = CancelOnDisconnect(get_asgi_application(), path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': f'browser_id={self.browser.pk}'.encode(),
+            'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        }
+        messages = asyncio.Queue()
+        await messages.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        frames = []
+        playlist_sent = asyncio.Event()
+
+        async def send(message):
+            frames.append(message)
+            if b'event: playlist' in message.get('body', b''):
+                playlist_sent.set()
+
+        request = asyncio.ensure_future(application(scope, messages.get, send))
+        await asyncio.wait_for(playlist_sent.wait(), 5)
+        self.assertEqual(broadcaster._channels[self.group.pk].subscribers, 1)
+
+        await messages.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(request, 5)  # Returns instead of running until PLAYLIST_STREAM_MAX_AGE
+        channel = broadcaster._channels.get(self.group.pk)
+        self.assertEqual(channel.subscribers if channel else 0, 0)
@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from kioskmanager import transcode
+from kioskmanager.models import ContentItem, VideoRendition
+
+
+@override_settings(VIDEO_RENDITIONS=[(1080, 5000), (720, 2800), (480, 1200)], VIDEO_TRANSCODE_TIMEOUT=600)
+class TranscodeHeartbeatTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        item = ContentItem.objects.create(title='clip', content_type='website', url='https://example.com/', duration=10)
+        VideoRendition.objects.create(content_item=item, name='hls', kind=VideoRendition.KIND_HLS,
+                                      source_name='content/videos/clip.mp4')
+
+    def age(self, rendition, seconds):
+        VideoRendition.objects.filter(pk=rendition.pk).update(updated_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_multi_pass_job_is_not_reclaimed(self):
+        rendition = transcode.claim_next_rendition()
+        passes = []
+
+        def ffmpeg(args):
+            # No other worker may claim the job, although its passes together
+            # take longer than VIDEO_TRANSCODE_TIMEOUT
+            passes.append(transcode.claim_next_rendition())
+            VideoRendition.objects.filter(pk=rendition.pk).update(
+                updated_at=F('updated_at') - timedelta(seconds=settings.VIDEO_TRANSCODE_TIMEOUT))
+
+        with mock.patch.object(transcode, 'probe', return_value=(1920, 1080)), \
+                mock.patch.object(transcode, '_run', side_effect=ffmpeg):
+            self.assertEqual(transcode.process_rendition(rendition), VideoRendition.STATUS_DONE)
+        self.assertEqual(passes, [None, None, None])
+
+    def test_job_without_heartbeat_is_reclaimed(self):
+        rendition = transcode.claim_next_rendition()
+        self.age(rendition, settings.VIDEO_TRANSCODE_TIMEOUT + transcode.STALE_GRACE_SECONDS + 1)
+        self.assertEqual(transcode.claim_next_rendition(), rendition)
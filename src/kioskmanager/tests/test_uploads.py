@@ -0,0 +1,50 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from kioskmanager import uploads
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, UPLOAD_CHUNK_SIZE=1000,
+                                     UPLOAD_TEMP_DIR=os.path.join(self.media_root, 'content', '.uploads'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(get_user_model().objects.create_superuser('uploader', 'u@example.com', 'upload'))
+        self.data = os.urandom(3500)
+
+    def upload(self, between_chunks=None):
+        session = self.client.post(reverse('create_upload'), {'filename': 'clip.mp4', 'size': len(self.data)},
+                                   content_type='application/json').json()
+        url = reverse('upload_detail', args=[session['id']])
+        for start in range(0, len(self.data), 1000):
+            chunk = self.data[start:start + 1000]
+            response = self.client.put(url, chunk, content_type='application/octet-stream', headers={
+                'Content-Range': f'bytes {start}-{start + len(chunk) - 1}/{len(self.data)}',
+            })
+            self.assertEqual(response.status_code, 200)
+            if between_chunks:
+                between_chunks()
+        return self.client.post(reverse('complete_upload', args=[session['id']]))
+
+    def test_digest_is_computed_while_the_chunks_arrive(self):
+        with self.assertLogs('kioskmanager.uploads') as logs:
+            response = self.upload()
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.data).hexdigest())
+        self.assertFalse(any('on completion' in line for line in logs.output))
+
+    def test_file_is_hashed_on_completion_without_the_running_digest(self):
+        # E.g. the chunks were received by different worker processes
+        with self.assertLogs('kioskmanager.uploads') as logs:
+            response = self.upload(between_chunks=uploads._file_digests.clear)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.data).hexdigest())
+        self.assertTrue(any('on completion' in line for line in logs.output))
@@ -0,0 +1,274 @@
+"""Transcoding of uploaded videos into device-appropriate renditions.
+
+Uploading (or replacing) ``ContentItem.video_file`` enqueues one pending
+VideoRendition per entry of ``VIDEO_RENDITIONS`` (plus one HLS ladder if
+``VIDEO_HLS_ENABLED``).  The ``kiosk_transcode_worker`` management command
+claims pending renditions from the database and runs the local ffmpeg
+binary, so the admin request that saved the upload never waits for it.
+
+Renditions are written next to the uploads under ``content/renditions/``
+and advertised by the playlist API once done.
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'content/renditions'
+AUDIO_BITRATE = 128  # kbit/s
+HLS_SEGMENT_SECONDS = 6
+# A processing rendition is reclaimed once its heartbeat is this much older
+# than VIDEO_TRANSCODE_TIMEOUT, the limit of a single ffmpeg call
+STALE_GRACE_SECONDS = 5 * 60
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def enqueue_renditions(content_item):
+    """Create pending renditions for the current video file of a ContentItem.
+
+    Renditions of a previous video file are deleted (with their files).
+    Does nothing if the renditions of the current file already exist.
+    Since identical uploads share one file (see ``storage.py``), renditions
+    another ContentItem already has for the same file are reused.
+    """
+    from .models import VideoRendition
+
+    source = content_item.video_file.name if content_item.content_type == 'video' and content_item.video_file else ''
+    existing = content_item.renditions.all()
+    if not source or not settings.VIDEO_TRANSCODE_ENABLED:
+        for rendition in existing:
+            rendition.delete()
+        return []
+    if existing.filter(source_name=source).exists():
+        return []
+
+    for rendition in existing:
+        rendition.delete()
+    renditions = [
+        VideoRendition(content_item=content_item, name=f'{height}p', kind=VideoRendition.KIND_MP4,
+                       height=height, bitrate=bitrate, source_name=source)
+        for height, bitrate in settings.VIDEO_RENDITIONS
+    ]
+    if settings.VIDEO_HLS_ENABLED:
+        renditions.append(VideoRendition(content_item=content_item, name='hls', kind=VideoRendition.KIND_HLS,
+                                         source_name=source))
+    twins = {
+        (twin.name, twin.kind): twin
+        for twin in VideoRendition.objects.filter(source_name=source, status__in=(VideoRendition.STATUS_DONE,
+                                                                                  VideoRendition.STATUS_SKIPPED))
+    }
+    for rendition in renditions:
+        twin = twins.get((rendition.name, rendition.kind))
+        if twin is not None and twin.bitrate == rendition.bitrate:
+            for field in ('status', 'file', 'width', 'height', 'error'):
+                setattr(rendition, field, getattr(twin, field))
+    logger.info("Queued %d renditions of %s", len(renditions), source)
+    return VideoRendition.objects.bulk_create(renditions)
+
+
+def delete_rendition_files(rendition):
+    """Remove the output of a rendition (the whole directory of an HLS ladder).
+
+    Files shared with a rendition of another ContentItem are kept.
+    """
+    from .models import VideoRendition
+
+    if not rendition.file or VideoRendition.objects.filter(file=rendition.file.name).exclude(pk=rendition.pk).exists():
+        return
+    try:
+        path = default_storage.path(rendition.file.name)
+        if rendition.kind == rendition.KIND_HLS:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        try:
+            os.rmdir(os.path.dirname(os.path.dirname(path)) if rendition.kind == rendition.KIND_HLS
+                     else os.path.dirname(path))  # The item's directory, once empty
+        except OSError:
+            pass
+    except (OSError, NotImplementedError) as e:
+        logger.warning("Could not delete rendition file %s: %s", rendition.file.name, e)
+
+
+def claim_next_rendition():
+    """Mark the oldest pending rendition as processing and return it (or None).
+
+    ``skip_locked`` lets several workers share the queue.  The worker
+    refreshes ``updated_at`` before every ffmpeg call (see ``_heartbeat``), so
+    renditions whose heartbeat is older than one call may take (e.g. after a
+    worker crash) are picked up again, while long multi-pass jobs are not.
+    """
+    from .models import VideoRendition
+
+    stale = timezone.now() - timedelta(seconds=settings.VIDEO_TRANSCODE_TIMEOUT + STALE_GRACE_SECONDS)
+    with transaction.atomic():
+        rendition = VideoRendition.objects.select_for_update(skip_locked=True)\
+                                          .filter(Q(status=VideoRendition.STATUS_PENDING) |
+                                                  Q(status=VideoRendition.STATUS_PROCESSING, updated_at__lt=stale))\
+                                          .order_by('created_at', 'pk')\
+                                          .first()
+        if rendition is not None:
+            rendition.status = VideoRendition.STATUS_PROCESSING
+            rendition.save(update_fields=['status', 'updated_at'])
+    return rendition
+
+
+def process_rendition(rendition):
+    """Transcode a claimed rendition and record the result."""
+    from .models import VideoRendition
+    from .playlist import bump_group_versions
+    from .signals import groups_for_content_items
+
+    try:
+        source = default_storage.path(rendition.source_name)
+        width, height = probe(source)
+        if rendition.kind == VideoRendition.KIND_HLS:
+            result = transcode_hls(rendition, source, width, height)
+        elif rendition.height > height:
+            result = {'status': VideoRendition.STATUS_SKIPPED}
+        else:
+            result = transcode_mp4(rendition, source, width, height)
+    except Exception as e:
+        logger.error("Transcoding %s of %s failed: %s", rendition.name, rendition.source_name, e)
+        result = {'status': VideoRendition.STATUS_FAILED, 'error': str(e)[-2000:]}
+
+    # The rendition is gone if the video was replaced or deleted in the meantime
+    updated = VideoRendition.objects.filter(pk=rendition.pk, status=VideoRendition.STATUS_PROCESSING)\
+                                    .update(updated_at=timezone.now(), **result)
+    if not updated:
+        if result.get('file'):
+            delete_rendition_files(VideoRendition(kind=rendition.kind, file=result['file']))
+        return None
+    if result['status'] == VideoRendition.STATUS_DONE:
+        logger.info("Finished %s rendition of %s", rendition.name, rendition.source_name)
+        bump_group_versions(groups_for_content_items([rendition.content_item_id]))
+    return result['status']
+
+
+def _heartbeat(rendition):
+    """Mark a claimed rendition as still being processed before the next ffmpeg call."""
+    from .models import VideoRendition
+
+    alive = VideoRendition.objects.filter(pk=rendition.pk, status=VideoRendition.STATUS_PROCESSING)\
+                                  .update(updated_at=timezone.now())
+    if not alive:
+        raise TranscodeError("Rendition was deleted while transcoding.")
+
+
+def probe(path):
+    """Return ``(width, height)`` of the first video stream of a file."""
+    output = _run([
+        settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height', '-of', 'json', path,
+    ])
+    try:
+        stream = json.loads(output)['streams'][0]
+        return int(stream['width']), int(stream['height'])
+    except (ValueError, KeyError, IndexError):
+        raise TranscodeError(f"No video stream found in {path}")
+
+
+def scaled_width(width, height, target_height):
+    # H.264 needs even dimensions
+    return max(2, round(width * target_height / height / 2) * 2)
+
+
+def _output_path(rendition, name):
+    relative = f'{RENDITIONS_DIR}/{rendition.content_item_id}/{name}'
+    path = default_storage.path(relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return relative, path
+
+
+def _encoder_args(width, height, bitrate):
+    return [
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale={width}:{height}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'high', '-pix_fmt', 'yuv420p',
+        '-b:v', f'{bitrate}k', '-maxrate', f'{int(bitrate * 1.1)}k', '-bufsize', f'{bitrate * 2}k',
+        '-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE}k', '-ac', '2',
+    ]
+
+
+def transcode_mp4(rendition, source, width, height):
+    out_width = scaled_width(width, height, rendition.height)
+    relative, path = _output_path(rendition, f'{rendition.pk}-{rendition.name}.mp4')
+    partial = f'{path}.part'
+    try:
+        _heartbeat(rendition)
+        _run([
+            settings.FFMPEG_BINARY, '-nostdin', '-y', '-hide_banner', '-loglevel', 'error', '-i', source,
+            *_encoder_args(out_width, rendition.height, rendition.bitrate),
+            '-movflags', '+faststart', '-f', 'mp4', partial,
+        ])
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return {'status': rendition.STATUS_DONE, 'file': relative, 'width': out_width, 'error': ''}
+
+
+def transcode_hls(rendition, source, width, height):
+    """Build an HLS ladder of all configured renditions up to the source height."""
+    ladder = [(h, b) for h, b in settings.VIDEO_RENDITIONS if h <= height]
+    if not ladder:
+        ladder = [(height, min(b for _, b in settings.VIDEO_RENDITIONS))]
+
+    relative, master = _output_path(rendition, f'{rendition.pk}-hls/master.m3u8')
+    directory = os.path.dirname(master)
+    partial = f'{directory}.part'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    try:
+        variants = []
+        for variant_height, bitrate in sorted(ladder, reverse=True):
+            variant_width = scaled_width(width, height, variant_height)
+            name = f'{variant_height}p'
+            _heartbeat(rendition)  # Every pass may take up to VIDEO_TRANSCODE_TIMEOUT
+            _run([
+                settings.FFMPEG_BINARY, '-nostdin', '-y', '-hide_banner', '-loglevel', 'error', '-i', source,
+                *_encoder_args(variant_width, variant_height, bitrate),
+                # Same keyframe positions in every variant, so players can switch between them
+                '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})',
+                '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', os.path.join(partial, f'{name}_%04d.ts'),
+                os.path.join(partial, f'{name}.m3u8'),
+            ])
+            variants.append(
+                f'#EXT-X-STREAM-INF:BANDWIDTH={(bitrate + AUDIO_BITRATE) * 1000},'
+                f'RESOLUTION={variant_width}x{variant_height},CODECS="avc1.640028,mp4a.40.2"\n{name}.m3u8'
+            )
+        with open(os.path.join(partial, 'master.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-VERSION:3\n' + '\n'.join(variants) + '\n')
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(partial, directory)
+    finally:
+        shutil.rmtree(partial, ignore_errors=True)
+    top_height = max(h for h, _ in ladder)
+    return {'status': rendition.STATUS_DONE, 'file': relative, 'error': '',
+            'width': scaled_width(width, height, top_height), 'height': top_height}
+
+
+def _run(args):
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=settings.VIDEO_TRANSCODE_TIMEOUT)
+    except FileNotFoundError:
+        raise TranscodeError(f"{args[0]} not found. Install ffmpeg or set FFMPEG_BINARY/FFPROBE_BINARY.")
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f"{os.path.basename(args[0])} timed out after {settings.VIDEO_TRANSCODE_TIMEOUT}s")
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.strip() or f"{args[0]} exited with {result.returncode}")
+    return result.stdout
@@ -0,0 +1,208 @@
+"""Resumable, chunked uploads of video files.
+
+Used by the ContentItem admin form (``static/admin/js/chunked_upload.js``)
+instead of posting a multi-GB file in one request:
+
+* ``POST /api/uploads/`` with ``{"filename": ..., "size": ...}`` starts an
+  upload session.
+* ``GET /api/uploads/<id>/`` returns the acknowledged offset, where an
+  interrupted upload resumes.
+* ``PUT /api/uploads/<id>/`` with ``Content-Range: bytes <start>-<end>/<size>``
+  stores one chunk.  The chunk is streamed to disk and hashed on the way;
+  an optional ``X-Chunk-SHA256`` header is verified before the chunk is
+  acknowledged.
+* ``POST /api/uploads/<id>/complete/`` moves the file into the
+  content-addressed video storage (see ``storage.py``).  A video that
+  was uploaded before is stored only once.
+
+The sha256 of the whole file is computed while the chunks arrive, so
+completing a multi-GB upload does not read it again.  The running digest is
+kept in the memory of the worker process; only if the chunks of an upload
+were spread over several processes (or the process restarted) is the file
+hashed on completion.
+
+The admin form then only submits the session id (see ``ContentItemAdminForm``).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.views.decorators.http import require_http_methods
+
+from .models import ContentItem, UploadSession
+from .storage import delete_unreferenced_video
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Upload session id -> (offset, sha256 of the bytes before it), per process
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def can_upload(user):
+    return user.is_active and user.is_staff and (
+        user.has_perm('kioskmanager.add_contentitem') or user.has_perm('kioskmanager.change_contentitem'))
+
+
+def _error(message, status, session=None):
+    data = {'error': message}
+    if session is not None:
+        data['offset'] = session.received
+    return JsonResponse(data, status=status)
+
+
+def _session_data(session):
+    return {
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+        'complete': session.complete,
+        'name': session.file_name or None,
+        'sha256': session.sha256 or None,
+    }
+
+
+def expire_upload_sessions():
+    """Delete sessions older than ``UPLOAD_SESSION_MAX_AGE`` and their files.
+
+    Completed uploads that no ContentItem took over (e.g. the admin form was
+    never saved) are removed as well.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_MAX_AGE)
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff):
+        session.delete()  # The partial file is removed by a signal handler
+        _file_digests.pop(session.pk, None)
+        delete_unreferenced_video(session.file_name)
+
+
+@require_http_methods(['POST'])
+def create_upload(request):
+    if not can_upload(request.user):
+        return _error("Permission denied.", 403)
+    try:
+        data = json.loads(request.body)
+        filename, size = str(data['filename']), int(data['size'])
+    except (ValueError, KeyError, TypeError):
+        return _error("Expected JSON with 'filename' and 'size'.", 400)
+    if size <= 0 or size > settings.UPLOAD_MAX_SIZE:
+        return _error(f"Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.", 400)
+
+    expire_upload_sessions()
+    session = UploadSession.objects.create(user=request.user, filename=os.path.basename(filename)[:255], size=size)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    return JsonResponse(_session_data(session), status=201)
+
+
+@require_http_methods(['GET', 'PUT'])
+def upload_detail(request, upload_id):
+    if not can_upload(request.user):
+        return _error("Permission denied.", 403)
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return _error("Unknown upload.", 404)
+    if request.method == 'GET':
+        return JsonResponse(_session_data(session))
+    return _write_chunk(request, session)
+
+
+def _write_chunk(request, session):
+    if session.complete:
+        return _error("Upload is already complete.", 409, session)
+    match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return _error("Expected 'Content-Range: bytes <start>-<end>/<size>'.", 400)
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    if total != session.size or length <= 0 or end >= total or length > settings.UPLOAD_CHUNK_SIZE:
+        return _error("Invalid Content-Range.", 400)
+    if start != session.received:
+        # Resume from the last acknowledged chunk
+        return _error(f"Expected the chunk at offset {session.received}.", 409, session)
+
+    # Continue the digest of the file if this process saw all chunks before
+    with _file_digests_lock:
+        offset, file_digest = _file_digests.get(session.pk, (0, hashlib.sha256()))
+    file_digest = file_digest.copy() if offset == start else None
+
+    # Chunks are written at their offset, so a repeated chunk simply overwrites itself
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(session.temp_path, os.O_WRONLY | os.O_CREAT, 0o640)
+    with os.fdopen(fd, 'wb') as f:
+        f.seek(start)
+        while written < length:
+            data = request.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            digest.update(data)
+            if file_digest is not None:
+                file_digest.update(data)
+            written += len(data)
+    if written != length or request.read(1):
+        return _error(f"Chunk length does not match Content-Range ({written} bytes received).", 400, session)
+
+    expected = request.headers.get('X-Chunk-SHA256', '').lower()
+    if expected and expected != digest.hexdigest():
+        return _error("Chunk checksum mismatch.", 422, session)
+
+    # Only acknowledge if no concurrent request for the same chunk won
+    if UploadSession.objects.filter(pk=session.pk, received=start).update(received=end + 1, updated_at=timezone.now()):
+        session.received = end + 1
+        with _file_digests_lock:
+            if file_digest is not None:
+                _file_digests[session.pk] = (end + 1, file_digest)
+            else:
+                _file_digests.pop(session.pk, None)  # Hashed on completion
+    else:
+        session.refresh_from_db()
+    return JsonResponse(_session_data(session))
+
+
+@require_http_methods(['POST'])
+def complete_upload(request, upload_id):
+    if not can_upload(request.user):
+        return _error("Permission denied.", 403)
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return _error("Unknown upload.", 404)
+    if session.complete:
+        return JsonResponse(_session_data(session))
+    if session.received != session.size:
+        return _error(f"Upload is incomplete ({session.received} of {session.size} bytes).", 409, session)
+
+    path = session.temp_path
+    with _file_digests_lock:
+        offset, digest = _file_digests.pop(session.pk, (0, None))
+    with open(path, 'r+b') as f:
+        f.truncate(session.size)  # Drop bytes of rejected chunks beyond the end
+        if offset != session.size:
+            # The chunks were not all received by this process
+            logger.info("Hashing upload %s (%d bytes) on completion.", session.pk, session.size)
+            digest = hashlib.sha256()
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+    storage = ContentItem._meta.get_field('video_file').storage
+    extension = os.path.splitext(get_valid_filename(session.filename))[1]
+    with transaction.atomic():
+        name = storage.adopt(path, digest.hexdigest(), extension)
+        session.file_name = name
+        session.sha256 = digest.hexdigest()
+        session.save(update_fields=['file_name', 'sha256', 'updated_at'])
+    logger.info("Upload %s complete: %s (%d bytes)", session.pk, name, session.size)
+    return JsonResponse(_session_data(session))
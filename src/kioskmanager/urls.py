@@ -15,12 +15,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from django.shortcuts import redirect
 from django.conf.urls.i18n import i18n_patterns
-from . import views
+from . import edge, health, media, metrics, uploads, views
 
 admin.site.site_header = "Kiosk Manager Admin"
 admin.site.site_title = "Kiosk Manager Admin Portal"
@@ -28,12 +27,25 @@ admin.site.index_title = "Welcome to Kiosk Manager Portal"
 
 urlpatterns = [
     path('play/', views.video_player_view, name='video_player'),
-    path('api/playlist/', views.get_playlist_api, name='get_playlist_api'),
+    path('play/sw.js', views.player_service_worker_view, name='player_service_worker'),
+    path('api/playlist/', views.get_playlist_api_async if settings.PLAYLIST_API_ASYNC else views.get_playlist_api,
+         name='get_playlist_api'),
+    path('api/playlist/stream/', views.playlist_stream_api, name='playlist_stream_api'),
+    path('api/edge/sync/', edge.edge_sync_view, name='edge_sync'),
+    path('api/uploads/', uploads.create_upload, name='create_upload'),
+    path('api/uploads/<uuid:upload_id>/', uploads.upload_detail, name='upload_detail'),
+    path('api/uploads/<uuid:upload_id>/complete/', uploads.complete_upload, name='complete_upload'),
     # Optional: redirect root URL to the player
     path('', lambda request: redirect('admin/', permanent=False)),
     path('favicon.ico', lambda _ : redirect('static/img/kioskmanager.ico', permanent=True)),
     path("i18n/", include("django.conf.urls.i18n")),
     path('healthz/', include('health_check.urls')),
+    # Cheap probes for Kubernetes (see health.py)
+    path('livez/', health.livez, name='livez'),
+    path('readyz/', health.readyz, name='readyz'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    # Uploaded media (MEDIA_URL); in production nginx sends the bytes via X-Accel-Redirect
+    path('content/<path:path>', media.serve_media, name='serve_media'),
 ]
 
 if settings.OIDC_ENABLED:
@@ -41,4 +53,4 @@ if settings.OIDC_ENABLED:
 
 urlpatterns += i18n_patterns(
         path("admin/", admin.site.urls),
-    ) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    )
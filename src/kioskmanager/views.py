@@ -1,90 +1,268 @@
 # player/views.py
+from functools import partial
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponseBadRequest, Http404
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.utils.http import parse_etags
 from django.utils import timezone
-from django.db import transaction
-from .models import Browser, DisplayGroup, PlaylistEntry, ContentItem, AutomationScript
+from django.db import connections, router
+from .models import Browser
+from .heartbeat import heartbeats
+from .metrics import REGISTRATIONS, instrument_playlist_api
+from .routers import replica_reads, unpinned_writes
+from .playlist import (
+    EMPTY_PLAYLIST, PAYLOAD_FORMATS, aget_group_version, aget_playlist_snapshot, get_group_version,
+    get_playlist_snapshot, playlist_payload,
+)
+from .stream import playlist_events
+import logging
 import uuid # Ensure uuid is imported
 
-@transaction.atomic # Ensure browser update/creation is atomic
-def get_playlist_api(request):
+logger = logging.getLogger(__name__)
+
+
+def _parse_browser_id(request):
+    """Return ``(browser_uuid, None)`` or ``(None, error_response)``."""
     browser_id_str = request.GET.get('browser_id')
     if not browser_id_str:
-        return HttpResponseBadRequest("Missing 'browser_id' parameter.")
+        return None, HttpResponseBadRequest("Missing 'browser_id' parameter.")
 
     try:
         # Validate and convert the browser ID string to UUID
-        browser_uuid = uuid.UUID(browser_id_str)
+        return uuid.UUID(browser_id_str), None
     except ValueError:
-        return HttpResponseBadRequest("Invalid 'browser_id' format. Must be a UUID.")
+        return None, HttpResponseBadRequest("Invalid 'browser_id' format. Must be a UUID.")
 
-    # Find or create the browser entry, update last_seen timestamp
-    browser, created = Browser.objects.select_related('group').get_or_create(
-        identifier=browser_uuid,
-        defaults={'last_seen': timezone.now()} # Set initial last_seen on creation
-    )
 
-    if not created:
-        # Update last_seen efficiently only if it's been a while (e.g., > 1 minute)
-        # to reduce database writes if requests are very frequent.
-        if timezone.now() - browser.last_seen > timezone.timedelta(minutes=1):
-            browser.last_seen = timezone.now()
-            browser.save(update_fields=['last_seen'])
-    elif created:
-         print(f"Registered new browser: {browser_uuid}") # Log registration
-
-    playlist_items = []
-    group_name = None
-    if browser.group:
-        group_name = browser.group.name
-        # Fetch ordered playlist entries for the browser's group
-        # Select related content_item to avoid N+1 queries
-        entries = PlaylistEntry.objects.filter(group=browser.group)\
-                                       .order_by('order')\
-                                       .select_related('content_item')
-
-        for entry in entries:
-            item = entry.content_item
-            data = {
-                'id': item.id,
-                'title': item.title,
-                'type': item.content_type,
-            }
-            if item.content_type == 'video' and item.video_file:
-                try:
-                    data['url'] = request.build_absolute_uri(item.video_file.url)
-                except ValueError:
-                    print(f"Warning: Could not build URL for video file: {item.video_file}")
-                    continue
-            elif item.content_type == 'website' and item.url and item.duration:
-                data['url'] = item.url
-                data['duration'] = item.duration
-            else:
-                print(f"Warning: Skipping invalid playlist item: ID={item.id}")
-                continue
-
-            # Automation scripts linked to this content item (M2M)
-            item_scripts = AutomationScript.objects.filter(
-                content_items=item,
-                enabled=True,
-            ).order_by('order', 'name')
-            data['scripts'] = [
-                {'name': s.name, 'url_pattern': s.url_pattern or '', 'content': s.content}
-                for s in item_scripts
-            ]
-
-            playlist_items.append(data)
-
-    return JsonResponse({
+def _parse_payload_format(request):
+    """Return ``(payload_format, known_script_keys, None)`` or ``(None, None, error_response)``.
+
+    ``?format=2`` selects the normalized payload; its clients list the script
+    keys they already store in the ``X-Kiosk-Known-Scripts`` header.
+    """
+    try:
+        payload_format = int(request.GET.get('format', 1))
+    except ValueError:
+        payload_format = None
+    if payload_format not in PAYLOAD_FORMATS:
+        return None, None, HttpResponseBadRequest("Invalid 'format' parameter.")
+    known = request.headers.get('X-Kiosk-Known-Scripts', '')
+    return payload_format, {key.strip() for key in known.split(',') if key.strip()}, None
+
+
+@unpinned_writes()  # A kiosk's own registration must not pin it to the primary
+def _register_browser(browser_uuid):
+    """Register a browser (or touch it, if it exists) in a single statement.
+
+    ``INSERT ... ON CONFLICT (identifier) DO UPDATE ... RETURNING group_id``
+    is race-free when several first polls of the same UUID arrive at once,
+    e.g. when a whole site reconnects after a network outage; ``xmax = 0``
+    tells whether the row was inserted.  SQLite >= 3.35 has no ``xmax``: it
+    inserts with ``DO NOTHING`` and reads the existing row if that lost the
+    race.  Other backends use get_or_create.  Only actual inserts count as
+    registrations.
+    """
+    now = timezone.now()
+    connection = connections[router.db_for_write(Browser)]
+    if connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)):
+        qn = connection.ops.quote_name
+        opts = Browser._meta
+        identifier = opts.get_field('identifier')
+        last_seen = opts.get_field('last_seen')
+        group = opts.get_field('group')
+        if connection.vendor == 'postgresql':
+            on_conflict = f"DO UPDATE SET {qn(last_seen.column)} = EXCLUDED.{qn(last_seen.column)}"
+            returning = f"{qn(group.column)}, (xmax = 0)"
+        else:
+            on_conflict, returning = "DO NOTHING", f"{qn(group.column)}, 1"
+        sql = (
+            f"INSERT INTO {qn(opts.db_table)} ({qn(identifier.column)}, {qn(last_seen.column)}) "
+            f"VALUES (%s, %s) ON CONFLICT ({qn(identifier.column)}) {on_conflict} RETURNING {returning}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                identifier.get_db_prep_value(browser_uuid, connection),
+                last_seen.get_db_prep_value(now, connection),
+            ])
+            row = cursor.fetchone()
+        if row is None:
+            # SQLite: another poll registered the browser first
+            group_id = Browser.objects.filter(identifier=browser_uuid).values_list('group_id', flat=True).first()
+            created = False
+            heartbeats.record(browser_uuid, now)
+        else:
+            group_id, created = row[0], bool(row[1])
+        browser = Browser(identifier=browser_uuid, group_id=group_id, last_seen=now)
+    else:
+        browser, created = Browser.objects.get_or_create(identifier=browser_uuid, defaults={'last_seen': now})
+
+    if created:
+        REGISTRATIONS.inc()
+        logger.info("Registered new browser: %s", browser_uuid)
+    return browser
+
+
+def _touch_browser(browser_uuid):
+    """Find or register the browser and record a heartbeat.
+
+    Known browsers cost one read; their ``last_seen`` updates are buffered
+    and flushed in batches (see ``heartbeat.py``), so a regular poll runs
+    without a write transaction.  Unknown browsers are registered with a
+    single upsert.
+    """
+    browser = Browser.objects.only('identifier', 'group_id').filter(identifier=browser_uuid).first()
+    if browser is None:
+        return _register_browser(browser_uuid)
+
+    heartbeats.record(browser_uuid)
+    return browser
+
+
+async def _atouch_browser(browser_uuid):
+    """Async ``_touch_browser()``."""
+    browser = await Browser.objects.only('identifier', 'group_id').filter(identifier=browser_uuid).afirst()
+    if browser is None:
+        return await sync_to_async(_register_browser)(browser_uuid)
+
+    await heartbeats.arecord(browser_uuid)
+    return browser
+
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _playlist_response(browser, snapshot, payload_format, known_scripts):
+    data = {
         'browser_id': str(browser.identifier),
-        'group_name': group_name,
-        'playlist': playlist_items,
-        'show_status': browser.group.show_status if browser.group else True,
-    })
+        'format': payload_format,
+        'group_name': snapshot['group_name'] if snapshot else None,
+        'show_status': snapshot['show_status'] if snapshot else True,
+    }
+    data.update(playlist_payload(snapshot or EMPTY_PLAYLIST, payload_format, known_scripts))
+    response = JsonResponse(data)
+    # Label the response with the version it was actually built from
+    if snapshot:
+        response['ETag'] = playlist_etag(browser.group_id, snapshot['version'], payload_format)
+    else:
+        response['ETag'] = playlist_etag(None, payload_format=payload_format)
+    response['Cache-Control'] = 'no-cache'  # Always revalidate, never reuse blindly
+    return response
+
+
+@instrument_playlist_api
+@replica_reads()
+def get_playlist_api(request):
+    browser_uuid, error = _parse_browser_id(request)
+    if error:
+        return error
+
+    payload_format, known_scripts, error = _parse_payload_format(request)
+    if error:
+        return error
+
+    browser = _touch_browser(browser_uuid)
+
+    # The payload only depends on the group and its playlist version, so a
+    # matching If-None-Match can be answered without touching the playlist.
+    etag = playlist_etag(browser.group_id, payload_format=payload_format)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return _not_modified(etag)
+
+    snapshot = None
+    if browser.group_id:
+        # Every browser in a group gets the same playlist – serve the cached snapshot
+        snapshot = get_playlist_snapshot(browser.group_id, request)
+    return _playlist_response(browser, snapshot, payload_format, known_scripts)
+
+
+@instrument_playlist_api
+@replica_reads()
+async def get_playlist_api_async(request):
+    """Async ``get_playlist_api`` for ASGI servers (``PLAYLIST_API_ASYNC``).
+
+    Uses the async ORM and cache API, so a poll waiting for the database or
+    the cache costs a coroutine instead of a worker.
+    """
+    browser_uuid, error = _parse_browser_id(request)
+    if error:
+        return error
+
+    payload_format, known_scripts, error = _parse_payload_format(request)
+    if error:
+        return error
+
+    browser = await _atouch_browser(browser_uuid)
+
+    version = await aget_group_version(browser.group_id) if browser.group_id else None
+    etag = playlist_etag(browser.group_id, version, payload_format)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return _not_modified(etag)
+
+    snapshot = None
+    if browser.group_id:
+        snapshot = await aget_playlist_snapshot(browser.group_id, request, version)
+    return _playlist_response(browser, snapshot, payload_format, known_scripts)
+
+
+def playlist_etag(group_id, version=None, payload_format=1):
+    """Strong ETag of the playlist payload for a browser in ``group_id``."""
+    suffix = '' if payload_format == 1 else f'-v{payload_format}'
+    if not group_id:
+        return f'"none{suffix}"'
+    return f'"{group_id}-{version or get_group_version(group_id)}{suffix}"'
+
+
+async def playlist_stream_api(request):
+    """Push the playlist to a browser whenever its group's playlist changes (SSE).
+
+    Requires the ASGI entry point; under WSGI the stream would block a worker,
+    so clients get a 501 and keep polling ``get_playlist_api``.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Streaming requires the ASGI server.", status=501)
+
+    browser_uuid, error = _parse_browser_id(request)
+    if error:
+        return error
+    payload_format, known_scripts, error = _parse_payload_format(request)
+    if error:
+        return error
+
+    # One lookup per subscription; pushed changes are served from the group snapshot
+    browser = await _atouch_browser(browser_uuid)
+    last_etag = request.headers.get('Last-Event-ID') or request.headers.get('If-None-Match')
+
+    response = StreamingHttpResponse(
+        playlist_events(request, str(browser.identifier), browser.group_id, last_etag,
+                        partial(playlist_etag, payload_format=payload_format), payload_format, known_scripts),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the event stream
+    return response
 
 
 # Player view remains simple - just serves the HTML template
 def video_player_view(request):
-    response = render(request, 'kioskmanager/player.html')
+    player_config = {
+        'preloadLeadSeconds': settings.PLAYER_PRELOAD_LEAD_SECONDS,
+        'preloadMaxBytes': settings.PLAYER_PRELOAD_MAX_MB * 1024 * 1024,
+        'preloadWebsites': settings.PLAYER_PRELOAD_WEBSITES,
+    }
+    response = render(request, 'kioskmanager/player.html', {'player_config': player_config})
     response['Cross-Origin-Opener-Policy'] = 'same-origin-allow-popups'
+    return response
+
+
+def player_service_worker_view(request):
+    # Served below /play/ so the worker may control the player page
+    response = render(request, 'kioskmanager/player_sw.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
     return response
\ No newline at end of file